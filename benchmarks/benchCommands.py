@@ -0,0 +1,120 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: benchCommands.py
+    Description: Benchmark of commands per second sent to a device that
+                 answers "OK" to every line, through a pseudo terminal.
+                 * direct: write and blocking readline() from the caller
+                   thread, how Micro.ping() used to work.
+                 * request: ThreadSerialDev.request(), one at a time, the
+                   command is queued to the I/O thread and the response
+                   handed back through a future.
+                 * pipelined: requests with up to WINDOW of them in flight.
+                 * queued: commands sent back to back with write(), responses
+                   counted as the I/O thread reads them.
+
+                 Usage: python benchmarks/benchCommands.py [commands]
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import serial
+from PyQt5.QtCore import Qt
+from serialDev import ThreadSerialDev
+
+BAUD_RATE = 115200
+DEFAULT_COMMANDS = 2000
+WINDOW = 16
+
+def startDevice():
+    """ Start a fake device answering OK to each line on a pseudo terminal,
+        returns the port name and a function to stop it.
+    """
+    masterFd, slaveFd = os.openpty()
+    stopped = False
+    def answer():
+        pending = b''
+        while not stopped:
+            try:
+                pending += os.read(masterFd, 4096)
+            except OSError:
+                return
+            count = pending.count(b'\n')
+            if count:
+                pending = pending[pending.rfind(b'\n') + 1:]
+                os.write(masterFd, b'OK\n' * count)
+    thread = threading.Thread(target = answer, daemon = True)
+    thread.start()
+    def stop():
+        nonlocal stopped
+        stopped = True
+        os.close(slaveFd)
+        os.close(masterFd)
+    return (os.ttyname(slaveFd), stop)
+
+def benchDirect(portName, numCommands):
+    dev = serial.Serial(portName, BAUD_RATE, timeout = 1)
+    start = time.perf_counter()
+    for i in range(numCommands):
+        dev.write(b'ping\n')
+        dev.timeout = 1
+        if dev.readline().strip() != b'OK':
+            raise Exception("Unexpected response")
+    elapsed = time.perf_counter() - start
+    dev.close()
+    return numCommands / elapsed
+
+def benchRequest(portName, numCommands):
+    dev = ThreadSerialDev()
+    dev.open(portName, BAUD_RATE, 8, 'None', 1)
+    start = time.perf_counter()
+    for i in range(numCommands):
+        if dev.request('ping\n').result() != ['OK']:
+            raise Exception("Unexpected response")
+    elapsed = time.perf_counter() - start
+    dev.close()
+    return numCommands / elapsed
+
+def benchPipelined(portName, numCommands):
+    dev = ThreadSerialDev()
+    dev.setPipelineWindow(WINDOW)
+    dev.open(portName, BAUD_RATE, 8, 'None', 1)
+    start = time.perf_counter()
+    futures = [dev.request('ping\n') for i in range(numCommands)]
+    for future in futures:
+        if future.result() != ['OK']:
+            raise Exception("Unexpected response")
+    elapsed = time.perf_counter() - start
+    dev.close()
+    return numCommands / elapsed
+
+def benchQueued(portName, numCommands):
+    dev = ThreadSerialDev()
+    received = 0
+    def countLines(lines, stamps, kinds):
+        nonlocal received
+        received += len(lines)
+    dev.signalLinesRead.connect(countLines, Qt.ConnectionType.DirectConnection)
+    dev.open(portName, BAUD_RATE, 8, 'None', 1)
+    start = time.perf_counter()
+    for i in range(numCommands):
+        dev.write('ping\n')
+    while received < numCommands:
+        time.sleep(0.0005)
+    elapsed = time.perf_counter() - start
+    dev.close()
+    return numCommands / elapsed
+
+if __name__ == '__main__':
+    numCommands = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_COMMANDS
+    for name, bench in (('direct', benchDirect), ('request', benchRequest),
+                        ('pipelined', benchPipelined), ('queued', benchQueued)):
+        portName, stop = startDevice()
+        rate = bench(portName, numCommands)
+        stop()
+        print(f'{name:>9}: {rate:>9.0f} commands/s')
@@ -0,0 +1,146 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: benchDispatch.py
+    Description: Benchmark of the dispatch of the lines read on the GUI
+                 thread. BoardSession.callbackMicroReadLines, which classifies
+                 the bytes of each line, is compared with the path used before
+                 it: every line decoded by Micro.slotLinesRead, then searched
+                 for "pwm:" and split to parse the sample. Both are fed the
+                 same batches, their samples and log text are checked to match
+                 and the time per line is reported.
+
+                 Usage: python benchmarks/benchDispatch.py [lines]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from boardSession import BoardSession
+
+DEFAULT_LINES = 200000
+BATCH_LINES = 1000
+RESPONSE = [b'Version: 1.0\r\n', b'Ticks: 123456\r\n', b'OK\r\n']
+
+class Timer():
+    """ The plot timer of the GUI, always running """
+
+    def isActive(self):
+        return True
+
+class Recorder():
+    """ Session recorder that drops the lines """
+
+    def recordLines(self, direction, lines, stamps):
+        pass
+
+    def record(self, direction, text, stamp = None):
+        pass
+
+class Gui():
+    plotTimer = Timer()
+    sessionLog = Recorder()
+
+    def startPlotTimer(self):
+        pass
+
+class Session():
+    """ The attributes of a BoardSession used by the dispatch, the log text
+        and the samples are kept to compare both paths.
+    """
+    callbackMicroReadLines = BoardSession.callbackMicroReadLines
+    queueSamples = BoardSession.queueSamples
+
+    def __init__(self):
+        self.gui = Gui()
+        self.portName = None
+        self.plotQueue = []
+        self.oldDigit = 0
+        self.log = []
+
+    def record(self, direction):
+        return direction
+
+    def writeToLog(self, text, color = 'white', kind = None):
+        self.log.append((text, kind))
+
+class LegacySession(Session):
+    """ The dispatch of lines decoded to str used before """
+
+    def slotLinesRead(self, lines, stamps, kinds):
+        linesDecoded = [line.decode('utf-8', 'replace') for line in lines]
+        self.callbackStrLines(linesDecoded, stamps, kinds)
+
+    def processPwmSample(self, data, stamp):
+        digit = int(data.split(':')[-1].strip())
+        if not self.gui.plotTimer.isActive():
+            self.gui.startPlotTimer()
+        if digit != self.oldDigit:
+            self.plotQueue.append((stamp, digit))
+            self.oldDigit = digit
+
+    def callbackStrLines(self, lines, stamps, kinds):
+        logText = []
+        logKind = None
+        for data, stamp, kind in zip(lines, stamps, kinds):
+            if "pwm:" in data:
+                self.processPwmSample(data, stamp)
+            elif not data.strip() == "OK":
+                kind = kind or 'rx'
+                if kind != logKind and logText:
+                    self.writeToLog(''.join(logText), kind = logKind)
+                    logText = []
+                logKind = kind
+                logText.append(data)
+        if logText:
+            self.writeToLog(''.join(logText), kind = logKind)
+        self.gui.sessionLog.recordLines(self.record('rx'), lines, stamps)
+
+def makeBatches(numLines, textFraction, seed = 1):
+    """ Return batches of (lines, stamps, kinds): PWM samples at a level for
+        a few samples each, with command responses mixed in
+    """
+    rng = random.Random(seed)
+    lines = []
+    kinds = []
+    level = 0
+    while len(lines) < numLines:
+        if rng.random() < textFraction:
+            lines += RESPONSE
+            kinds += ['version', 'version', 'version']
+            continue
+        level ^= 1
+        run = rng.randint(1, 8)
+        lines += [b'pwm:1\r\n' if level else b'pwm:0\r\n'] * run
+        kinds += [None] * run
+    # New bytes objects for every line, as split by the serial reader
+    lines = [line + b'\n' for line in b''.join(lines[:numLines]).split(b'\n')[:-1]]
+    stamps = [i * 1e-4 for i in range(numLines)]
+    return [(lines[i:i + BATCH_LINES], stamps[i:i + BATCH_LINES], kinds[i:i + BATCH_LINES])
+            for i in range(0, numLines, BATCH_LINES)]
+
+def timeDispatch(session, dispatch, batches):
+    """ Return the seconds per line of a dispatch function """
+    numLines = sum(len(batch[0]) for batch in batches)
+    start = time.perf_counter()
+    for lines, stamps, kinds in batches:
+        dispatch(session, lines, stamps, kinds)
+    return (time.perf_counter() - start) / numLines
+
+if __name__ == '__main__':
+    numLines = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LINES
+    print(f'{"Workload":>10}  {"Before":>10}  {"After":>10}  Speedup')
+    for name, textFraction in (('monitor', 0), ('mixed', 0.05), ('text', 1)):
+        batches = makeBatches(numLines, textFraction)
+        legacy = LegacySession()
+        session = Session()
+        before = timeDispatch(legacy, LegacySession.slotLinesRead, batches)
+        after = timeDispatch(session, Session.callbackMicroReadLines, batches)
+        if legacy.plotQueue != session.plotQueue or legacy.log != session.log:
+            raise Exception(f'{name}: the dispatch paths do not match')
+        print(f'{name:>10}  {before * 1e9:>7.0f} ns  {after * 1e9:>7.0f} ns  '
+              f'{before / after:>6.1f}x')
@@ -0,0 +1,272 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: benchPipeline.py
+    Description: Headless end to end benchmark of the GUI data path, serial
+                 read -> decode -> dispatch -> plot/log, against the firmware
+                 simulator. Each stage is timed while a fixed set of
+                 workloads runs and the results are written as JSON so
+                 versions can be compared.
+
+                 Workloads:
+                    idle:        connected, no traffic
+                    interactive: a few commands per second
+                    monitor1k:   PWM monitor at 1000 samples per second
+                    monitorMax:  PWM monitor as fast as the simulator goes
+
+                 Usage: python benchmarks/benchPipeline.py [--duration S]
+                        [--output FILE] [--workloads NAME ...]
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+# Headless Qt, must be set before the application is created
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+ROOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT_PATH, 'src'))
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import Qt, QTimer
+
+BAUD_RATE = 230400
+DEFAULT_DURATION = 5
+INTERACTIVE_CMDS = ['version\n', 'ticks\n', 'gpio-r a 5\n', 'heap\n', 'rtc-g\n']
+INTERACTIVE_RATE = 10 # Commands per second
+
+workloads = {
+             'idle': {'monitorRate': None, 'commandRate': 0},
+             'interactive': {'monitorRate': None, 'commandRate': INTERACTIVE_RATE},
+             'monitor1k': {'monitorRate': 1000, 'pwmFreq': 10, 'commandRate': 0},
+             'monitorMax': {'monitorRate': 1000000, 'pwmFreq': 1000, 'commandRate': 0},
+            }
+
+def summarize(values):
+    """ Return count, mean, p50, p95 and max of a list of numbers """
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+    n = len(values)
+    return {
+            'count': n,
+            'mean': sum(values) / n,
+            'p50': values[n // 2],
+            'p95': values[min(n - 1, int(n * 0.95))],
+            'max': values[-1],
+           }
+
+class Stage():
+    """ Time every call to a method of a class. itemsOf returns the number
+        of items (lines, samples, characters) handled by a call and stampsOf
+        the acquisition time of the oldest one to measure latency.
+    """
+
+    def __init__(self, name, cls, methodName, itemsOf = None, stampsOf = None):
+        self.name = name
+        self.itemsOf = itemsOf
+        self.stampsOf = stampsOf
+        self.reset()
+        method = getattr(cls, methodName)
+        stage = self
+        def timedMethod(*args, **kwargs):
+            start = time.perf_counter()
+            result = method(*args, **kwargs)
+            stage.record(time.perf_counter() - start, args)
+            return result
+        setattr(cls, methodName, timedMethod)
+
+    def reset(self):
+        self.durations = []
+        self.latencies = []
+        self.items = 0
+
+    def record(self, duration, args):
+        self.durations.append(duration)
+        if self.itemsOf is not None:
+            self.items += self.itemsOf(args)
+        if self.stampsOf is not None:
+            stamp = self.stampsOf(args)
+            if stamp is not None:
+                self.latencies.append(time.monotonic() - stamp)
+
+    def result(self, elapsed):
+        busy = sum(self.durations)
+        result = {
+                  'calls': len(self.durations),
+                  'busyFraction': busy / elapsed,
+                  'callTime': summarize(self.durations),
+                 }
+        if self.itemsOf is not None:
+            result['items'] = self.items
+            result['itemsPerSecond'] = self.items / elapsed
+            result['timePerItem'] = busy / self.items if self.items else None
+        if self.stampsOf is not None:
+            result['latency'] = summarize(self.latencies)
+        return result
+
+class ReaderStage():
+    """ Lines emitted by the serial I/O thread, counted in that thread """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.lines = 0
+        self.batches = 0
+        self.latencies = []
+
+    def onLines(self, lines, stamps, kinds):
+        self.lines += len(lines)
+        self.batches += 1
+        self.latencies.append(time.monotonic() - stamps[0])
+
+    def result(self, elapsed):
+        return {
+                'lines': self.lines,
+                'linesPerSecond': self.lines / elapsed,
+                'batches': self.batches,
+                'latency': summarize(self.latencies),
+               }
+
+def runQt(app, seconds):
+    """ Run the Qt event loop for a while """
+    QTimer.singleShot(int(seconds * 1000), app.quit)
+    app.exec_()
+
+def runWorkload(app, gui, stages, reader, name, workload, duration):
+    """ Run a workload on a fresh simulator and return its results """
+    import microSim
+
+    simulator = microSim.MicroSimulator(monitorRate = workload['monitorRate'] or 1000,
+                                       baudrate = BAUD_RATE)
+    transport = microSim.SimPty(simulator) if os.name == 'posix' else microSim.SimTcpServer(simulator)
+    port = getattr(transport, 'port', None) or transport.url
+    gui.micro.open(port, BAUD_RATE, 8, 'N', 1)
+    gui.micro.serialThread.signalLinesRead.connect(reader.onLines, Qt.ConnectionType.DirectConnection)
+    if gui.micro.ping() != "connected":
+        raise Exception(f'Simulator not responding on {port}')
+    if 'pwmFreq' in workload:
+        gui.micro.setPwmFreqDuty(workload['pwmFreq'], 50)
+    runQt(app, 0.2)
+
+    # Command round trip times, measured with the responses futures
+    commandRtts = []
+    commandErrors = 0
+    def sendCommand():
+        nonlocal commandErrors
+        cmd = INTERACTIVE_CMDS[len(commandRtts) % len(INTERACTIVE_CMDS)]
+        sentTime = time.monotonic()
+        def done(future):
+            nonlocal commandErrors
+            if future.exception() is None:
+                commandRtts.append(time.monotonic() - sentTime)
+            else:
+                commandErrors += 1
+        gui.micro.request(cmd, 1).add_done_callback(done)
+    commandTimer = QTimer()
+    commandTimer.timeout.connect(sendCommand)
+
+    # Plot lag is sampled after every frame drawn
+    plotLags = []
+    def samplePlotLag():
+        if gui.plotTimer.isActive():
+            plotLags.append(gui.plotLag)
+    lagTimer = QTimer()
+    lagTimer.timeout.connect(samplePlotLag)
+
+    for stage in stages:
+        stage.reset()
+    reader.reset()
+    if workload['monitorRate']:
+        gui.micro.monitorPwm(1)
+    if workload['commandRate']:
+        commandTimer.start(int(1000 / workload['commandRate']))
+    lagTimer.start(int(1000 / gui.guiSettings['plotFrameRate']))
+    startCpu = time.process_time()
+    start = time.perf_counter()
+    runQt(app, duration)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - startCpu
+    commandTimer.stop()
+    lagTimer.stop()
+
+    result = {
+              'duration': elapsed,
+              'cpuFraction': cpu / elapsed,
+              'reader': reader.result(elapsed),
+              'stages': {stage.name: stage.result(elapsed) for stage in stages},
+              'commandRtt': summarize(commandRtts),
+              'commandErrors': commandErrors,
+              'plotLag': summarize(plotLags),
+              'simulatorSamples': simulator.stats['samples'],
+             }
+
+    gui.micro.serialThread.signalLinesRead.disconnect(reader.onLines)
+    gui.micro.close()
+    transport.close()
+    gui.stopPlotTimer()
+    gui.textBoxLog.clear()
+    runQt(app, 0.2)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description = "End to end benchmark of the GUI data path")
+    parser.add_argument('--duration', type = float, default = DEFAULT_DURATION,
+                        help = "Seconds each workload runs")
+    parser.add_argument('--output', default = None, help = "JSON file to write, stdout if not set")
+    parser.add_argument('--workloads', nargs = '+', default = list(workloads),
+                        choices = list(workloads), help = "Workloads to run")
+    args = parser.parse_args()
+
+    # The GUI looks for its icons relative to the working directory
+    os.chdir(ROOT_PATH)
+    app = QApplication([])
+    import main as guiMain
+    from boardSession import BoardSession
+    from micro import Micro
+    from appClasses import APlot, ALogView
+
+    # Methods are timed at class level before the GUI connects them
+    stages = [
+              Stage('decode', Micro, 'slotLinesRead',
+                    lambda args: len(args[1]), lambda args: args[2][0] if args[2] else None),
+              Stage('dispatch', BoardSession, 'callbackMicroReadLines',
+                    lambda args: len(args[1]), lambda args: args[2][0] if args[2] else None),
+              Stage('frame', guiMain.GuiCli, 'slotPlotTimerTimeOut'),
+              Stage('plot', APlot, 'plot', lambda args: len(args[1])),
+              Stage('log', BoardSession, 'writeToLog', lambda args: len(args[1])),
+              Stage('logFlush', ALogView, 'flush'),
+             ]
+    reader = ReaderStage()
+    gui = guiMain.GuiCli("MicroCLI", guiMain.APP_WIDTH, guiMain.APP_HIGHT)
+
+    results = {
+               'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'appVersion': '{major}.{minor}'.format(**gui.appVersion),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'settings': {key: gui.guiSettings[key] for key in
+                            ('rxBatchInterval', 'rxBatchMaxLines', 'plotWindowSize', 'plotFrameRate')},
+               'workloads': {},
+              }
+    for name in args.workloads:
+        print(f'Running {name}...', file = sys.stderr)
+        results['workloads'][name] = runWorkload(app, gui, stages, reader, name,
+                                                 workloads[name], args.duration)
+    for session in gui.sessions:
+        session.release()
+
+    text = json.dumps(results, indent = 2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as file:
+            file.write(text)
+
+if __name__ == '__main__':
+    main()
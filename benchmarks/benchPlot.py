@@ -0,0 +1,71 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: benchPlot.py
+    Description: Benchmark of the APlot render modes. A scrolling PWM window is
+                 plotted as fast as possible in each mode and the frames per
+                 second and CPU time per frame are reported.
+
+                 Usage: python benchmarks/benchPlot.py [frames] [window size]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+
+DEFAULT_FRAMES = 300
+DEFAULT_WINDOW = 500
+
+def benchRenderMode(app, renderMode, numFrames, windowSize):
+    """ Return (frames per second, CPU ms per frame) for a render mode """
+    from appClasses import APlot
+    from ringBuffer import RingBuffer
+
+    aplot = APlot(renderMode)
+    aplot.setLineStyle('b-')
+    aplot.setDrawStyle('steps-post')
+    aplot.setYLim((-0.1, 1.1))
+    aplot.setTitle("PWM signal")
+    aplot.setXLabel("Time relative to last sample (s)")
+    aplot.setYLabel("Logic level")
+    aplot.canvas.resize(800, 300)
+    aplot.canvas.show()
+    app.processEvents()
+
+    # 1 kHz square wave, 25 new edges per frame, plotted like GuiCli does
+    times = RingBuffer(windowSize)
+    values = RingBuffer(windowSize)
+    edge = 0
+    def addEdges(n):
+        nonlocal edge
+        times.extend(np.arange(edge, edge + n) * 0.0005)
+        values.extend(np.arange(edge, edge + n) % 2)
+        edge += n
+    addEdges(windowSize)
+
+    start = time.perf_counter()
+    cpuStart = time.process_time()
+    for i in range(numFrames):
+        addEdges(25)
+        aplot.plot(times.latestRelative(), values.latest())
+        app.processEvents()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpuStart
+
+    aplot.canvas.close()
+    return (numFrames / elapsed, cpu / numFrames * 1000)
+
+if __name__ == '__main__':
+    numFrames = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_FRAMES
+    windowSize = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_WINDOW
+    app = QApplication([])
+    from appClasses import APlot
+    for mode in APlot.renderModes:
+        fps, cpuPerFrame = benchRenderMode(app, mode, numFrames, windowSize)
+        print(f'{mode:>5}: {fps:>8.1f} fps, {cpuPerFrame:>7.2f} ms CPU/frame')
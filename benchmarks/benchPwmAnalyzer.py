@@ -0,0 +1,90 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: benchPwmAnalyzer.py
+    Description: Benchmark of PwmAnalyzer against the per sample state machine
+                 GuiCli.detectFrequency used before it. Both are fed the same
+                 random PWM samples, their periods are checked to match and
+                 the samples per second each one handles are reported.
+
+                 Usage: python benchmarks/benchPwmAnalyzer.py [samples]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import numpy as np
+from pwmAnalyzer import PwmAnalyzer
+
+DEFAULT_SAMPLES = 1000000
+BLOCK_SIZE = 4096
+
+class StateMachine():
+    """ The state machine of GuiCli.detectFrequency, with the sample time
+        passed in instead of taken from time.time()
+    """
+    state = "idle"
+    firstRisingEdgeTimeDetection = 0
+    secondRisingEdgeTimeDetection = 0
+
+    def __init__(self):
+        self.periods = []
+
+    def detectFrequency(self, digit, now):
+        if self.state == "idle":
+            if digit:
+                self.state = "firstEdge"
+                self.firstRisingEdgeTimeDetection = now
+        if self.state == "firstEdge":
+            if not digit :
+                self.state = "fallingEdge"
+        if self.state == "fallingEdge":
+            if digit:
+                self.state = "secondRisingEdge"
+                self.secondRisingEdgeTimeDetection = now
+                t1 = self.firstRisingEdgeTimeDetection
+                t2 = self.secondRisingEdgeTimeDetection
+                if (t2 - t1) > 0:
+                    self.periods.append(t2 - t1)
+        if self.state == "secondRisingEdge":
+            if not digit:
+                self.state = "idle"
+
+def randomPwm(numSamples):
+    """ Samples of a PWM signal with random high and low times """
+    rng = np.random.default_rng(1)
+    runs = rng.integers(1, 20, numSamples // 5)
+    levels = np.repeat(np.arange(len(runs)) % 2, runs)[:numSamples]
+    times = np.cumsum(rng.uniform(0.0001, 0.0002, len(levels)))
+    return (times, levels)
+
+if __name__ == '__main__':
+    numSamples = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SAMPLES
+    times, levels = randomPwm(numSamples)
+
+    stateMachine = StateMachine()
+    timesList = times.tolist()
+    levelsList = levels.tolist()
+    start = time.perf_counter()
+    for i in range(len(levelsList)):
+        stateMachine.detectFrequency(levelsList[i], timesList[i])
+    legacyRate = numSamples / (time.perf_counter() - start)
+
+    analyzer = PwmAnalyzer()
+    periods = []
+    start = time.perf_counter()
+    for i in range(0, numSamples, BLOCK_SIZE):
+        result = analyzer.analyze(times[i:i + BLOCK_SIZE], levels[i:i + BLOCK_SIZE])
+        periods.append(result[1])
+    blockRate = numSamples / (time.perf_counter() - start)
+    periods = np.concatenate(periods)
+
+    if not np.allclose(periods, stateMachine.periods, rtol = 0, atol = 1e-12):
+        print("Error: periods of PwmAnalyzer and the state machine differ")
+        sys.exit(1)
+    print(f'{len(periods)} periods measured, both methods match')
+    print(f'state machine: {legacyRate:>12.0f} samples/s')
+    print(f'  PwmAnalyzer: {blockRate:>12.0f} samples/s ({BLOCK_SIZE} samples per block)')
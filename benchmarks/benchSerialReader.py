@@ -0,0 +1,87 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: benchSerialReader.py
+    Description: Benchmark of the ThreadSerialDev read modes. A feeder thread
+                 streams PWM monitor lines ("pwm:0"/"pwm:1") into a pseudo
+                 terminal (or loop:// when ptys are not available) and each
+                 read mode is timed reading them back.
+
+                 Usage: python benchmarks/benchSerialReader.py [lines]
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from PyQt5.QtCore import Qt
+from serialDev import ThreadSerialDev
+
+BAUD_RATE = 230400
+DEFAULT_LINES = 200000
+
+def openLink():
+    """ Return a (port name, feeder write function, close function) tuple """
+    if os.name == 'posix':
+        masterFd, slaveFd = os.openpty()
+        portName = os.ttyname(slaveFd)
+        def write(data):
+            os.write(masterFd, data)
+        def close():
+            os.close(masterFd)
+            os.close(slaveFd)
+        return (portName, write, close)
+    return ('loop://', None, lambda: None)
+
+def feed(write, numLines):
+    """ Write numLines alternating PWM samples """
+    block = b'pwm:0\r\npwm:1\r\n' * 512
+    linesPerBlock = 1024
+    sent = 0
+    while sent < numLines:
+        write(block)
+        sent += linesPerBlock
+
+def benchReadMode(readMode, numLines):
+    """ Return the lines per second read with a given read mode """
+    portName, write, close = openLink()
+    dev = ThreadSerialDev(readMode)
+    numLines -= numLines % 1024
+
+    # Lines are counted in the I/O thread as soon as they are emitted
+    received = 0
+    def countLine(line):
+        nonlocal received
+        received += 1
+    def countLines(lines, stamps, kinds):
+        nonlocal received
+        received += len(lines)
+    dev.signalDataRead.connect(countLine, Qt.ConnectionType.DirectConnection)
+    dev.signalLinesRead.connect(countLines, Qt.ConnectionType.DirectConnection)
+    dev.open(portName, BAUD_RATE, 8, 'None', 1)
+    if write is None:
+        write = dev.serialDev.write
+
+    feeder = threading.Thread(target = feed, args = (write, numLines), daemon = True)
+    start = time.perf_counter()
+    feeder.start()
+    while received < numLines:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+
+    feeder.join()
+    dev.close()
+    close()
+    return numLines / elapsed
+
+if __name__ == '__main__':
+    numLines = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LINES
+    # 10 bits per byte and 7 bytes per "pwm:N\r\n" line
+    wireSpeed = BAUD_RATE / 10 / 7
+    print(f'Wire speed at {BAUD_RATE} baud: {wireSpeed:.0f} lines/s')
+    for mode in ThreadSerialDev.readModes:
+        rate = benchReadMode(mode, numLines)
+        print(f'{mode:>6}: {rate:>10.0f} lines/s ({rate / wireSpeed:.1f}x wire speed)')
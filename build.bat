@@ -9,8 +9,14 @@ set appPath=%currentDir%\src\%mainPythonScript%
 set imgPath=%currentDir%/img
 set iconPath=%imgPath%/icon.ico
 
-python -m PyInstaller --icon=%iconPath% --onefile -w --noconsole  --add-data="./img/*.png;img/" ^
---add-data="./img/*.ico;img/" %appPath%
+:: Pack the icons into the resource bundle read by the app
+python %currentDir%\src\buildResources.py
+if not %errorlevel%==0 (
+    echo "Packing resources failed, error code %errorlevel%"
+    exit /b %errorlevel%
+)
+
+python -m PyInstaller --icon=%iconPath% --onefile -w --noconsole  --add-data="./img/resources.bundle;img/" %appPath%
 
 if not %errorlevel%==0 (
     echo "Build failded, error code %errorlevel%"
@@ -1,64 +1,140 @@
-from PyQt5.QtGui import QIcon, QFont, QPixmap
+from PyQt5.QtGui import QIcon, QFont, QPixmap, QTextCharFormat, QColor, QTextCursor
 from PyQt5.QtWidgets import (QGridLayout, QLabel, QPushButton,  QLineEdit, QFileDialog,
-                             QMainWindow, QDialog, QHBoxLayout, QWidget, QTextEdit,QComboBox,QDockWidget, QAction, QTabWidget
+                             QMainWindow, QDialog, QHBoxLayout, QWidget, QTextEdit,QComboBox,QDockWidget, QAction, QTabWidget,
+                             QPlainTextEdit, QCheckBox, QListWidget, QListWidgetItem
                             )
-from PyQt5.QtCore import Qt
-
-from winotify import Notification
+from PyQt5.QtCore import Qt, QTimer
 
+import io
 import os
-from pydub import AudioSegment
-from pydub.playback import play as playAudio
-import threading
-
-# Matplot modules
-import matplotlib
-matplotlib.use('Qt5Agg')
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-import matplotlib.pyplot as plt
+import re
+import sys
+import time
+import zipfile
+from collections import deque
+
+import startupTrace
+
+class AIcons():
+    """ Process wide cache of the application icons. All images are read
+        at once from the resource bundle (see buildResources.py), each one is
+        decoded the first time it is asked for and shared afterwards. From
+        the sources, images are read from their files when there is no bundle
+        or an image is newer than it.
+    """
+    # Icon name and its image file in img/
+    iconFiles = {
+                 "stop": "stop.png",
+                 "folder": "folder.png",
+                 "build": "build.png",
+                 "remotePc": "remotePc.png",
+                 "warning": "warning.png",
+                 "features": "features.png",
+                 "info": "info.png",
+                 "save": "save.png",
+                 "openFolder": "openFolder.png",
+                 "zip": "zip.png",
+                 "readOnly": "readonly.png",
+                 "report": "report.png",
+                 "play": "play.png",
+                 "settings": "settings.png",
+                 "resync": "resync.png",
+                 "mainIcon": "icon.ico",
+                 "onImage": "on.png",
+                 "offImage": "off.png",
+                 "compare": "compare.png",
+                 "vscode": "vscode.png",
+                 "copy": "copy.png",
+                 "fontSize": "fontSize.png",
+                 "serialPort": "serialPort.png",
+                 "stats": "stats.png",
+                 "circularClock": "circularClock.png",
+                 "clk": "clk.png",
+                 "version": "version.png",
+                 "powerOn": "powerOn.png",
+                 "powerOff": "powerOff.png",
+                 "refresh": "refresh.png",
+                 "ram": "ram.png",
+                 "freq": "freq.png",
+                 "freq2": "freq2.png",
+                 "setTime": "setTime.png",
+                 "getTime": "getTime.png",
+                 "help": "help.png",
+                 "clear": "clear.png",
+                }
+    bundleName = 'resources.bundle'
+    # Image data by file name, read from the bundle on first use
+    bundle = None
+    pixmaps = {}
+    icons = {}
+
+    @staticmethod
+    def imgDir():
+        """ Directory of the images, next to the sources or inside the
+            executable built by PyInstaller, wherever the app is launched
+            from.
+        """
+        root = getattr(sys, '_MEIPASS', None)
+        if root is None:
+            root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+        return os.path.join(root, 'img')
+
+    @classmethod
+    def loadBundle(cls):
+        """ Read the resource bundle, a single read of an uncompressed zip """
+        if cls.bundle is not None:
+            return
+        bundlePath = os.path.join(cls.imgDir(), cls.bundleName)
+        if not os.path.exists(bundlePath):
+            cls.bundle = {}
+            return
+        with startupTrace.phase('resources'):
+            try:
+                with open(bundlePath, 'rb') as file:
+                    data = file.read()
+                with zipfile.ZipFile(io.BytesIO(data)) as bundle:
+                    cls.bundle = {name: bundle.read(name) for name in bundle.namelist()}
+            except (OSError, zipfile.BadZipFile) as e:
+                print(f'Error: {e}')
+                cls.bundle = {}
+
+    @classmethod
+    def readImage(cls, fileName):
+        """ Return the data of an image, from its file if it is not in the
+            bundle (run buildResources.py to add it).
+        """
+        cls.loadBundle()
+        data = cls.bundle.get(fileName)
+        if data is None:
+            with open(os.path.join(cls.imgDir(), fileName), 'rb') as file:
+                data = file.read()
+        return data
+
+    @classmethod
+    def pixmap(cls, name):
+        """ Return the image of an icon name, decoded once """
+        pixmap = cls.pixmaps.get(name)
+        if pixmap is None:
+            pixmap = QPixmap()
+            with startupTrace.phase(name, 'icon'):
+                try:
+                    pixmap.loadFromData(cls.readImage(cls.iconFiles[name]))
+                except OSError as e:
+                    print(f'Error: {e}')
+            cls.pixmaps[name] = pixmap
+        return pixmap
+
+    @classmethod
+    def icon(cls, name):
+        """ Return the icon of an icon name, created once """
+        icon = cls.icons.get(name)
+        if icon is None:
+            icon = QIcon(cls.pixmap(name))
+            cls.icons[name] = icon
+        return icon
 
 class AppMainWindow(QMainWindow):
 
-    iconPaths = {
-                    "stop": "/img/stop.png",
-                    "folder":"/img/folder.png",
-                    "build":"/img/build.png",
-                    "remotePc":"/img/remotePc.png",
-                    "warning":"/img/warning.png",
-                    "features":"/img/features.png",
-                    "info":"/img/info.png",
-                    "save":"/img/save.png",
-                    "openFolder":"/img/openFolder.png",
-                    "zip":"/img/zip.png",
-                    "readOnly":"/img/readOnly.png",
-                    "report":"/img/report.png",
-                    "play":"/img/play.png",
-                    "settings":"/img/settings.png",
-                    "resync":"/img/resync.png",
-                    "mainIcon":"/img/icon.ico",
-                    "onImage":"/img/on.png",
-                    "offImage":"/img/off.png",
-                    "compare":"/img/compare.png",
-                    "vscode":"/img/vscode.png",
-                    "copy":"/img/copy.png",
-                    "fontSize":"/img/fontSize.png",
-                    "serialPort":"/img/serialPort.png",
-                    "stats":"/img/stats.png",
-                    "circularClock":"/img/circularCLock.png",
-                    "clk":"/img/clk.png",
-                    "version":"/img/version.png",
-                    "powerOn":"/img/powerOn.png",
-                    "powerOff":"/img/powerOff.png",
-                    "refresh":"/img/refresh.png",
-                    "ram":"/img/ram.png",
-                    "freq":"/img/freq.png",
-                    "freq2":"/img/freq2.png",
-                    "setTime":"/img/setTime.png",
-                    "getTime":"/img/getTime.png",
-                    "help":"/img/help.png",
-                    "clear":"/img/clear.png",
-                }
     buttonFontSize = 10
     notiSoundPath = "audio/notification.wav"
 
@@ -73,7 +149,7 @@ class AppMainWindow(QMainWindow):
                                     background-color: red; /* Change the color here */
                                     height: 1px; /* Set the height of the separator */
                                     margin: 2px; /* Set margin to zero */
-                                }L
+                                }
                             """,
                 "button":
                             """
@@ -157,12 +233,12 @@ class AppMainWindow(QMainWindow):
                                 }
                             """,
                 "text":
-                            """ QTextEdit {
+                            """ QPlainTextEdit {
                                 background-color: white;
                                 color: black;
                                 border: 1px solid #CCCCCC;
                                 }
-                                QTextEdit:hover {
+                                QPlainTextEdit:hover {
                                     background-color: white;
                                 }
                             """,
@@ -209,7 +285,7 @@ class AppMainWindow(QMainWindow):
                                     background-color: red; /* Change the color here */
                                     height: 1px; /* Set the height of the separator */
                                     margin: 2px; /* Set margin to zero */
-                                }L
+                                }
                             """,
                 "button":
                             """
@@ -293,12 +369,12 @@ class AppMainWindow(QMainWindow):
                                 }
                             """,
                 "text":
-                            """ QTextEdit {
+                            """ QPlainTextEdit {
                                 background-color: #2C2C2C;
                                 color: white;
                                 border: 1px solid #2C2C2C;
                                 }
-                                QTextEdit:hover {
+                                QPlainTextEdit:hover {
                                     background-color: #2C2C2C;
                                 }
                             """,
@@ -335,6 +411,26 @@ class AppMainWindow(QMainWindow):
                             """
                 }
     themes = {"dark": darkTheme, "light": lightTheme}
+    # Sections of a theme in the stylesheet of the main window, in order of
+    # precedence
+    themeSections = ('mainWindow', 'frame', 'toolbar', 'label', 'button',
+                     'line', 'combobox', 'text')
+    # Stylesheet of each theme, built once
+    themeStyleSheets = {}
+
+    @classmethod
+    def themeStyleSheet(cls, theme):
+        """ Return the stylesheet of a theme for the whole main window. The
+            frame rules only select the panel frames (QFrame widgets with
+            the 'panel' property), not every widget derived from QFrame.
+        """
+        styleSheet = cls.themeStyleSheets.get(theme)
+        if styleSheet is None:
+            sections = dict(cls.themes[theme])
+            sections['frame'] = sections['frame'].replace('QFrame {', '.QFrame[panel="true"] {')
+            styleSheet = '\n'.join(sections[key] for key in cls.themeSections)
+            cls.themeStyleSheets[theme] = styleSheet
+        return styleSheet
 
     def __init__(self):
         super().__init__() # Allows the use of abstract class to work
@@ -343,6 +439,202 @@ class AppMainWindow(QMainWindow):
         self.buttonsFont.setFamily('Helvetica')
         self.buttonsFont.setPointSize(self.buttonFontSize)
 
+class ALogView(QPlainTextEdit):
+    """ Plain text log for high volumes of text. Only the newest maxLines
+        lines are kept, appended text is buffered and inserted once per
+        frame, and one character format is cached per color. Text with the
+        default color has no format so it follows the theme text color.
+    """
+    maxLines = 20000
+    # Interval in ms between insertions of the buffered text
+    flushInterval = 33
+
+    def __init__(self, maxLines = None):
+        super().__init__()
+        self.setUndoRedoEnabled(False)
+        self.setMaximumBlockCount(maxLines or self.maxLines)
+        self.formats = {None: QTextCharFormat()}
+        # Buffered (text, color) pieces and their number of lines, the
+        # oldest pieces are dropped from the left
+        self.pending = deque()
+        self.pendingLines = 0
+        # Line terminators appended since the view was created, the last
+        # block of the document is line number totalLines
+        self.totalLines = 0
+        self.flushTimer = QTimer()
+        self.flushTimer.setSingleShot(True)
+        self.flushTimer.timeout.connect(self.flush)
+
+    def append(self, text, color = None):
+        """ Buffer text to be inserted in the next frame """
+        self.pending.append((text, color))
+        numLines = text.count('\n')
+        self.pendingLines += numLines
+        self.totalLines += numLines
+        # Lines that would be dropped right after inserting them are
+        # dropped now, memory stays bounded between frames
+        if self.pendingLines > 2 * self.maximumBlockCount():
+            while self.pendingLines > self.maximumBlockCount():
+                self.pendingLines -= self.pending.popleft()[0].count('\n')
+        if not self.flushTimer.isActive():
+            self.flushTimer.start(self.flushInterval)
+
+    def charFormat(self, color):
+        """ Return the cached format of a color """
+        format_ = self.formats.get(color)
+        if format_ is None:
+            format_ = QTextCharFormat()
+            format_.setForeground(QColor(color))
+            self.formats[color] = format_
+        return format_
+
+    def flush(self):
+        """ Insert the buffered text, consecutive pieces with the same
+            color are inserted at once.
+        """
+        if not self.pending:
+            return
+        scrollBar = self.verticalScrollBar()
+        atBottom = scrollBar.value() >= scrollBar.maximum()
+
+        cursor = QTextCursor(self.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.beginEditBlock()
+        texts = []
+        color = self.pending[0][1]
+        for text, textColor in self.pending:
+            if textColor != color:
+                cursor.insertText(''.join(texts), self.charFormat(color))
+                texts = []
+                color = textColor
+            texts.append(text)
+        cursor.insertText(''.join(texts), self.charFormat(color))
+        cursor.endEditBlock()
+        self.pending.clear()
+        self.pendingLines = 0
+
+        # Follow the end of the log unless the user scrolled up
+        if atBottom:
+            scrollBar.setValue(scrollBar.maximum())
+
+    def clear(self):
+        """ Remove all text, buffered text included """
+        self.pending.clear()
+        self.pendingLines = 0
+        super().clear()
+
+    def jumpToLine(self, number):
+        """ Select a line by its number since the view was created, returns
+            False when the line is not kept anymore.
+        """
+        self.flush()
+        blockNumber = number - self.totalLines + self.blockCount() - 1
+        if blockNumber < 0 or blockNumber >= self.blockCount():
+            return False
+        cursor = QTextCursor(self.document().findBlockByNumber(blockNumber))
+        cursor.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
+        self.setTextCursor(cursor)
+        self.centerCursor()
+        return True
+
+class ALogSearch(QDialog):
+    """ Search dialog of a LogIndex. Clicking a hit calls callbackJump with
+        its line number and shows the lines around it.
+    """
+    maxSize = (640, 480)
+    maxHits = 1000
+    contextLines = 5
+    allKinds = "All"
+
+    def __init__(self, logIndex, callbackJump = None):
+        super().__init__()
+        self.logIndex = logIndex
+        self.callbackJump = callbackJump
+        self.aWidgets = AWidgets()
+        self.setWindowTitle("Search log")
+        self.setWindowIcon(AIcons.icon('report'))
+        self.resize(self.maxSize[0], self.maxSize[1])
+
+        self.linePattern = QLineEdit()
+        self.linePattern.setPlaceholderText("Text or regular expression")
+        self.linePattern.returnPressed.connect(self.search)
+        self.checkBoxRegex = QCheckBox("Regex")
+        self.checkBoxIgnoreCase = QCheckBox("Ignore case")
+        self.comboBoxKinds = self.aWidgets.newComboBox()
+        searchButton = QPushButton("&Search")
+        searchButton.clicked.connect(self.search)
+        self.listHits = QListWidget()
+        self.listHits.itemClicked.connect(self.slotHitClicked)
+        self.labelStatus = QLabel()
+        self.textContext = QPlainTextEdit()
+        self.textContext.setReadOnly(True)
+        self.textContext.setMaximumHeight(140)
+
+        gridLayout = QGridLayout()
+        self.setLayout(gridLayout)
+        gridLayout.addWidget(self.linePattern, 0, 0, 1, 2)
+        gridLayout.addWidget(self.comboBoxKinds, 0, 2)
+        gridLayout.addWidget(searchButton, 0, 3)
+        gridLayout.addWidget(self.checkBoxRegex, 1, 0)
+        gridLayout.addWidget(self.checkBoxIgnoreCase, 1, 1)
+        gridLayout.addWidget(self.labelStatus, 1, 2, 1, 2)
+        gridLayout.addWidget(self.listHits, 2, 0, 1, 4)
+        gridLayout.addWidget(self.textContext, 3, 0, 1, 4)
+
+    def setLogIndex(self, logIndex, callbackJump = None):
+        """ Search another log, the hits of the previous one are cleared """
+        if logIndex is not self.logIndex:
+            self.listHits.clear()
+            self.textContext.clear()
+            self.labelStatus.clear()
+        self.logIndex = logIndex
+        self.callbackJump = callbackJump
+
+    def showEvent(self, event):
+        """ Refresh the kinds of lines seen so far """
+        currentKind = self.comboBoxKinds.currentText()
+        self.comboBoxKinds.clear()
+        self.comboBoxKinds.addItem(self.allKinds)
+        self.comboBoxKinds.addItems(sorted(self.logIndex.kinds()))
+        self.comboBoxKinds.setCurrentText(currentKind or self.allKinds)
+        super().showEvent(event)
+
+    def search(self):
+        """ Search the log and list the hits """
+        kind = self.comboBoxKinds.currentText()
+        start = time.perf_counter()
+        try:
+            hits = self.logIndex.search(self.linePattern.text(),
+                                        self.checkBoxRegex.isChecked(),
+                                        self.checkBoxIgnoreCase.isChecked(),
+                                        None if kind == self.allKinds else [kind],
+                                        self.maxHits)
+        except re.error as e:
+            self.labelStatus.setText(f'Invalid regex: {e}')
+            return
+        elapsed = time.perf_counter() - start
+
+        self.listHits.clear()
+        for number in hits:
+            item = QListWidgetItem(f'{number + 1}: {self.logIndex.line(number)}')
+            item.setData(Qt.ItemDataRole.UserRole, number)
+            self.listHits.addItem(item)
+        more = "+" if len(hits) >= self.maxHits else ""
+        self.labelStatus.setText(f'{len(hits)}{more} hits in {elapsed * 1000:.1f} ms')
+
+    def slotHitClicked(self, item):
+        """ Jump to a hit and show the lines around it """
+        number = item.data(Qt.ItemDataRole.UserRole)
+        first = max(number - self.contextLines, 0)
+        last = min(number + self.contextLines, len(self.logIndex) - 1)
+        context = []
+        for i in range(first, last + 1):
+            marker = '>' if i == number else ' '
+            context.append(f'{marker}{i + 1}: {self.logIndex.line(i)}')
+        self.textContext.setPlainText('\n'.join(context))
+        if self.callbackJump is not None:
+            self.callbackJump(number)
+
 class AWidgets():
     bgTextBoxes = '#2C2C2C'
     colorTextBoxes = 'white'
@@ -376,15 +668,15 @@ class AWidgets():
         # label.maximumHeight(20)
         return label
 
-    def newButton(self, text, slot = None, font = None, iconPath = None, size = None, style = None):
+    def newButton(self, text, slot = None, font = None, iconName = None, size = None, style = None):
         button = QPushButton(text)
         # button.setStyleSheet("color: black; background-color: white;" )
         if slot is not None:
             button.clicked.connect(slot)
         if font is not None:
             button.setFont(font)
-        if iconPath is not None:
-            button.setIcon(QIcon(iconPath))
+        if iconName is not None:
+            button.setIcon(AIcons.icon(iconName))
         if size is not None:
             button.setFixedSize(size[0], size[1])
         if style is not None:
@@ -418,17 +710,18 @@ class AWidgets():
         comboBox.setFont(font)
         return comboBox
 
-    def newDock(self, title, name):
+    def newDock(self, title, name, widget = None):
         dock = QDockWidget(title)
         dock.setObjectName(name)
         dock.setTitleBarWidget(QWidget(None)) # Remove title bar
 
-        font = QFont()
-        font.setPointSize(10)
-        textBoxLog = QTextEdit()
-        textBoxLog.setFont(font)
-        dock.setWidget(textBoxLog)
-        return (dock, textBoxLog)
+        if widget is None:
+            font = QFont()
+            font.setPointSize(10)
+            widget = ALogView()
+            widget.setFont(font)
+        dock.setWidget(widget)
+        return (dock, widget)
 
     def newLabel(self, text, pointSize, style = None):
         label = QLabel(text)
@@ -441,13 +734,13 @@ class AWidgets():
             # label.setStyleSheet(style)
         return label
 
-    def newAction(self, parent, text = None, iconPath = None, slot = None):
+    def newAction(self, parent, text = None, iconName = None, slot = None):
         if text is not None:
             action = QAction(text, parent)
         else:
             action = QAction(parent)
-        if iconPath is not None:
-            action.setIcon(QIcon(iconPath))
+        if iconName is not None:
+            action.setIcon(AIcons.icon(iconName))
         if slot is not None:
             action.triggered.connect(slot)
         return action
@@ -462,21 +755,19 @@ class ASettings(QDialog):
                 "QTabBar::tab:selected { background-color: gray; }"
                )
 
-    def __init__(self, appRootPath, iconPaths):
+    def __init__(self):
         super().__init__()
-        self.iconPaths = iconPaths
-        self.appRootPath = appRootPath
         self.aWidgets = AWidgets()
 
         #Initialize main window and all tabs needed
         self.initTabs()
-        self.initWindow(appRootPath, iconPaths)
+        self.initWindow()
 
-    def initWindow(self, appRootPath, iconPaths):
+    def initWindow(self):
         # Set window properties
         self.setWindowTitle("Settings")
         # self.setStyleSheet(styles['dialog'])
-        self.setWindowIcon(QIcon(appRootPath + iconPaths['settings']))
+        self.setWindowIcon(AIcons.icon('settings'))
         self.setFixedSize(self.maxSize[0], self.maxSize[1])
 
         # Initialize apply/cancel buttons
@@ -590,33 +881,130 @@ class ASettings(QDialog):
         return self.comboboxThemes.currentText()
 class APlot():
     canvas = None
-    def __init__(self):
-        self.canvas = FigureCanvas(plt.figure())
+    # Render modes:
+    # 'full': the whole figure (axes, ticks, labels, title) is drawn each frame.
+    # 'blit': the static background is cached and only the line is drawn on
+    #         top of it, the full draw is done only when the limits change.
+    renderModes = ('full', 'blit')
+    # In blit mode the x limits are extended by this fraction of the data span
+    # so the data scrolls for a while before limits have to change again
+    xMargin = 1.0
+    # Interval in seconds used to compute the frames per second
+    fpsInterval = 1.0
+
+    @staticmethod
+    def importModules():
+        """ Import matplotlib and return the canvas and figure classes. It
+            takes most of the start up time, so it is only loaded with the
+            first plot.
+        """
+        import matplotlib
+        matplotlib.use('Qt5Agg')
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+        from matplotlib.figure import Figure
+        return FigureCanvasQTAgg, Figure
+
+    def __init__(self, renderMode = 'blit'):
+        FigureCanvas, Figure = self.importModules()
+        self.canvas = FigureCanvas(Figure())
         self.ax = self.canvas.figure.add_subplot(111)
+        self.line = None
+        self.background = None
+        self.renderMode = renderMode
+        self.fps = 0
+        self.frameCount = 0
+        self.fpsStartTime = time.perf_counter()
+        # Every full draw (resize, limits change, ...) caches a new background
+        self.canvas.mpl_connect('draw_event', self.onDraw)
+
+    def setRenderMode(self, renderMode):
+        """ Select between full and blit render modes """
+        if renderMode not in self.renderModes:
+            raise Exception(f'Invalid render mode, valid modes {self.renderModes}')
+        self.renderMode = renderMode
+        self.background = None
+        if self.line is not None:
+            self.line.set_animated(renderMode == 'blit')
+        self.canvas.draw_idle()
+
+    def onDraw(self, event):
+        """ Cache the static background and draw the line on top of it """
+        if self.renderMode == 'blit' and self.line is not None:
+            self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+            self.ax.draw_artist(self.line)
 
     def plot(self, x , y):
         self.line.set_xdata(x)
         self.line.set_ydata(y)
-        self.ax.set_xlim(x[0], x[-1])
-        self.canvas.draw()
+        limitsChanged = self.updateXLim(x)
+        if (self.renderMode == 'blit' and not limitsChanged and
+            self.background is not None):
+            self.canvas.restore_region(self.background)
+            self.ax.draw_artist(self.line)
+            self.canvas.blit(self.ax.bbox)
+        else:
+            self.canvas.draw()
+        self.countFrame()
+
+    def updateXLim(self, x):
+        """ Fit the x limits to the data, returns True if they changed """
+        xMin, xMax = self.ax.get_xlim()
+        if self.renderMode == 'blit':
+            span = x[-1] - x[0]
+            # Keep the limits while the data fits and fills a good part of them
+            if xMin <= x[0] and x[-1] <= xMax and span * 4 >= (xMax - xMin):
+                return False
+            # Leave some room on the side the data went out of the limits
+            margin = span * self.xMargin
+            newLim = (x[0] - margin if x[0] < xMin else x[0],
+                      x[-1] + margin if x[-1] > xMax else x[-1])
+        else:
+            newLim = (x[0], x[-1])
+        if newLim == (xMin, xMax):
+            return False
+        self.ax.set_xlim(newLim[0], newLim[1])
+        return True
+
+    def countFrame(self):
+        """ Count a rendered frame and update the frames per second """
+        self.frameCount += 1
+        now = time.perf_counter()
+        elapsed = now - self.fpsStartTime
+        if elapsed >= self.fpsInterval:
+            self.fps = self.frameCount / elapsed
+            self.frameCount = 0
+            self.fpsStartTime = now
+
+    def getFps(self):
+        """ Frames per second rendered during the last interval """
+        return self.fps
 
     def setXLabel(self, label):
         self.ax.set_xlabel(label)
+        self.background = None
 
     def setYLabel(self, label):
         self.ax.set_ylabel(label)
+        self.background = None
 
     def setTitle(self, title):
         self.ax.set_title(title)
+        self.background = None
 
     def setXlim(self, xLim = (0, 100)):
         self.ax.set_xlim(xLim[0], xLim[1])
+        self.background = None
 
     def setYLim(self, yLim = (0, 1)):
         self.ax.set_ylim(yLim[0], yLim[1])
+        self.background = None
 
     def setLineStyle(self, lineStyle = 'b-'):
-        self.line, = self.ax.plot([], [], lineStyle)
+        self.line, = self.ax.plot([], [], lineStyle,
+                                  animated = (self.renderMode == 'blit'))
+
+    def setDrawStyle(self, drawStyle = 'default'):
+        self.line.set_drawstyle(drawStyle)
 
     def setLegend(self, legend):
         pass
@@ -0,0 +1,297 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: asyncMicro.py
+    Description: asyncio client of the microcontroller for headless scripts.
+                 It has the same commands as Micro but does not need Qt, many
+                 boards can be driven from a single event loop.
+
+                 Example:
+                    async with await AsyncMicro.connect('/dev/ttyACM0') as micro:
+                        print(await micro.readPin('a', 5))
+                        async for stamp, level in micro.monitorPwm(1):
+                            ...
+"""
+
+import asyncio
+import os
+import time
+import serial
+import microProtocol
+
+class AsyncSerialTransport():
+    """ Non blocking reads and writes of a pyserial port from an asyncio
+        event loop. Ports with a file descriptor are watched by the loop,
+        other ports (socket://, loop://, Windows COM ports) are polled.
+    """
+    pollInterval = 0.005
+
+    def __init__(self, serialDev, callbackLines):
+        self.serialDev = serialDev
+        self.callbackLines = callbackLines
+        self.rxBuffer = bytearray()
+        self.loop = asyncio.get_running_loop()
+        self.pollTask = None
+        self.fd = None
+        fileno = getattr(serialDev, 'fileno', None)
+        if os.name == 'posix' and fileno is not None:
+            try:
+                self.fd = fileno()
+            except Exception:
+                self.fd = None
+        if self.fd is not None:
+            self.loop.add_reader(self.fd, self.onReadable)
+        else:
+            self.pollTask = self.loop.create_task(self.poll())
+
+    def onReadable(self):
+        """ Read everything available and pass complete lines on """
+        try:
+            chunk = self.serialDev.read(self.serialDev.in_waiting or 1)
+        except Exception as e:
+            self.close()
+            self.callbackLines(None, e)
+            return
+        if not chunk:
+            return
+        self.rxBuffer += chunk
+        end = self.rxBuffer.rfind(b'\n')
+        if end < 0:
+            return
+        block = bytes(self.rxBuffer[:end + 1])
+        del self.rxBuffer[:end + 1]
+        self.callbackLines([line + b'\n' for line in block.split(b'\n')[:-1]], None)
+
+    async def poll(self):
+        """ Poll ports that can't be watched by the event loop """
+        while self.serialDev.is_open:
+            if self.serialDev.in_waiting:
+                self.onReadable()
+                # Let other tasks run while the port streams data
+                await asyncio.sleep(0)
+            else:
+                await asyncio.sleep(self.pollInterval)
+
+    def write(self, data):
+        self.serialDev.write(data)
+
+    def close(self):
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+            self.fd = None
+        if self.pollTask is not None:
+            self.pollTask.cancel()
+            self.pollTask = None
+        if self.serialDev.is_open:
+            self.serialDev.close()
+
+class AsyncMicro():
+    """ asyncio version of Micro, every command returns the lines of its
+        response. Responses are matched in order so several commands can be
+        awaited at once (see setPipelineWindow).
+    """
+    baudRates = microProtocol.baudRates
+    channels = microProtocol.channels
+    gpios = microProtocol.gpios
+    pins = microProtocol.pins
+    cmds = microProtocol.cmds
+    maxFreq = microProtocol.maxFreq
+    maxDutyCycle = microProtocol.maxDutyCycle
+    # Interval to check for commands that timed out
+    expireInterval = 0.01
+
+    def __init__(self):
+        self.transport = None
+        self.pipeline = microProtocol.CommandPipeline()
+        self.monitors = []
+        self.isMonitoring = False
+        self.expireTask = None
+
+    @classmethod
+    async def connect(cls, port, baud = 115200, dataLen = 8, parity = 'N',
+                      stopBits = 1):
+        """ Create a client and open a serial port or pyserial URL """
+        micro = cls()
+        await micro.open(port, baud, dataLen, parity, stopBits)
+        return micro
+
+    async def open(self, port, baud = 115200, dataLen = 8, parity = 'N',
+                   stopBits = 1):
+        """ Open a serial port to exchange data with the microcontroller """
+        parity = {'odd': 'O', 'even': 'E'}.get(str(parity).lower(), 'N')
+        serialDev = serial.serial_for_url(port,
+                                          baudrate = int(baud),
+                                          bytesize = int(dataLen),
+                                          parity = parity,
+                                          stopbits = int(stopBits),
+                                          timeout = 0
+                                          )
+        self.transport = AsyncSerialTransport(serialDev, self.onLines)
+        self.expireTask = asyncio.get_running_loop().create_task(self.expireLoop())
+
+    async def close(self):
+        """ Stop any monitor and close the serial port """
+        if self.isMonitoring:
+            await self.stopPwmMonitor()
+        if self.expireTask is not None:
+            self.expireTask.cancel()
+            self.expireTask = None
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+        self.pipeline.cancelAll(serial.SerialException("Serial device closed"))
+        for monitor in self.monitors:
+            monitor.put_nowait(None)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def isOpen(self):
+        """ Check if a serial communication is opened """
+        return self.transport is not None
+
+    def setPipelineWindow(self, window):
+        """ Set how many commands can wait for their response at once """
+        self.pipeline.setWindow(window)
+
+    def onLines(self, lines, error):
+        """ Route lines read to the monitors or to the pending commands """
+        if error is not None:
+            self.pipeline.cancelAll(error)
+            for monitor in self.monitors:
+                monitor.put_nowait(None)
+            return
+        now = time.monotonic()
+        for line in lines:
+            if line.startswith(microProtocol.unsolicitedPrefixes):
+                if self.monitors:
+                    try:
+                        sample = (now, int(line[len(b'pwm:'):]))
+                    except ValueError:
+                        continue
+                    for monitor in self.monitors:
+                        monitor.put_nowait(sample)
+            else:
+                self.pipeline.feedLine(line, now)
+        self.sendReady()
+
+    def sendReady(self):
+        """ Write the commands the pipeline allows to send """
+        for cmd in self.pipeline.takeReady():
+            self.transport.write(cmd.data)
+
+    async def expireLoop(self):
+        """ Periodically expire commands that timed out """
+        while True:
+            await asyncio.sleep(self.expireInterval)
+            if not self.pipeline.isIdle():
+                self.pipeline.expire()
+                self.sendReady()
+
+    async def request(self, cmd, timeout = 1):
+        """ Send a command and return the lines of its response """
+        if self.transport is None:
+            raise serial.SerialException("Serial device not opened")
+        future = self.pipeline.submit(cmd.encode(), timeout)
+        self.sendReady()
+        return await asyncio.wrap_future(future)
+
+    async def ping(self):
+        """ Test if there is a connection with the microcontroller """
+        try:
+            response = await self.request(self.cmds['ping'])
+        except Exception:
+            return "disconnected"
+        if response and response[0].strip() == "OK":
+            return "connected"
+        return "disconnected"
+
+    async def getVersion(self):
+        """ Get SW version """
+        return await self.request(self.cmds['version'])
+
+    async def writePin(self, gpio, pin, state):
+        """ Write a logical value to a GPIO pin """
+        cmd = self.cmds['gpioWrite'] + f' {gpio.lower()} {pin} {int(state)}\n'
+        return await self.request(cmd)
+
+    async def readPin(self, gpio, pin):
+        """ Read a GPIO pin """
+        cmd = self.cmds['gpioRead'] + f' {gpio.lower()} {pin}\n'
+        return await self.request(cmd)
+
+    async def readAllPins(self):
+        """ Read every pin of every GPIO, the reads are pipelined """
+        minPin, maxPin = self.pins
+        keys = [(gpio, pin) for gpio in self.gpios for pin in range(minPin, maxPin + 1)]
+        responses = await asyncio.gather(*(self.readPin(gpio, pin) for gpio, pin in keys))
+        return {key: response[0] for key, response in zip(keys, responses)}
+
+    async def help(self):
+        """ Reads any help information """
+        return await self.request(self.cmds['help'])
+
+    async def getStats(self):
+        """ Get microcontroller general information """
+        return await self.request(self.cmds['stats'])
+
+    async def getTicks(self):
+        """ Get the OS tick counter number """
+        return await self.request(self.cmds['ticks'])
+
+    async def getHeap(self):
+        """ Get OS heap consumption """
+        return await self.request(self.cmds['heap'])
+
+    async def getClk(self):
+        """ Get microcontroller CLK information """
+        return await self.request(self.cmds['clk'])
+
+    async def getRtcTime(self):
+        """ Get microcontroller RTC time """
+        return await self.request(self.cmds['rtcGet'])
+
+    async def setRtcTime(self, hr, min, s = 0):
+        """ Set a new RTC time """
+        return await self.request(self.cmds['rtcSet'] + f' {hr} {min} {s}\n')
+
+    async def setPwmFreqDuty(self, freq, duty):
+        """ Set a new PWM frequency and duty cycle """
+        if (freq < 0 or freq > self.maxFreq):
+            raise Exception("Invalid frequency")
+        if (duty < 0 or duty > self.maxDutyCycle):
+            raise Exception("Invalid duty, it should be between 1-100")
+        responses = await asyncio.gather(self.request(self.cmds['pwmSetFreq'] + f' {freq}\n'),
+                                         self.request(self.cmds['pwmSetDuty'] + f' {duty}\n'))
+        return responses[0] + responses[1]
+
+    async def monitorPwm(self, channel = 1):
+        """ Monitor a PWM channel, yields (time.monotonic(), level) samples
+            until the loop using it stops or stopPwmMonitor is called.
+        """
+        if str(channel) not in self.channels:
+            raise Exception("Invalid channel, valid range (1-4)")
+        monitor = asyncio.Queue()
+        self.monitors.append(monitor)
+        try:
+            await self.request(self.cmds['pwmMonitor'] + f' {channel}\n')
+            self.isMonitoring = True
+            while True:
+                sample = await monitor.get()
+                if sample is None:
+                    return
+                yield sample
+        finally:
+            self.monitors.remove(monitor)
+            if not self.monitors and self.isMonitoring and self.transport is not None:
+                await self.stopPwmMonitor()
+
+    async def stopPwmMonitor(self):
+        """ Stop PWM monitoring feature """
+        self.isMonitoring = False
+        await self.request(self.cmds['stopMonitor'])
+        for monitor in self.monitors:
+            monitor.put_nowait(None)
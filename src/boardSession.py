@@ -0,0 +1,290 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: boardSession.py
+    Description: Everything the GUI keeps for one connected board: its Micro
+                 (and I/O thread), its log view and log index, and the stream
+                 of PWM samples to plot. Several sessions run at once, one per
+                 serial port.
+"""
+
+import os
+import time
+from collections import deque
+
+from PyQt5.QtGui import QFont
+
+import microProtocol
+import startupTrace
+from appClasses import ALogView
+from logIndex import LogIndex
+from micro import Micro
+
+class BoardSession():
+    """ One board of a GuiCli window. gui is the window, samples are plotted
+        and lines recorded through it.
+    """
+
+    def __init__(self, gui, portName = None, description = None):
+        self.gui = gui
+        settings = gui.guiSettings
+        self.portName = portName
+        self.description = description
+        # Status bar text and color, and border color of the connect button
+        self.status = ("Serial device: disconnected", 'white', "#555555")
+        self.legend = self.title()
+
+        # Object to perform microcontroller operations
+        self.micro = Micro(callbackDataRead = self.callbackMicroReadData,
+                           callbackLinesRead = self.callbackMicroReadLines,
+                           callbackDataWritten = self.callbackMicroWriteData,
+                           callbackConnectionLost = self.callbackMicroConnectionLost,
+                           callbackReconnected = self.callbackMicroReconnected,
+                           callbackConnectState = self.callbackMicroConnectState)
+        self.micro.setRxBatching(settings['rxBatchInterval'], settings['rxBatchMaxLines'])
+        self.micro.setPipelineWindow(settings['cmdPipelineWindow'])
+        self.micro.setAutoReconnect(settings['autoReconnect'])
+
+        # Log of this board and its index for searches
+        self.logView = ALogView(settings['logMaxLines'])
+        font = QFont()
+        font.setPointSize(10)
+        self.logView.setFont(font)
+        sessionLog = gui.sessionLog
+        self.logIndex = LogIndex(os.path.join(sessionLog.logDir,
+                                              f'{sessionLog.sessionName}-{self.fileTag()}-view.log'))
+
+        # Samples queued by the serial callbacks until the next plot frame
+        self.plotQueue = deque()
+        # Window of the latest samples and the PWM analyzer, created with the
+        # first samples (see startPlotStream)
+        self.plotTimes = None
+        self.plotValues = None
+        self.pwmAnalyzer = None
+        self.oldDigit = 0
+        self.pwmFreq = 0
+        self.pwmDuty = 0
+        self.pwmLogTime = 0
+        self.plotLag = 0
+
+    def fileTag(self):
+        """ Name of the port usable in file names """
+        if self.portName is None:
+            return 'board'
+        return os.path.basename(self.portName).replace(':', '')
+
+    def title(self):
+        """ Title of the session tab """
+        return self.portName or "Log"
+
+    def writeToLog(self, text, color = 'white', kind = None):
+        """ Write a text to the log of this board, white is the default
+            text color of the theme. kind is the command keyword the text
+            answers, app messages are indexed as 'info' or 'error' (red).
+        """
+        self.logView.append(text, None if color == 'white' else color)
+        if kind is None:
+            kind = 'error' if color == 'red' else 'info'
+        self.logIndex.append(text, kind)
+
+    def record(self, direction):
+        """ Direction tag of the session recorder, with the port name """
+        if self.portName is None:
+            return direction
+        return f'{self.portName} {direction}'
+
+    def slotPwmAnalyzed(self, times, periods, freqs, duties):
+        """ Slot to receive the cycles measured by the PWM analyzer """
+        self.pwmFreq = freqs[-1]
+        self.pwmDuty = duties[-1]
+        # Limit the rate of measures written to the log
+        now = time.monotonic()
+        if now - self.pwmLogTime >= self.gui.guiSettings['pwmLogInterval']:
+            self.pwmLogTime = now
+            self.writeToLog(f'Frequency: {self.pwmFreq:.3f}Hz, duty: {self.pwmDuty:.1f}%\n')
+
+    def queueSamples(self, samples):
+        """ Queue (stamp, digit) samples of the PWM monitor for the next plot
+            frame
+        """
+        if not self.gui.plotTimer.isActive():
+            self.gui.startPlotTimer()
+        self.plotQueue.extend(samples)
+
+    def callbackMicroReadData(self, data):
+        """ Callback to receive data read from the microcontroller """
+        # If data comes from PWW monitor feature, it should be displayed in
+        # a plot instead of a text widget.
+        lineType, digit = microProtocol.classifyLine(data.encode())
+        if lineType == 'pwm':
+            if digit != self.oldDigit:
+                self.queueSamples([(time.monotonic(), digit)])
+                self.oldDigit = digit
+
+        elif lineType == 'text': # Any command that is not monitoring
+            self.writeToLog(data, kind = 'rx')
+        self.gui.sessionLog.record(self.record('rx'), data)
+
+    def callbackMicroReadLines(self, lines, stamps, kinds):
+        """ Callback to receive a batch of lines (bytes) read from the
+            microcontroller. Lines are classified from their bytes, only the
+            text written to the log is decoded and consecutive lines answering
+            the same command are written at once.
+        """
+        samplePrefix = microProtocol.samplePrefix
+        data = b''.join(lines)
+        kind = kinds[0] if kinds else None
+        if samplePrefix not in data and kinds.count(kind) == len(kinds):
+            # Text answering a single command (or none), its OKs are cut
+            # out and the rest is decoded and written at once
+            text = microProtocol.okLines.sub(b'', data)
+            if text:
+                self.writeToLog(text.decode('utf-8', 'replace'), kind = kind or 'rx')
+            self.gui.sessionLog.recordLines(self.record('rx'), lines, stamps)
+            return
+
+        knownLines = microProtocol.knownLines
+        textLine = microProtocol.textLine
+        samples = []
+        digit = self.oldDigit
+        logText = []
+        logKind = None
+        for line, stamp, kind in zip(lines, stamps, kinds):
+            known = knownLines.get(line)
+            if known is None:
+                # Samples and OKs with other spacing are parsed, the rest is text
+                if line.startswith(samplePrefix) or line.strip() == b'OK':
+                    known = microProtocol.classifyLine(line)
+                else:
+                    known = textLine
+            lineType, value = known
+            if lineType == 'pwm':
+                # Only changes of the level are plotted
+                if value != digit:
+                    samples.append((stamp, value))
+                    digit = value
+            elif lineType == 'text':
+                # Lines not answering a command are indexed as 'rx'
+                kind = kind or 'rx'
+                if kind != logKind and logText:
+                    self.writeToLog(b''.join(logText).decode('utf-8', 'replace'), kind = logKind)
+                    logText = []
+                logKind = kind
+                logText.append(line)
+        if samples:
+            self.queueSamples(samples)
+            self.oldDigit = digit
+        if logText:
+            self.writeToLog(b''.join(logText).decode('utf-8', 'replace'), kind = logKind)
+        # Lines are decoded by the recorder thread
+        self.gui.sessionLog.recordLines(self.record('rx'), lines, stamps)
+
+    def callbackMicroWriteData(self, data, stamp):
+        """ Callback to receive commands written to the microcontroller """
+        self.gui.sessionLog.record(self.record('tx'), data, stamp)
+
+    def callbackMicroConnectState(self, state, elapsed, detail):
+        """ Callback to receive the progress of a connection """
+        if state == 'opening':
+            self.status = ("Serial device: opening...", 'white', "#FFB347")
+        elif state == 'handshake':
+            self.status = ("Serial device: waiting for ping...", 'white', "#FFB347")
+        elif state == 'info':
+            self.status = ("Serial device: reading version...", 'white', "#FFB347")
+        elif state == 'ready':
+            self.status = (f'Serial device: connected (ready in {elapsed * 1000:.0f} ms)',
+                           "#77DD77", "#77DD77")
+            self.writeToLog(f'Microcontroller connected, ready in {elapsed * 1000:.0f} ms '
+                            f'(round trip {detail})\n', "#77DD77")
+            # Time to the first board connected
+            if startupTrace.mark('connected'):
+                startupTrace.write()
+        elif state == 'noResponse':
+            self.status = ("Serial device: not responding", "red", "#FF0000")
+            self.writeToLog("Microcontroller not responding\n", "red")
+        elif state == 'failed':
+            self.status = ("Serial device: disconnected", 'white', "#555555")
+            self.gui.sessionStatusChanged(self)
+            self.gui.showErrorMessage(f'Error{detail}')
+            return
+        self.gui.sessionStatusChanged(self)
+
+    def callbackMicroConnectionLost(self, error):
+        """ Callback to receive the device lost, it is reopened as soon as it
+            is plugged in again.
+        """
+        self.status = ("Serial device: reconnecting", "#FFB347", "#FFB347")
+        self.writeToLog(f'Connection lost ({error}), reconnecting...\n', 'red')
+        self.gui.sessionStatusChanged(self)
+
+    def callbackMicroReconnected(self, reconnects, downtime):
+        """ Callback to receive the device reconnected with its state """
+        totalDowntime = self.micro.getReconnectStats()[1]
+        self.status = ("Serial device: connected", "#77DD77", "#77DD77")
+        self.writeToLog(f'Reconnected after {downtime * 1000:.0f} ms '
+                        f'({reconnects} reconnections, {totalDowntime:.1f} s down)\n', "#77DD77")
+        self.gui.sessionStatusChanged(self)
+
+    def startPlotStream(self):
+        """ Create the sample window and the analyzer, numpy is loaded by
+            the first session that receives samples.
+        """
+        from ringBuffer import RingBuffer
+        from pwmAnalyzer import ThreadPwmAnalyzer
+        windowSize = self.gui.guiSettings['plotWindowSize']
+        # Fixed size window of the latest samples and their times
+        self.plotTimes = RingBuffer(windowSize)
+        self.plotValues = RingBuffer(windowSize)
+        # Frequency and duty cycle are measured in a separate thread
+        self.pwmAnalyzer = ThreadPwmAnalyzer()
+        self.pwmAnalyzer.signalResult.connect(self.slotPwmAnalyzed)
+
+    def plotSize(self):
+        """ Number of samples in the plot window """
+        if self.plotTimes is None:
+            return 0
+        return len(self.plotTimes)
+
+    def takeSamples(self):
+        """ Move the samples queued since the previous frame to the plot
+            window and the analyzer. Returns the stamp of the newest sample or
+            None if there were no samples.
+        """
+        samples = [self.plotQueue.popleft() for i in range(len(self.plotQueue))]
+        if not samples:
+            return None
+        if self.plotTimes is None:
+            self.startPlotStream()
+        stamps, digits = zip(*samples)
+        self.plotTimes.extend(stamps)
+        self.plotValues.extend(digits)
+        self.pwmAnalyzer.put(stamps, digits)
+        # How far the display is behind the acquisition of the newest sample
+        self.plotLag = time.monotonic() - stamps[-1]
+        return stamps[-1]
+
+    def resetPlot(self):
+        """ Discard the samples of the plot stream """
+        self.plotQueue.clear()
+        if self.plotTimes is not None:
+            self.plotTimes.clear()
+            self.plotValues.clear()
+            self.pwmAnalyzer.reset()
+        self.oldDigit = 0
+        self.pwmFreq = 0
+        self.pwmDuty = 0
+
+    def close(self):
+        """ Close the serial port, the log is kept """
+        if self.micro.isOpen():
+            self.micro.close()
+        self.resetPlot()
+
+    def release(self):
+        """ Close the session for good """
+        self.close()
+        if self.pwmAnalyzer is not None:
+            self.pwmAnalyzer.stop()
+        # The log is kept by the session recorder, the indexed copy is only
+        # needed for searches while the session is open
+        self.logIndex.remove()
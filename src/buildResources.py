@@ -0,0 +1,56 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: buildResources.py
+    Description: Packs the icons of img/ into img/resources.bundle, the
+                 resource bundle read at once by AIcons. The bundle is an
+                 uncompressed zip (PNG files are already compressed) with
+                 fixed dates, so packing the same images gives the same file.
+                 build.bat runs it before building the executable, the bundle
+                 is not kept in git. Run from the sources, the app reads the
+                 images from their files when the bundle is missing; after
+                 changing an image, run it again or delete the bundle. --check
+                 lists the images changed after the bundle was built.
+
+                 Usage: python src/buildResources.py [--check]
+"""
+
+import os
+import sys
+import zipfile
+from appClasses import AIcons
+
+def build(imgDir = None):
+    """ Write the bundle and return its path and the number of files """
+    imgDir = imgDir or AIcons.imgDir()
+    bundlePath = os.path.join(imgDir, AIcons.bundleName)
+    fileNames = sorted(set(AIcons.iconFiles.values()))
+    with zipfile.ZipFile(bundlePath, 'w', zipfile.ZIP_STORED) as bundle:
+        for fileName in fileNames:
+            with open(os.path.join(imgDir, fileName), 'rb') as file:
+                data = file.read()
+            bundle.writestr(zipfile.ZipInfo(fileName, date_time = (1980, 1, 1, 0, 0, 0)), data)
+    return bundlePath, len(fileNames)
+
+def staleImages(imgDir = None):
+    """ Return the images changed after the bundle was built, every image
+        when there is no bundle
+    """
+    imgDir = imgDir or AIcons.imgDir()
+    bundlePath = os.path.join(imgDir, AIcons.bundleName)
+    fileNames = sorted(set(AIcons.iconFiles.values()))
+    if not os.path.exists(bundlePath):
+        return fileNames
+    bundleTime = os.path.getmtime(bundlePath)
+    return [fileName for fileName in fileNames
+            if os.path.getmtime(os.path.join(imgDir, fileName)) > bundleTime]
+
+if __name__ == '__main__':
+    if '--check' in sys.argv:
+        stale = staleImages()
+        for fileName in stale:
+            print(f'{fileName} is newer than {AIcons.bundleName}')
+        sys.exit(1 if stale else 0)
+    bundlePath, count = build()
+    print(f'{count} images packed into {os.path.normpath(bundlePath)} '
+          f'({os.path.getsize(bundlePath)} bytes)')
@@ -0,0 +1,194 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: fleet.py
+    Description: Broadcast of command sequences to many boards at once, e.g.
+                 on a production line. Every board has its own Micro and I/O
+                 thread, so commands are queued to all boards at the same
+                 time and a broadcast takes about as long as the slowest
+                 board. Replies, latencies, failures and stragglers are
+                 collected in one result table.
+
+                 Usage: python src/fleet.py --ports PORT [PORT ...]
+                        --cmd "rtc-s 12 0 0" --cmd "pwm-f 1000" [--baud B]
+                        [--timeout S] [--deadline S]
+"""
+
+import argparse
+import concurrent.futures
+import statistics
+import time
+from micro import Micro
+
+class FleetResult():
+    """ Replies of a broadcast. Each row is (board, cmd, status, reply,
+        latency), latency being the seconds from the start of the broadcast
+        until the reply arrived. Status is 'ok', 'error' (the board answered
+        with an error), 'timeout', 'failed' (port error) or 'pending' (no
+        reply before the deadline).
+    """
+    # A board is a straggler when it takes this many times the median board
+    stragglerFactor = 2.0
+    # Replies of the firmware to invalid commands
+    errorPrefixes = ('Error', 'Unknown command')
+
+    def __init__(self, boards, cmds, elapsed):
+        self.boards = boards
+        self.cmds = cmds
+        self.elapsed = elapsed
+        self.rows = []
+        # Seconds each board took to answer its whole sequence, None if it
+        # did not finish before the deadline
+        self.boardTimes = {}
+
+    def addRow(self, board, cmd, status, reply, latency):
+        self.rows.append((board, cmd, status, reply, latency))
+
+    def failures(self):
+        """ Return the rows that did not end with an ok reply """
+        return [row for row in self.rows if row[2] != 'ok']
+
+    def failedBoards(self):
+        """ Return the boards with any command not answered ok """
+        return sorted({row[0] for row in self.failures()})
+
+    def stragglers(self):
+        """ Return the boards that did not finish or took much longer than
+            the median board.
+        """
+        times = [t for t in self.boardTimes.values() if t is not None]
+        median = statistics.median(times) if times else 0
+        return sorted(board for board, t in self.boardTimes.items()
+                      if t is None or t > median * self.stragglerFactor)
+
+    def replies(self, cmd):
+        """ Return the reply of each board to a command of the sequence """
+        return {row[0]: row[3] for row in self.rows if row[1] == cmd.strip()}
+
+    def table(self):
+        """ Return the result table as text """
+        width = max([len('Board')] + [len(board) for board in self.boards])
+        lines = [f'{"Board":<{width}}  {"Command":<16}  {"Status":<8}  {"Latency":>9}  Reply']
+        for board, cmd, status, reply, latency in self.rows:
+            latencyText = '-' if latency is None else f'{latency * 1000:.1f} ms'
+            lines.append(f'{board:<{width}}  {cmd:<16}  {status:<8}  '
+                         f'{latencyText:>9}  {" | ".join(reply)}')
+        lines.append(f'{len(self.boards)} boards, {len(self.failedBoards())} failed, '
+                     f'stragglers: {", ".join(self.stragglers()) or "none"}, '
+                     f'wall time {self.elapsed * 1000:.1f} ms')
+        return '\n'.join(lines)
+
+class Fleet():
+    """ A set of boards addressed by name. Boards are opened by the fleet or
+        added with an already opened Micro (e.g. the GUI sessions).
+    """
+
+    def __init__(self):
+        self.micros = {}
+        # Boards opened by the fleet, they are closed by close()
+        self.owned = set()
+
+    def add(self, name, micro):
+        """ Add an opened board """
+        self.micros[name] = micro
+
+    def open(self, ports, baud = 115200, dataLen = 8, parity = 'N', stopBits = 1,
+             pipelineWindow = 4):
+        """ Open a list of ports, boards are named after their port. Returns
+            a dictionary with the exception of each port that failed to open.
+        """
+        errors = {}
+        for port in ports:
+            micro = Micro(callbackDataRead = None)
+            micro.setPipelineWindow(pipelineWindow)
+            try:
+                micro.open(port, baud, dataLen, parity, stopBits)
+            except Exception as e:
+                errors[port] = e
+                continue
+            self.micros[port] = micro
+            self.owned.add(port)
+        return errors
+
+    def close(self):
+        """ Close the boards opened by the fleet """
+        for name in self.owned:
+            self.micros.pop(name).close()
+        self.owned.clear()
+
+    def names(self):
+        return list(self.micros)
+
+    def broadcast(self, cmds, timeout = 1, deadline = None):
+        """ Send a sequence of commands to every board and wait for the
+            replies. Commands of a board are sent in order, all boards run at
+            the same time. timeout is the time each command may wait for its
+            reply and deadline the most the whole broadcast waits (by default
+            as long as the sequence can take).
+        """
+        cmds = [cmd if cmd.endswith('\n') else cmd + '\n' for cmd in cmds]
+        if deadline is None:
+            deadline = timeout * len(cmds) + timeout
+
+        start = time.monotonic()
+        doneTimes = {}
+        futures = {}
+        for name, micro in self.micros.items():
+            boardFutures = []
+            for cmd in cmds:
+                try:
+                    future = micro.request(cmd, timeout)
+                except Exception as e:
+                    future = concurrent.futures.Future()
+                    future.set_exception(e)
+                # Reply times are taken when the I/O thread resolves them
+                future.add_done_callback(lambda f: doneTimes.setdefault(id(f), time.monotonic()))
+                boardFutures.append(future)
+            futures[name] = boardFutures
+
+        allFutures = [future for boardFutures in futures.values() for future in boardFutures]
+        concurrent.futures.wait(allFutures, timeout = deadline)
+        result = FleetResult(list(self.micros), cmds, time.monotonic() - start)
+
+        for name, boardFutures in futures.items():
+            boardTime = 0
+            for cmd, future in zip(cmds, boardFutures):
+                cmd = cmd.strip()
+                if not future.done():
+                    result.addRow(name, cmd, 'pending', [], None)
+                    boardTime = None
+                    continue
+                # The callback may still be running right after wait() returns
+                latency = doneTimes.get(id(future), time.monotonic()) - start
+                if boardTime is not None:
+                    boardTime = max(boardTime, latency)
+                error = future.exception()
+                if isinstance(error, TimeoutError):
+                    result.addRow(name, cmd, 'timeout', [], latency)
+                elif error is not None:
+                    result.addRow(name, cmd, 'failed', [str(error)], latency)
+                else:
+                    reply = future.result()
+                    status = 'ok'
+                    if any(line.startswith(FleetResult.errorPrefixes) for line in reply):
+                        status = 'error'
+                    result.addRow(name, cmd, status, reply, latency)
+            result.boardTimes[name] = boardTime
+        return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Broadcast commands to many boards")
+    parser.add_argument('--ports', nargs = '+', required = True, help = "Serial ports of the boards")
+    parser.add_argument('--cmd', action = 'append', required = True, help = "Command to send, in order")
+    parser.add_argument('--baud', type = int, default = 115200, help = "Baud rate of the boards")
+    parser.add_argument('--timeout', type = float, default = 1, help = "Seconds to wait for each reply")
+    parser.add_argument('--deadline', type = float, default = None, help = "Seconds to wait for all boards")
+    args = parser.parse_args()
+
+    fleet = Fleet()
+    for port, error in fleet.open(args.ports, args.baud).items():
+        print(f'{port}: {error}')
+    try:
+        print(fleet.broadcast(args.cmd, args.timeout, args.deadline).table())
+    finally:
+        fleet.close()
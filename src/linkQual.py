@@ -0,0 +1,322 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: linkQual.py
+    Description: Link qualification of a serial port. The baud rate the board
+                 answers on is found with a short ping at each candidate rate,
+                 then the round trip time, throughput and error rate are
+                 measured at that rate and at the higher ones with a load of
+                 commands whose replies are known. The fastest stable rate is
+                 recommended.
+
+                 Usage: python src/linkQual.py --port PORT [--rates R [R ...]]
+                        [--load S] [--sim]
+"""
+
+import argparse
+import statistics
+import time
+import serial
+from PyQt5.QtCore import QThread, pyqtSignal
+
+import microProtocol
+
+class LinkMeasure():
+    """ Measures of a link at one baud rate """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.answers = False
+        self.rtt = None
+        self.rttP95 = None
+        # Blocks of the load sent, answered with the expected reply, answered
+        # with a corrupted reply and never answered
+        self.sent = 0
+        self.good = 0
+        self.bad = 0
+        self.lost = 0
+        # Bytes per second of good replies and their fraction of the line rate
+        # (10 bits per byte)
+        self.throughput = 0
+        self.efficiency = 0
+
+    def errorRate(self):
+        if not self.sent:
+            return 1.0 if self.answers else None
+        return (self.bad + self.lost) / self.sent
+
+    def stable(self, maxErrorRate):
+        """ The board answered and the load had no losses and few errors """
+        return (self.answers and self.sent > 0 and self.lost == 0
+                and self.errorRate() <= maxErrorRate)
+
+class LinkReport():
+    """ Measures of all rates tried and the rate recommended """
+
+    def __init__(self, port, foundRate, measures, recommended):
+        self.port = port
+        self.foundRate = foundRate
+        self.measures = measures
+        self.recommended = recommended
+
+    def table(self):
+        """ Return the report as text """
+        lines = [f'{"Baud":>7}  {"RTT":>8}  {"RTT p95":>8}  {"Bytes/s":>8}  '
+                 f'{"Eff":>5}  {"Errors":>7}  Blocks (good/bad/lost)']
+        for m in self.measures:
+            if not m.answers:
+                lines.append(f'{m.rate:>7}  no answer')
+                continue
+            lines.append(f'{m.rate:>7}  {m.rtt * 1000:>5.1f} ms  {m.rttP95 * 1000:>5.1f} ms  '
+                         f'{m.throughput:>8.0f}  {m.efficiency:>5.0%}  {m.errorRate():>7.2%}  '
+                         f'{m.sent} ({m.good}/{m.bad}/{m.lost})')
+        if self.foundRate is None:
+            lines.append(f'{self.port}: the board does not answer at any baud rate')
+        else:
+            lines.append(f'{self.port}: answers at {self.foundRate}, '
+                         f'recommended {self.recommended}')
+        return '\n'.join(lines)
+
+class LinkQualifier():
+    """ Qualification of the link to the board of a port. The port must not
+        be opened by anything else while it runs.
+    """
+    # Seconds to wait for the answer to ping while looking for the baud rate
+    probeTimeout = 0.15
+    probeAttempts = 2
+    # Pings to measure the round trip time
+    rttSamples = 20
+    # Seconds of load at each rate and most blocks in flight
+    loadTime = 0.5
+    loadWindow = 8
+    # Most (corrupted + lost) / sent blocks of a stable rate
+    maxErrorRate = 0.001
+    # A block of the load is a command with a known reply closed by ping,
+    # its OK ends the block
+    loadCmd = microProtocol.cmds['help']
+    maxBlockBytes = 2048
+
+    def __init__(self, port, dataLen = 8, parity = 'N', stopBits = 1, rates = None,
+                 callbackProgress = None):
+        self.port = port
+        self.dataLen = int(dataLen)
+        self.parity = {'odd': 'O', 'even': 'E'}.get(parity.lower(), 'N')
+        self.stopBits = int(stopBits)
+        self.rates = sorted(int(rate) for rate in (rates or microProtocol.baudRates))
+        self.callbackProgress = callbackProgress
+        self.serialDev = None
+        self.expectedBlock = None
+
+    def progress(self, text):
+        if self.callbackProgress is not None:
+            self.callbackProgress(text)
+
+    def open(self):
+        self.serialDev = serial.serial_for_url(self.port,
+                                               baudrate = self.rates[0],
+                                               bytesize = self.dataLen,
+                                               parity = self.parity,
+                                               stopbits = self.stopBits,
+                                               timeout = self.probeTimeout)
+
+    def close(self):
+        if self.serialDev is not None:
+            self.serialDev.close()
+            self.serialDev = None
+
+    def setRate(self, rate):
+        """ Switch the open port to a baud rate and drop what was read at
+            the previous one.
+        """
+        self.serialDev.baudrate = rate
+        self.serialDev.reset_input_buffer()
+
+    def ping(self, timeout):
+        """ Return the round trip time of a ping or None without an answer """
+        self.serialDev.reset_input_buffer()
+        sentTime = time.monotonic()
+        self.serialDev.write(microProtocol.cmds['ping'].encode())
+        deadline = sentTime + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self.serialDev.timeout = remaining
+            if self.serialDev.readline().strip() == b'OK':
+                return time.monotonic() - sentTime
+
+    def probe(self, rate):
+        """ Return True if the board answers ping at a baud rate """
+        self.setRate(rate)
+        for attempt in range(self.probeAttempts):
+            if self.ping(self.probeTimeout) is not None:
+                return True
+        return False
+
+    def findBaud(self, preferred = 115200):
+        """ Return the baud rate the board answers on or None. The preferred
+            rate is tried first, then the rest from the fastest.
+        """
+        candidates = sorted(self.rates, reverse = True)
+        if preferred in candidates:
+            candidates.remove(preferred)
+            candidates.insert(0, preferred)
+        for rate in candidates:
+            self.progress(f'Probing {rate}...')
+            if self.probe(rate):
+                return rate
+        return None
+
+    def readBlock(self, timeout):
+        """ Read the lines up to the next OK, returns None on timeout """
+        lines = []
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self.serialDev.timeout = remaining
+            line = self.serialDev.readline()
+            if not line.endswith(b'\n'):
+                continue
+            if line.strip() == b'OK':
+                return b''.join(lines)
+            lines.append(line)
+
+    def learnBlock(self, rate):
+        """ Read the reply to a load block at a rate known to work """
+        self.setRate(rate)
+        self.serialDev.write((self.loadCmd + microProtocol.cmds['ping']).encode())
+        # Time for a reply of up to maxBlockBytes on the wire
+        self.expectedBlock = self.readBlock(0.5 + self.maxBlockBytes * 10 / rate)
+        if self.expectedBlock is None:
+            raise serial.SerialException(f'No reply to {self.loadCmd.strip()} at {rate}')
+
+    def measure(self, rate):
+        """ Measure the link at a baud rate """
+        m = LinkMeasure(rate)
+        self.setRate(rate)
+        m.answers = self.probe(rate)
+        if not m.answers:
+            return m
+
+        # Round trip time of pings one at a time
+        rtts = []
+        for i in range(self.rttSamples):
+            rtt = self.ping(self.probeTimeout * 2)
+            if rtt is not None:
+                rtts.append(rtt)
+        if not rtts:
+            m.answers = False
+            return m
+        rtts.sort()
+        m.rtt = statistics.median(rtts)
+        m.rttP95 = rtts[min(len(rtts) - 1, int(len(rtts) * 0.95))]
+
+        # Pipelined load, the window is cut at low rates so the replies in
+        # flight take a fraction of the load time on the wire
+        block = (self.loadCmd + microProtocol.cmds['ping']).encode()
+        blockBytes = len(self.expectedBlock) + len(b'OK\r\n')
+        wireTime = blockBytes * 10 / rate
+        window = max(1, min(self.loadWindow, int(self.loadTime / 4 / wireTime)))
+        timeout = m.rttP95 * 2 + wireTime * window * 2 + 0.1
+        self.serialDev.reset_input_buffer()
+        start = time.monotonic()
+        inFlight = 0
+        goodBytes = 0
+        while True:
+            sending = time.monotonic() - start < self.loadTime or m.sent == 0
+            while sending and inFlight < window:
+                self.serialDev.write(block)
+                m.sent += 1
+                inFlight += 1
+            if not inFlight:
+                break
+            reply = self.readBlock(timeout)
+            if reply is None:
+                # Whatever is still in flight is lost
+                m.lost += inFlight
+                break
+            inFlight -= 1
+            if reply == self.expectedBlock:
+                m.good += 1
+                goodBytes += blockBytes
+            else:
+                m.bad += 1
+        elapsed = time.monotonic() - start
+        m.throughput = goodBytes / elapsed
+        m.efficiency = m.throughput / (rate / 10)
+        return m
+
+    def qualify(self, preferred = 115200):
+        """ Find the baud rate of the board, measure it and the higher rates
+            and return a LinkReport. The port is left closed.
+        """
+        self.open()
+        try:
+            foundRate = self.findBaud(preferred)
+            if foundRate is None:
+                return LinkReport(self.port, None, [], None)
+            self.learnBlock(foundRate)
+            measures = []
+            for rate in self.rates:
+                if rate < foundRate:
+                    continue
+                self.progress(f'Measuring {rate}...')
+                m = self.measure(rate)
+                measures.append(m)
+                # A board answers on a single rate unless it follows the
+                # host (USB CDC), then the link degrades as the rate goes up
+                if not m.answers:
+                    break
+            stable = [m.rate for m in measures if m.stable(self.maxErrorRate)]
+            recommended = max(stable) if stable else foundRate
+            return LinkReport(self.port, foundRate, measures, recommended)
+        finally:
+            self.close()
+
+class ThreadLinkQual(QThread):
+    """ Runs a link qualification without blocking the GUI """
+    signalProgress = pyqtSignal(str)
+    # LinkReport, or the exception that stopped the qualification
+    signalDone = pyqtSignal(object)
+
+    def __init__(self, port, dataLen, parity, stopBits, preferred = 115200):
+        super().__init__()
+        self.preferred = preferred
+        self.qualifier = LinkQualifier(port, dataLen, parity, stopBits,
+                                       callbackProgress = self.signalProgress.emit)
+
+    def run(self):
+        try:
+            report = self.qualifier.qualify(self.preferred)
+        except Exception as e:
+            report = e
+        self.signalDone.emit(report)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Find and qualify the baud rate of a board")
+    parser.add_argument('--port', help = "Serial port of the board")
+    parser.add_argument('--rates', nargs = '+', default = None, help = "Baud rates to try")
+    parser.add_argument('--load', type = float, default = LinkQualifier.loadTime,
+                        help = "Seconds of load at each rate")
+    parser.add_argument('--sim', action = 'store_true',
+                        help = "Qualify a simulator following the host baud rate "
+                               "and corrupting bytes above 115200")
+    args = parser.parse_args()
+
+    pty = None
+    if args.sim:
+        from microSim import MicroSimulator, SimPty
+        pty = SimPty(MicroSimulator(baudrate = None, wireSpeed = True, maxCleanBaud = 115200))
+        args.port = pty.port
+    if args.port is None:
+        parser.error("--port or --sim is required")
+
+    LinkQualifier.loadTime = args.load
+    qualifier = LinkQualifier(args.port, rates = args.rates, callbackProgress = print)
+    try:
+        print(qualifier.qualify().table())
+    finally:
+        if pty is not None:
+            pty.close()
@@ -0,0 +1,187 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: logIndex.py
+    Description: Indexed store of the log text. Lines are appended to a file
+                 and indexed as they arrive: the offset where each line
+                 starts and the kind of message of each line (the command
+                 it answers, see microProtocol.replyLines). Searches run over
+                 a memory map of the file.
+"""
+
+import mmap
+import os
+import re
+from array import array
+from bisect import bisect_right
+
+class LogIndex():
+    """ Append only log store with a line offset index and a per kind
+        index. Lines are numbered from 0 in the order they were appended.
+    """
+    # Kind of lines written by the application itself
+    defaultKind = 'info'
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+        self.file = open(path, 'wb+', buffering = 256 * 1024)
+        self.size = 0
+        # Offset of the first byte of each line
+        self.lineStarts = array('Q')
+        # Kind id of each line and line numbers of each kind
+        self.lineKinds = array('H')
+        self.kindIds = {}
+        self.kindNames = []
+        self.kindLines = []
+        # The last line appended has no line terminator yet
+        self.lineOpen = False
+        self.map = None
+        self.mapSize = 0
+
+    def __len__(self):
+        return len(self.lineStarts)
+
+    def kindId(self, kind):
+        id = self.kindIds.get(kind)
+        if id is None:
+            id = len(self.kindNames)
+            self.kindIds[kind] = id
+            self.kindNames.append(kind)
+            self.kindLines.append(array('L'))
+        return id
+
+    def kinds(self):
+        """ Return the kinds of lines seen so far """
+        return list(self.kindNames)
+
+    def append(self, text, kind = None):
+        """ Append text and index the lines it starts. Text continuing a
+            line without terminator keeps the kind of that line.
+        """
+        if not text:
+            return
+        # Lines are stored with '\n' terminators only, so '$' of a regex
+        # matches at the end of every line
+        data = text.replace('\r\n', '\n').encode('utf-8', 'replace')
+        kindId = self.kindId(kind or self.defaultKind)
+        kindLines = self.kindLines[kindId]
+
+        # New lines start after every line terminator of the text, and at
+        # the start of the text when the previous line was terminated
+        start = 0
+        if self.lineOpen:
+            start = data.find(b'\n') + 1
+            if start == 0:
+                self.file.write(data)
+                self.size += len(data)
+                return
+        end = len(data)
+        while start < end:
+            kindLines.append(len(self.lineStarts))
+            self.lineStarts.append(self.size + start)
+            self.lineKinds.append(kindId)
+            start = data.find(b'\n', start) + 1
+            if start == 0:
+                break
+        self.lineOpen = not data.endswith(b'\n')
+        self.file.write(data)
+        self.size += len(data)
+
+    def mapFile(self):
+        """ Return a memory map of the file with everything appended """
+        self.file.flush()
+        if self.map is None or self.mapSize != self.size:
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+            if self.size == 0:
+                return None
+            self.map = mmap.mmap(self.file.fileno(), self.size, access = mmap.ACCESS_READ)
+            self.mapSize = self.size
+        return self.map
+
+    def lineEnd(self, number):
+        if number + 1 < len(self.lineStarts):
+            return self.lineStarts[number + 1]
+        return self.size
+
+    def line(self, number):
+        """ Return the text of a line """
+        map = self.mapFile()
+        if map is None or number < 0 or number >= len(self.lineStarts):
+            raise Exception(f'Invalid line number {number}')
+        return map[self.lineStarts[number]:self.lineEnd(number)].decode('utf-8', 'replace').rstrip('\r\n')
+
+    def lineOf(self, offset):
+        """ Return the number of the line holding a byte offset """
+        return bisect_right(self.lineStarts, offset) - 1
+
+    def search(self, pattern = '', isRegex = False, ignoreCase = False, kinds = None,
+               maxHits = 1000):
+        """ Return the numbers of the lines matching a substring or regular
+            expression, and of one of the kinds given (any kind if None).
+            An empty pattern matches every line of the kinds given.
+        """
+        kindIds = None
+        if kinds is not None:
+            kindIds = {self.kindIds[kind] for kind in kinds if kind in self.kindIds}
+            if not kindIds:
+                return []
+        if not pattern:
+            if kindIds is None:
+                return list(range(min(maxHits, len(self.lineStarts))))
+            # Lines of the kinds given, straight from the kind index
+            if len(kindIds) == 1:
+                return list(self.kindLines[kindIds.pop()][:maxHits])
+            lines = sorted(line for id in kindIds for line in self.kindLines[id][:maxHits])
+            return lines[:maxHits]
+
+        map = self.mapFile()
+        if map is None:
+            return []
+        hits = []
+        if isRegex or ignoreCase:
+            expression = pattern.encode('utf-8') if isRegex else re.escape(pattern.encode('utf-8'))
+            flags = re.MULTILINE | (re.IGNORECASE if ignoreCase else 0)
+            regex = re.compile(expression, flags)
+            # Every line is matched on its own, a match never spans lines
+            regex = re.compile(rb'^[^\n]*?(?:' + regex.pattern + rb')', flags)
+            matches = (match.start() for match in regex.finditer(map))
+        else:
+            needle = pattern.encode('utf-8')
+            matches = self.findAll(map, needle)
+
+        for offset in matches:
+            number = self.lineOf(offset)
+            if kindIds is None or self.lineKinds[number] in kindIds:
+                hits.append(number)
+                if len(hits) >= maxHits:
+                    break
+        return hits
+
+    def findAll(self, map, needle):
+        """ Yield the offset of the first match of needle in each line """
+        position = map.find(needle)
+        while position >= 0:
+            yield position
+            # Continue on the next line, one hit per line is enough
+            nextLine = map.find(b'\n', position)
+            if nextLine < 0:
+                return
+            position = map.find(needle, nextLine + 1)
+
+    def close(self):
+        """ Close the store, the file is kept """
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def remove(self):
+        """ Close the store and delete its file """
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            print(f'Error: {e}')
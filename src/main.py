@@ -8,30 +8,25 @@
 
 # Built-in modules
 import os
-import queue
-import time
+import threading
+
+# Imports are timed from here when the start up trace is enabled
+import startupTrace
+startupTrace.enableFromEnvironment()
 
 # PyQT modules
 from PyQt5.QtWidgets import (QApplication, QMenuBar, QToolBar, QWidget, QGridLayout,
-                             QFrame, QFileDialog, QMessageBox,QStatusBar
+                             QFrame, QFileDialog, QMessageBox,QStatusBar, QLabel, QTabWidget
                              )
 from PyQt5.QtCore import Qt, pyqtSlot, QTimer, QSize
-from PyQt5.QtGui import QIcon, QFont, QTextCharFormat, QColor, QTextCursor
+from PyQt5.QtGui import QIcon, QFont
 
 # User defined modules
-from appClasses import AppMainWindow, AWidgets, ASettings, APlot
-from micro import Micro
-
-# Serial communication modules
-import serial
-import serial.tools.list_ports
-
-# Matplot modules
-from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-
-# Utilities
-import numpy as np
+from appClasses import AppMainWindow, AWidgets, ASettings, APlot, ALogSearch, AIcons
+from boardSession import BoardSession
+from sessionLog import SessionRecorder
+from portWatcher import ThreadPortWatcher
+from linkQual import ThreadLinkQual
 
 # Window size
 APP_WIDTH = 1000
@@ -55,55 +50,120 @@ class GuiCli(AppMainWindow):
                    'frameGeneralInfoHeight': 180,
                    'frameRtcHeight': 150,
                    'framePwmHeight': 230,
+                   'rxBatchInterval': 0.016,
+                   'rxBatchMaxLines': 256,
+                   'cmdPipelineWindow': 4,
+                   'plotWindowSize': 500,
+                   'plotFrameRate': 30,
+                   'plotIdleFrames': 30,
+                   'plotPreloadDelay': 1.0, # None to import the plot modules on first use
+                   'pwmLogInterval': 1.0,
+                   'logMaxLines': 20000,
+                   'sessionLogDir': 'logs',
+                   'sessionLogMaxBytes': 16 * 1024 * 1024,
+                   'sessionLogMaxSeconds': 3600,
+                   'sessionLogCompression': 'none', # 'none', 'gzip' or 'zstd'
+                   'autoReconnect': True,
                   }
-    # All widgets are tracked so that a new theme can be applied to them
-    listWidgets = {
-                   'frame':[],
-                   'button': [],
-                   'line': [],
-                   'label':[],
-                   'combobox':[],
-                   'textBox':[],
-                   'text':[],
-                   'toolbar':[],
-                   }
-    pwmYValues = []
-    yValues = []
-    t = 0
-    threadStarted = False
     plotTimer = None
-    plotYValues = []
-    isMonitoring = False
-    oldDigit = 0
+    plotIdleFrames = 0
+    # The current session must be drawn even with no new samples
+    plotDirty = False
+    # Board sessions, in the order of their log tabs, and the one the
+    # control frame targets
+    sessions = []
+    session = None
+
+    @property
+    def micro(self):
+        """ Micro of the current board session """
+        return self.session.micro
+
+    @property
+    def textBoxLog(self):
+        """ Log view of the current board session """
+        return self.session.logView
+
+    @property
+    def plotLag(self):
+        """ Display lag of the current board session """
+        return self.session.plotLag
 
     def slotPlotTimerTimeOut(self):
-        """ Slot for catching the timer timeout """
-        if not self.plotQueue.qsize() == 0:
-            newDigit = self.plotQueue.get()
-            if len(self.plotYValues) > 500:
-                self.plotYValues = self.plotYValues[25:]
-            [self.plotYValues.append(newDigit) for i in range(0, 25)]
-            # # Create X list with linspace values
-            plotXValues = np.linspace(0, 10, len(self.plotYValues))
-            self.writeToPlot(plotXValues, self.plotYValues)
+        """ Slot for catching the timer timeout. The samples received by
+            every session since the previous frame are taken and analyzed,
+            only the current session is drawn.
+        """
+        received = False
+        for session in self.sessions:
+            if session.takeSamples() is not None:
+                received = True
+
+        # Nothing changed, the frame is skipped and the timer is stopped
+        # after a while so no CPU is used when no samples are arriving
+        if not received and not self.plotDirty:
+            self.plotIdleFrames += 1
+            if self.plotIdleFrames >= self.guiSettings['plotIdleFrames']:
+                self.plotTimer.stop()
+            return
+        self.plotIdleFrames = 0
+        self.plotDirty = False
+
+        session = self.session
+        if session.plotSize() > 1:
+            # Times are shown relative to the newest sample so the x
+            # limits stay the same while the signal scrolls
+            self.writeToPlot(session.plotTimes.latestRelative(), session.plotValues.latest())
+        self.updatePlotStatus()
+
+    def updatePlotStatus(self):
+        """ Show the measures of the current session in the status bar """
+        session = self.session
+        if session.plotSize() == 0 or self.aplot is None:
+            self.labelPlotStatus.setText("")
+            return
+        self.labelPlotStatus.setText(f'Freq: {session.pwmFreq:.3f}Hz, '
+                                     f'duty: {session.pwmDuty:.1f}% | '
+                                     f'Plot: {self.aplot.getFps():.0f} fps, '
+                                     f'lag {session.plotLag * 1000:.0f} ms')
 
     def startPlotTimer(self):
-        """ Start a timer for plotting data """
+        """ Start a timer for plotting data at the configured frame rate """
         if self.plotTimer is not None:
-            self.plotTimer.start(1)
+            self.plotIdleFrames = 0
+            self.plotTimer.start(int(1000 / self.guiSettings['plotFrameRate']))
 
-    def stopPlotTimer(self):
-        """ Stop the plot timer """
+    def stopPlotTimer(self, session = None):
+        """ Discard the samples of a session (of every session if None).
+            The timer is shared, it stops when no other session is
+            monitoring.
+        """
+        stopped = self.sessions if session is None else [session]
+        for stoppedSession in stopped:
+            stoppedSession.resetPlot()
         if self.plotTimer is not None:
-            self.plotTimer.stop()
-            self.plotYValues = []
+            if not any(other.micro.isMonitoring for other in self.sessions
+                       if other not in stopped):
+                self.plotTimer.stop()
+            self.plotDirty = True
+        self.updatePlotStatus()
 
     def __init__(self, title, w, h):
         super().__init__()
+        startupTrace.mark('imported')
         self.appRootPath = os.getcwd()
 
-        # Object to perform microcontroller operations
-        self.micro = Micro(callbackDataRead = self.callbackMicroReadData)
+        # Every line sent and received is recorded to disk
+        self.sessionLog = SessionRecorder(os.path.join(self.appRootPath, self.guiSettings['sessionLogDir']),
+                                          self.guiSettings['sessionLogMaxBytes'],
+                                          self.guiSettings['sessionLogMaxSeconds'],
+                                          self.guiSettings['sessionLogCompression'])
+        self.sessionLog.start()
+        self.sessions = []
+        self.logSearch = None
+        # Link qualification running and the session showing its progress
+        self.linkQual = None
+        self.linkQualSession = None
 
         # Initialize main window with icon, title, and user width/height
         self.initMainWindow(self.appRootPath, title, w, h)
@@ -117,7 +177,8 @@ class GuiCli(AppMainWindow):
         self.buttonsFont.setPointSize(self.buttonFontSize)
 
         # Object to save user settings
-        self.settings = ASettings(self.appRootPath, self.iconPaths)
+        with startupTrace.phase('ASettings'):
+            self.settings = ASettings()
 
         # Initialize all layouts attached to the main window
         self.initLayouts()
@@ -136,40 +197,82 @@ class GuiCli(AppMainWindow):
         # Initialize two main section:
         # 1. Section for buttons to send micro requests/cmds
         # 2. Section for logging and data visualization
+        startupTrace.mark('mainWindowBuilt')
         self.initLogSection()
         self.initControlSection()
-        self.aplot.setLegend(f'Channel {self.comboBoxPwmChannels.currentText()}')
-
-        # Create queue for saving log messages
-        self.logQueue = queue.Queue()
+        startupTrace.mark('logAndControlBuilt')
 
         self.applyTheme(self.guiSettings['currentTheme'])
-        if self.guiSettings['currentTheme'] == 'dark':
-            self.writeToLog("Welcome to Micro CLI\n\n", 'white')
-        else:
-            self.writeToLog("Welcome to Micro CLI\n\n", 'dark')
+        self.writeToLog("Welcome to Micro CLI\n\n")
+        self.portWatcher.start()
 
         # Initialize event loop by calling show method
-        self.show()
-
+        with startupTrace.phase('show'):
+            self.show()
+        # Called once the event loop has painted the window
+        QTimer.singleShot(0, self.slotWindowShown)
+        if self.guiSettings['plotPreloadDelay'] is not None:
+            QTimer.singleShot(int(self.guiSettings['plotPreloadDelay'] * 1000), self.preloadPlot)
+
+    def slotWindowShown(self):
+        """ Slot called when the window is shown for the first time """
+        if startupTrace.mark('windowShown'):
+            startupTrace.write()
+
+    @startupTrace.traced
     def initPlot(self):
-        """ Initialize the a plot object to plot a PWM signal """
+        """ Initialize the timer of the plot, the plot itself is built with
+            the first samples (see showPlot)
+        """
+        self.aplot = None
+        self.plotTimer = QTimer()
+        self.plotTimer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.plotTimer.timeout.connect(self.slotPlotTimerTimeOut)
+
+    def preloadPlot(self):
+        """ Import the modules of the plot in a background thread once the
+            window is up, the plot panel is then built without a pause when
+            the first samples arrive.
+        """
+        def importModules():
+            try:
+                import ringBuffer
+                import pwmAnalyzer
+                APlot.importModules()
+                from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT
+            except Exception as e:
+                print(f'Error: {e}')
+        threading.Thread(target = importModules, daemon = True).start()
+
+    @startupTrace.traced
+    def showPlot(self):
+        """ Build the plot panel the first time it is needed, matplotlib is
+            loaded then instead of at start up.
+        """
+        if self.aplot is not None:
+            return
+        from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
         self.aplot = APlot()
         self.aplot.setLineStyle('b-')
+        self.aplot.setDrawStyle('steps-post')
         self.aplot.setXlim((0, 100))
         self.aplot.setYLim((-0.1, 1.1))
         self.aplot.setTitle("PWM signal")
-        self.aplot.setXLabel("Time")
+        self.aplot.setXLabel("Time relative to last sample (s)")
         self.aplot.setYLabel("Logic level")
-        self.plotTimer = QTimer()
-        self.plotTimer.timeout.connect(self.slotPlotTimerTimeOut)
-        # Queue to save plot data coming from the micro
-        self.plotQueue = queue.Queue()
+        self.aplot.setLegend(self.session.legend)
 
         self.plotNavigationBar = NavigationToolbar(self.aplot.canvas)
         self.plotNavigationBar.setStyleSheet("background-color:white;")
         self.aplot.canvas.setMinimumHeight(260)
 
+        # Replace the placeholder with the plot
+        self.layoutPlots.removeWidget(self.labelPlotPending)
+        self.labelPlotPending.deleteLater()
+        self.layoutPlots.addWidget(self.plotNavigationBar, 0, 0)
+        self.layoutPlots.addWidget(self.aplot.canvas, 1, 0)
+
+    @startupTrace.traced
     def initStatusBar(self, statusBar):
         """ Initialize the status bar """
         self.setStatusBar(statusBar)
@@ -177,7 +280,12 @@ class GuiCli(AppMainWindow):
         font.setPointSize(10)
         self.statusBarWidget.setFont(font)
         self.updateStatusBar("Serial device: disconnected")
+        # Plot frame rate and display lag
+        self.labelPlotStatus = QLabel("")
+        self.labelPlotStatus.setFont(font)
+        statusBar.addPermanentWidget(self.labelPlotStatus)
 
+    @startupTrace.traced
     def initMenuBar(self):
         """ Initialize the menu bar """
         menuBar = QMenuBar()
@@ -189,9 +297,9 @@ class GuiCli(AppMainWindow):
         menuBarHelp = menuBar.addMenu("&Help")
 
         # Create actions for help
-        infoAction = self.aWidgets.newAction(self, "&Info", self.appRootPath + self.iconPaths['info'], self.actionHelp)
+        infoAction = self.aWidgets.newAction(self, "&Info", 'info', self.actionHelp)
         # actionSerialSettings = self.aWidgets.newAction(self, "&Serial device", slot = self.actionSerialSettings)
-        actionSaveLog = self.aWidgets.newAction(self, "&Log", self.appRootPath + self.iconPaths['save'],  self.actionSaveLog)
+        actionSaveLog = self.aWidgets.newAction(self, "&Log", 'save',  self.actionSaveLog)
 
         # Add all actions to the menubar
         menuBarHelp.addAction(infoAction)
@@ -201,25 +309,35 @@ class GuiCli(AppMainWindow):
         # Set menu bar to the main window
         self.setMenuBar(menuBar)
 
+    @startupTrace.traced
     def initToolBar(self):
         """ Initialize the tool bar """
         self.toolbar = QToolBar()
-        self.listWidgets['toolbar'].append(self.toolbar)
 
         # Create actions for saving the log
-        actionSaveLog = self.aWidgets.newAction(self, "&Save log", self.appRootPath + self.iconPaths['save'], self.actionSaveLog)
+        actionSaveLog = self.aWidgets.newAction(self, "&Save log", 'save', self.actionSaveLog)
         actionSaveLog.setToolTip("<font color='back'>Save logs to a file</font>")
 
+        # Create action for searching the log
+        actionSearchLog = self.aWidgets.newAction(self, "&Search log", 'report', self.actionSearchLog)
+        actionSearchLog.setToolTip("<font color='black'>Search the log</font>")
+
+        # Create action for finding the baud rate and qualifying the link
+        actionQualifyLink = self.aWidgets.newAction(self, "&Qualify link", 'compare', self.actionQualifyLink)
+        actionQualifyLink.setToolTip("<font color='black'>Find the baud rate of the board and measure the link</font>")
+
         # Create actions for general settings
-        actionSettings = self.aWidgets.newAction(self, "&Settings", self.appRootPath + self.iconPaths['settings'], self.actionSettings)
+        actionSettings = self.aWidgets.newAction(self, "&Settings", 'settings', self.actionSettings)
         actionSettings.setToolTip("<font color='back'>General settings</font>")
 
         # Create help action
-        actionHelp = self.aWidgets.newAction(self, "&Help", self.appRootPath + self.iconPaths['help'], self.actionHelp)
+        actionHelp = self.aWidgets.newAction(self, "&Help", 'help', self.actionHelp)
         actionHelp.setToolTip("<font color='black'>General help</font>")
 
         # Add all actions to the self.toolbar
         self.toolbar.addAction(actionSaveLog)
+        self.toolbar.addAction(actionSearchLog)
+        self.toolbar.addAction(actionQualifyLink)
         self.toolbar.addAction(actionSettings)
         self.toolbar.addAction(actionHelp)
 
@@ -228,48 +346,45 @@ class GuiCli(AppMainWindow):
 
         self.addToolBar(self.toolbar)
 
+    @startupTrace.traced
     def applyTheme(self, theme):
-        """ Apply a new theme to all widgets """
-        # Select the theme
+        """ Apply a new theme to all widgets. A single stylesheet set on the
+            main window styles every widget in one pass, the time it takes
+            does not depend on the size of the logs.
+        """
         newTheme = theme.lower()
-        widgetStyles = self.themes[newTheme]
-
-        # Set the new style to each widget
-        self.setStyleSheet(widgetStyles['mainWindow'])
-        for key in self.listWidgets:
-            for widget in self.listWidgets[key]:
-                widget.setStyleSheet(widgetStyles[key])
+        self.setStyleSheet(self.themeStyleSheet(newTheme))
         self.toolbar.setIconSize(QSize(self.guiSettings['toolbarIconSize'], self.guiSettings['toolbarIconSize']))
         self.guiSettings['currentTheme'] = newTheme
 
-        # Update text already displayed in log widget
+        # Log text with the default color has no format of its own, it is
+        # drawn with the text color of the theme (see ALogView)
         if newTheme == 'light':
-            self.updateTextColor('dark', self.textBoxLog)
             self.statusBarWidget.setStyleSheet(f'color:dark;')
         else:
             self.statusBarWidget.setStyleSheet(f'color:white;')
-            self.updateTextColor('white', self.textBoxLog)
 
     def actionInfo(self):
         self.writeToLog("Info not implemented yet\n")
 
     def actionSaveLog(self):
-        """ Save the log to a text file """
-        # If queue is empty, it doesn't make sense to save a log file
-        if self.logQueue.empty():
+        """ Save the session log to a file, a copy of the files already
+            recorded to disk.
+        """
+        # If nothing was recorded, it doesn't make sense to save a log file
+        if self.sessionLog.recordedLines == 0:
             self.showErrorMessage("No log to save")
             return
 
-        fileName, _ = QFileDialog.getSaveFileName(self, "Save file", "", "Text Files (*.txt)")
+        extension = self.sessionLog.compressions[self.sessionLog.compression]
+        fileFilter = f'Log Files (*.txt{extension})' if extension else "Text Files (*.txt)"
+        fileName, _ = QFileDialog.getSaveFileName(self, "Save file", "", fileFilter)
         if fileName:
-            # Copy current log from a queue
-            tmpLogQueue = queue.Queue()
-            for item in self.logQueue.queue:
-                tmpLogQueue.put(item)
-            # Write tmp queue to selected file
-            with open(fileName, 'w') as f:
-                while not tmpLogQueue.empty():
-                    f.write(tmpLogQueue.get())
+            try:
+                self.sessionLog.saveTo(fileName)
+            except Exception as e:
+                self.showErrorMessage(f'Error saving log: {e}')
+                return
             self.writeToLog(f'\nSaved log to {fileName}\n', 'green')
 
     def actionSettings(self):
@@ -294,125 +409,155 @@ class GuiCli(AppMainWindow):
         if self.settings.exec_():
             self.writeToLog("Apply event\n")
 
-    def clearLogQueue(self):
-        """ Clear the queue by removing all items """
-        while not self.logQueue:
-            self.logQueue.get()
-
-    state = "idle"
-    firstRisingEdgeTimeDetection = 0
-    secondRisingEdgeTimeDetection = 0
-
-    def detectFrequency(self, digit):
-        """ State machine to detect rising, falling and rising edge again"""
-        # print(digit)
-        # Idle state
-        if self.state == "idle":
-            if digit:
-                self.state = "firstEdge"
-                # print("debug: rising edge")
-                self.firstRisingEdgeTimeDetection = time.time()
-
-        # First edge state
-        if self.state == "firstEdge":
-            if not digit :
-                # print("debug: falling edge")
-                self.state = "fallingEdge"
-
-        # Falling edge state
-        if self.state == "fallingEdge":
-            if digit:
-                # print("debug: second rising edge")
-                self.state = "secondRisingEdge"
-                self.secondRisingEdgeTimeDetection = time.time()
-                # Calculate frequency
-                t1 = self.firstRisingEdgeTimeDetection
-                t2 = self.secondRisingEdgeTimeDetection
-                if (t2 - t1) > 0:
-                    freq = str(1 / float(t2 - t1))
-                    dotIndex = freq.find('.')
-                    truncatedFrequency = freq[:dotIndex + 1] + freq[dotIndex  + 1: dotIndex  + 4]
-                    self.writeToLog(f'Frequency: {truncatedFrequency}Hz\n')
-
-        if self.state == "secondRisingEdge":
-            if not digit:
-                # print("debug: second falling edge, going to idle\n")
-                self.state = "idle"
-
-    def callbackMicroReadData(self, data):
-        """ Callback to receive data read from the microcontroller """
-        # If data comes from PWW monitor feature, it should be displayed in
-        # a plot instead of a text widget.
-        if "pwm:" in data:
-            digit = int(data.split(':')[-1].strip())
-            self.detectFrequency(digit)
-            if not self.plotTimer.isActive():
-                self.startPlotTimer()
-
-            if self.plotQueue.not_full:
-                if digit != self.oldDigit:
-                    self.plotQueue.put(digit)
-                    self.oldDigit = digit
-            else:
-                self.writeToLog("Error: Plot queue full\n")
-
-        else: # Any command that is not monitoring
-            if not data.strip() == "OK":
-                self.writeToLog(data)
-
-            # Prevent log queue to overflow by incoming new data
-            if self.logQueue.full():
-                self.writeToLog("Can't log more data, queue is full\n", 'red')
-            else:
-                pass
-                # self.logQueue.put(data)
-
     def slotComboBoxComPorts(self):
-        pass
+        """ Show the session of the port selected, if it has one """
+        session = self.findSession(self.selectedPortName())
+        if session is not None:
+            self.tabsLog.setCurrentWidget(session.logView)
+        else:
+            self.updateConnectButton()
+
+    def selectedPortName(self):
+        """ Return the name of the port selected or None """
+        port = self.ports.get(self.comboBoxComPorts.currentData())
+        if port is None:
+            return None
+        return port.device
+
+    def findSession(self, portName):
+        """ Return the session of a port or None """
+        for session in self.sessions:
+            if portName is not None and session.portName == portName:
+                return session
+        return None
+
+    def addSession(self, session):
+        """ Add a board session with its own log tab """
+        self.sessions.append(session)
+        self.tabsLog.addTab(session.logView, session.title())
+        return session
+
+    def newSession(self, portName, description):
+        """ Return a session for a port, a session that never had a port
+            is reused.
+        """
+        for index, session in enumerate(self.sessions):
+            if session.portName is None:
+                session.portName = portName
+                session.description = description
+                session.legend = session.title()
+                self.tabsLog.setTabText(index, session.title())
+                return session
+        return self.addSession(BoardSession(self, portName, description))
+
+    def slotSessionChanged(self, index):
+        """ Slot to make the session of the selected tab the current one """
+        if index < 0 or index >= len(self.sessions):
+            return
+        self.session = self.sessions[index]
+        if self.aplot is not None:
+            self.aplot.setLegend(self.session.legend)
+        # Draw the window of the new session in the next frame
+        self.plotDirty = True
+        self.startPlotTimer()
+        self.updateSessionWidgets()
+
+    def slotSessionClosed(self, index):
+        """ Slot to close a session when its tab is closed """
+        session = self.sessions.pop(index)
+        self.tabsLog.removeTab(index)
+        self.stopPlotTimer(session)
+        # The log index of the session is closed with it
+        if self.logSearch is not None and self.logSearch.logIndex is session.logIndex:
+            self.logSearch.close()
+        session.release()
+        # There is always a session for the control frame to target
+        if not self.sessions:
+            self.addSession(BoardSession(self))
+
+    def sessionStatusChanged(self, session):
+        """ Show a new connection status if it is the current session """
+        if session is self.session:
+            self.updateSessionWidgets()
+
+    def updateConnectButton(self):
+        """ The connect button acts on the session of the selected port """
+        selected = self.findSession(self.selectedPortName())
+        if selected is not None and selected.micro.isOpen():
+            self.buttonConnectDisconnect.setText("Stop connection")
+        else:
+            self.buttonConnectDisconnect.setText("Start connection")
+
+    def updateSessionWidgets(self):
+        """ Show the state of the current session in the control widgets """
+        session = self.session
+        if session is None:
+            return
+        for index in range(self.comboBoxComPorts.count()):
+            port = self.ports.get(self.comboBoxComPorts.itemData(index))
+            if port is not None and port.device == session.portName:
+                self.comboBoxComPorts.blockSignals(True)
+                self.comboBoxComPorts.setCurrentIndex(index)
+                self.comboBoxComPorts.blockSignals(False)
+                break
+        self.updateConnectButton()
+        if self.micro.isMonitoring:
+            self.buttonPwmMonitor.setText("Stop monitoring")
+        else:
+            self.buttonPwmMonitor.setText("Monitor channel")
+        text, color, borderColor = session.status
+        self.updateStatusBar(text, color)
+        self.updateBorderColor(self.buttonConnectDisconnect, borderColor)
+        self.updatePlotStatus()
 
     ##3###########################################################
     #                    START OF INIT FUNCTIONS
     ##3###########################################################
+    @startupTrace.traced
     def initLogSection(self):
         """ Initialize a section with all widgets to view log information """
         # Create all labels
         labelPort = self.aWidgets.newLabel("Port", self.guiSettings['labelPointSize'], None)
         labelBaudRate = self.aWidgets.newLabel("Baud rate", self.guiSettings['labelPointSize'], None)
-        self.listWidgets['label'].append(labelPort)
-        self.listWidgets['label'].append(labelBaudRate)
 
         # Create combobox for sandboxes
         self.comboBoxComPorts = self.aWidgets.newComboBox(self.slotComboBoxComPorts)
         self.comboBoxComPorts.setFixedWidth(250)
         self.comboBoxBaudrates = self.aWidgets.newComboBox()
-        self.listWidgets['combobox'].append(self.comboBoxComPorts)
-        self.listWidgets['combobox'].append(self.comboBoxBaudrates)
 
-        # Update combobox with available ports
-        self.refreshSerialPorts()
+        # Ports are listed by a watcher thread as they are plugged in and out
+        self.ports = {}
+        self.portWatcher = ThreadPortWatcher()
+        self.portWatcher.signalPortAdded.connect(self.slotPortAdded)
+        self.portWatcher.signalPortRemoved.connect(self.slotPortRemoved)
+        self.portWatcher.signalScanDone.connect(self.slotPortScanDone)
+
+        # Dock: Dock for any message from serial port, one tab per board
+        self.tabsLog = QTabWidget()
+        self.tabsLog.setTabsClosable(True)
+        self.tabsLog.setFixedHeight(self.guiSettings['textBoxLogHeight'])
+        self.dockLog, _ = self.aWidgets.newDock("Log", "dock", self.tabsLog)
+        self.session = self.addSession(BoardSession(self))
+        self.tabsLog.currentChanged.connect(self.slotSessionChanged)
+        self.tabsLog.tabCloseRequested.connect(self.slotSessionClosed)
 
         # Update combobox with supported baudrates
         for baud in self.micro.baudRates:
             self.comboBoxBaudrates.addItem(baud)
         self.comboBoxBaudrates.setCurrentText('115200')
 
-        # Dock: Dock for any message from serial port
-        self.dockLog, self.textBoxLog = self.aWidgets.newDock("Log", "dock")
-        self.textBoxLog.setFixedHeight(self.guiSettings['textBoxLogHeight'])
-        self.listWidgets['text'].append(self.textBoxLog)
-
         # Button: Connect to serial port
         self.buttonConnectDisconnect = self.aWidgets.newButton("Start connection",
                                                                 self.slotConnectDisconnect,
                                                                 self.buttonsFont,
-                                                                self.appRootPath + self.iconPaths['serialPort'],
+                                                                'serialPort',
                                                                 (220, 30)
                                                               )
         # Button: Refresh the serial port list
         buttonRefresh = self.aWidgets.newButton("",
                                                   self.slotButtonRefreshSerialPorts,
                                                   self.buttonsFont,
-                                                  self.appRootPath + self.iconPaths['refresh'],
+                                                  'refresh',
                                                   (60, 35),
                                                   None
                                                 )
@@ -420,13 +565,9 @@ class GuiCli(AppMainWindow):
         buttonCleanLog = self.aWidgets.newButton("Clear",
                                                   self.slotButtonCleanLog,
                                                   self.buttonsFont,
-                                                  self.appRootPath + self.iconPaths['clear'],
+                                                  'clear',
                                                   None,
                                                 )
-        # Track all buttons
-        self.listWidgets['button'].append(self.buttonConnectDisconnect)
-        self.listWidgets['button'].append(buttonRefresh)
-        self.listWidgets['button'].append(buttonCleanLog)
 
         # Add widgets to the log layout
         ## Serial and text widgets
@@ -439,14 +580,17 @@ class GuiCli(AppMainWindow):
         self.layoutLog.addWidget(self.buttonConnectDisconnect, 2, 1, 1, -1, alignment = Qt.AlignmentFlag.AlignCenter)
         self.layoutLog.addWidget(self.dockLog, 3, 0, 1, -1)
 
-        ## Plot widgets
-        self.layoutPlots.addWidget(self.plotNavigationBar, 0, 0)
-        self.layoutPlots.addWidget(self.aplot.canvas, 1, 0)
+        ## Plot widgets, built when the first samples arrive (see showPlot)
+        self.labelPlotPending = self.aWidgets.newLabel("The PWM signal is plotted here while a channel is monitored",
+                                                       self.guiSettings['labelPointSize'])
+        self.layoutPlots.addWidget(self.labelPlotPending, 0, 0)
 
     def writeToPlot(self, x, y):
         """ Write to the plot the list of x and y values """
+        self.showPlot()
         self.aplot.plot(x,y)
 
+    @startupTrace.traced
     def initControlSection(self):
         """ Initialize a section with all widgets to perform IO operations with
             the microcontroller.
@@ -464,19 +608,6 @@ class GuiCli(AppMainWindow):
         labelPwmDuty  = self.aWidgets.newLabel("Duty", 10, None)
         labelPwmChannel = self.aWidgets.newLabel("Channel", 10, None)
 
-        # Track the widgets
-        self.listWidgets['label'].append(labelTitleGpioRW)
-        self.listWidgets['label'].append(labelGpio)
-        self.listWidgets['label'].append(labelPin)
-        self.listWidgets['label'].append(labelTitleGeneralInfo)
-        self.listWidgets['label'].append(labelTitleRtc)
-        self.listWidgets['label'].append(labelRtcHr)
-        self.listWidgets['label'].append(labelRctMin)
-        self.listWidgets['label'].append(labelTitlePwm)
-        self.listWidgets['label'].append(labelPwmFreq)
-        self.listWidgets['label'].append(labelPwmDuty)
-        self.listWidgets['label'].append(labelPwmChannel)
-
         # Combobox: GPIOs
         self.comboBoxGpios = self.aWidgets.newComboBox()
         for gpio in self.micro.gpios:
@@ -492,56 +623,56 @@ class GuiCli(AppMainWindow):
         buttonPinON = self.aWidgets.newButton("On",
                                             self.slotButtonOn,
                                             self.buttonsFont,
-                                            self.appRootPath + self.iconPaths['powerOn'],
+                                            'powerOn',
                                             )
         # Button: Set to OFF
         buttonPinOff= self.aWidgets.newButton("Off",
                                             self.slotButtonOff,
                                             self.buttonsFont,
-                                            self.appRootPath + self.iconPaths['powerOff'],
+                                            'powerOff',
                                             )
         # Button: Read from GPIO pin
         buttonReadPin = self.aWidgets.newButton("Read",
                                             self.slotButtonReadPin,
                                             self.buttonsFont,
-                                            self.appRootPath + self.iconPaths['refresh'],
+                                            'refresh',
                                             )
         # Button: Get the project version
         buttonVersion = self.aWidgets.newButton("Version",
                                             self.slotVersion,
                                             self.buttonsFont,
-                                            self.appRootPath + self.iconPaths['version'],
+                                            'version',
                                             )
         # Button: Help
         buttonHelp = self.aWidgets.newButton("Help",
                                             self.slotHelp,
                                             self.buttonsFont,
-                                            self.appRootPath + self.iconPaths['info'],
+                                            'info',
                                             )
         # Button: Heap information
         buttonHeap = self.aWidgets.newButton("Heap",
                                             self.slotHeap,
                                             self.buttonsFont,
-                                            self.appRootPath + self.iconPaths['ram'],
+                                            'ram',
                                             None,
                                             )
         # Button: Tick information
         buttonTicks = self.aWidgets.newButton("Ticks",
                                             self.slotTicks,
                                             self.buttonsFont,
-                                            self.appRootPath + self.iconPaths['freq'],
+                                            'freq',
                                             )
         # Button: Clock information
         buttonClk = self.aWidgets.newButton("Clock",
                                             self.slotClk,
                                             self.buttonsFont,
-                                            self.appRootPath + self.iconPaths['clk'],
+                                            'clk',
                                             )
         # Button: General statistics
         buttonStats = self.aWidgets.newButton("Stats",
                                             self.slotStats,
                                             self.buttonsFont,
-                                            self.appRootPath + self.iconPaths['stats'],
+                                            'stats',
                                             )
 
         # Widgets for RTC peripheral
@@ -551,13 +682,13 @@ class GuiCli(AppMainWindow):
         buttonSetTime = self.aWidgets.newButton("Set time",
                                             self.slotRtcSetTime,
                                             self.buttonsFont,
-                                            self.appRootPath + self.iconPaths['setTime'],
+                                            'setTime',
                                             )
         # Button: Get the current RTC time
         buttonGetTime = self.aWidgets.newButton("Get time",
                                             self.slotRtcGetTime,
                                             self.buttonsFont,
-                                            self.appRootPath + self.iconPaths['getTime'],
+                                            'getTime',
                                             )
         # Combobox: PWM channels
         self.comboBoxPwmChannels = self.aWidgets.newComboBox()
@@ -572,38 +703,15 @@ class GuiCli(AppMainWindow):
         buttonPwmSetFreqDuty = self.aWidgets.newButton("Set freq/duty",
                                             self.slotPwmSetFreqDuty,
                                             self.buttonsFont,
-                                            self.appRootPath + self.iconPaths['freq2'],
+                                            'freq2',
                                             )
         # Button: Start measure
         self.buttonPwmMonitor = self.aWidgets.newButton("Monitor channel",
                                             self.slotPwmMonitor,
                                             self.buttonsFont,
-                                            self.appRootPath + self.iconPaths['stats'],
+                                            'stats',
                                             )
 
-
-        # Add widgets to the record of widgets
-        self.listWidgets['button'].append(buttonPinON)
-        self.listWidgets['button'].append(buttonPinOff)
-        self.listWidgets['button'].append(buttonReadPin)
-        self.listWidgets['button'].append(buttonVersion)
-        self.listWidgets['button'].append(buttonHelp)
-        self.listWidgets['button'].append(buttonHeap)
-        self.listWidgets['button'].append(buttonTicks)
-        self.listWidgets['button'].append(buttonClk)
-        self.listWidgets['button'].append(buttonStats)
-        self.listWidgets['button'].append(buttonSetTime)
-        self.listWidgets['button'].append(buttonGetTime)
-        self.listWidgets['button'].append(buttonPwmSetFreqDuty)
-        self.listWidgets['button'].append(self.buttonPwmMonitor)
-        self.listWidgets['combobox'].append(self.comboBoxGpios)
-        self.listWidgets['combobox'].append(self.comboBoxPins)
-        self.listWidgets['combobox'].append(self.comboBoxPwmChannels)
-        self.listWidgets['line'].append(self.textRtcHr)
-        self.listWidgets['line'].append(self.textRtcMin)
-        self.listWidgets['line'].append(self.textPwmFreq)
-        self.listWidgets['line'].append(self.textPwmDuty)
-
         # GPIO handling
         self.layoutGpio.addWidget(labelTitleGpioRW, 0, 0, 1, -1)
         self.layoutGpio.addWidget(labelGpio, 1, 0)
@@ -646,13 +754,19 @@ class GuiCli(AppMainWindow):
     def slotPwmMonitor(self):
         """ Slot to monitor a PWM channel"""
         if self.micro.isMonitoring:
-            self.stopPlotTimer()
+            try:
+                self.micro.stopPwmMonitor()
+            except Exception as e:
+                self.showErrorMessage(f'{e}')
+            self.stopPlotTimer(self.session)
             self.buttonPwmMonitor.setText("Monitor channel")
         else: # No monitoring active, it should be started
             channel = int(self.comboBoxPwmChannels.currentText())
             # Start time will be used as start time for signal plotting
             try:
-                self.aplot.setLegend(f'Channel {channel}')
+                self.session.legend = f'{self.session.title()} channel {channel}'
+                if self.aplot is not None:
+                    self.aplot.setLegend(self.session.legend)
                 self.micro.monitorPwm(channel)
                 self.writeToLog("\nResponse: \n\n", '#77DD77')
                 self.buttonPwmMonitor.setText("Stop monitoring")
@@ -660,15 +774,10 @@ class GuiCli(AppMainWindow):
                 self.showErrorMessage(f'{e}')
 
     def updateBorderColor(self, widget, hexBorderColor):
-        """ Updates the border of a widget """
-        style = widget.styleSheet()
-        border_index = style.find("border:")
-        if border_index != -1:
-            hash_index = style.find("#", border_index)
-            if hash_index != -1:
-                color_substring = style[hash_index:hash_index + 7]
-                new_style = style.replace(color_substring, hexBorderColor)
-                widget.setStyleSheet(new_style)
+        """ Updates the border of a widget, the rest of its style comes
+            from the theme
+        """
+        widget.setStyleSheet(f'border-color: {hexBorderColor};')
 
     def slotRtcSetTime(self):
         """ Slot to set a new RTC time """
@@ -781,7 +890,6 @@ class GuiCli(AppMainWindow):
 
     def slotButtonCleanLog(self):
         self.textBoxLog.clear()
-        self.clearLogQueue()
 
     def slotButtonOff(self):
         """ Slot to off on a pin """
@@ -795,18 +903,26 @@ class GuiCli(AppMainWindow):
 
     def slotButtonRefreshSerialPorts(self):
         """ Slot to refresh the list of serial ports """
-        self.refreshSerialPorts()
-        if len(self.ports) < 1:
+        self.portWatcher.rescan()
+
+    def slotPortScanDone(self, count):
+        """ Slot to receive the end of a scan requested with refresh """
+        if count < 1:
             self.showErrorMessage("Valid ports not found")
 
-    def refreshSerialPorts(self):
-        self.comboBoxComPorts.clear()
-        tmpPorts = serial.tools.list_ports.comports()
-        self.ports = []
-        for port in tmpPorts:
-            if "USB" in port.hwid:
-                self.comboBoxComPorts.addItem(port.description)
-                self.ports.append(port)
+    def slotPortAdded(self, key, port):
+        """ Slot to list a port plugged in """
+        self.ports[key] = port
+        self.comboBoxComPorts.addItem(port.description, key)
+
+    def slotPortRemoved(self, key, port):
+        """ Slot to remove a port unplugged from the list, its session is
+            kept.
+        """
+        self.ports.pop(key, None)
+        index = self.comboBoxComPorts.findData(key)
+        if index >= 0:
+            self.comboBoxComPorts.removeItem(index)
 
     def centerWindow(self):
         """ Centers the window on the screen """
@@ -820,14 +936,16 @@ class GuiCli(AppMainWindow):
         # Set the geometry of the main window to the center position
         self.setGeometry(x, y, self.width(), self.height())
 
+    @startupTrace.traced
     def initMainWindow(self, appRootPath, title, w, h):
         """ Set default main windows properties """
         self.centerWindow()
         self.setMinimumHeight(h)
         # self.setFixedSize(w, h)
         self.setWindowTitle(title + f" v{self.appVersion['major']}.{self.appVersion['minor']}")
-        self.setWindowIcon(QIcon(appRootPath + self.iconPaths["mainIcon"]))
+        self.setWindowIcon(AIcons.icon('mainIcon'))
 
+    @startupTrace.traced
     def initLayouts(self):
         """ Initialize all layouts """
         # Central widget
@@ -852,7 +970,7 @@ class GuiCli(AppMainWindow):
         frame.setLayout(self.layoutGpio)
         frame.setMaximumHeight(180)
         self.layoutFrameControl.addWidget(frame, 0, 0)
-        self.listWidgets['frame'].append(frame)
+        frame.setProperty('panel', True)
 
         # Frame: Frame for holding widgets to general info
         frame = QFrame()
@@ -860,7 +978,7 @@ class GuiCli(AppMainWindow):
         frame.setLayout(self.layoutGeneral)
         frame.setMaximumHeight(180)
         self.layoutFrameControl.addWidget(frame, 1, 0)
-        self.listWidgets['frame'].append(frame)
+        frame.setProperty('panel', True)
 
         # Frame: Frame for holding widgets to RTC
         frame = QFrame()
@@ -868,7 +986,7 @@ class GuiCli(AppMainWindow):
         frame.setLayout(self.layoutRtc)
         frame.setMaximumHeight(150)
         self.layoutFrameControl.addWidget(frame, 2, 0)
-        self.listWidgets['frame'].append(frame)
+        frame.setProperty('panel', True)
 
         # Frame: Frame for holding widgets to PWM
         frame = QFrame()
@@ -876,7 +994,7 @@ class GuiCli(AppMainWindow):
         frame.setLayout(self.layoutPwm)
         frame.setMaximumHeight(230)
         self.layoutFrameControl.addWidget(frame, 3, 0)
-        self.listWidgets['frame'].append(frame)
+        frame.setProperty('panel', True)
 
         # Frame: Frame for logs and data visualization
         frame = QFrame()
@@ -885,7 +1003,7 @@ class GuiCli(AppMainWindow):
         self.layoutLog = QGridLayout()
         frame.setLayout(self.layoutLog)
         self.gridLayout.addWidget(frame, 0, 1)
-        self.listWidgets['frame'].append(frame)
+        frame.setProperty('panel', True)
 
         # Frame: Plots
         frame = QFrame()
@@ -900,30 +1018,13 @@ class GuiCli(AppMainWindow):
         self.statusBarWidget.showMessage(text)
         self.currentStatus = text
 
-    def updateTextColor(self, color, textEdit):
-        """ Update the color font of a text edit widget """
-        # Define the color you want to change the text to
-        color = QColor(color)
-
-        # Get the text cursor
-        cursor = textEdit.textCursor()
-
-        # Select all the text
-        cursor.select(QTextCursor.Document)
-
-        # Create a QTextCharFormat and set the foreground color
-        charFormat = QTextCharFormat()
-        charFormat.setForeground(color)
-
-        # Apply the format to the selected text
-        cursor.mergeCharFormat(charFormat)
-
     #############################################################
     #                    START OF SLOT FUNCTIONS
     #############################################################
     def slotConnectDisconnect(self):
         """ Slot to process the connection and disconnection from the
-            the serial port.
+            the serial port. Each port is connected in its own session, so
+            several boards can be connected at once.
         """
         # Validate the selected port
         portDescription = self.comboBoxComPorts.currentText()
@@ -932,9 +1033,7 @@ class GuiCli(AppMainWindow):
             return
 
         # Get port name based on the selected port description
-        for port in self.ports:
-            if port.description == portDescription:
-                portName = port.name
+        portName = self.selectedPortName()
 
         # Get serial port parameters from widgets
         baud = self.comboBoxBaudrates.currentText()
@@ -943,33 +1042,24 @@ class GuiCli(AppMainWindow):
         parity  = self.settings.getSerialParity()
 
         # Handle connection and disconnection states
+        session = self.findSession(portName)
         try:
-            if self.micro.isOpen(): # Serial device is opened
-                if self.micro.isMonitoring:
-                    self.buttonPwmMonitor.setText("Monitor channel")
+            if session is not None and session.micro.isOpen(): # Serial device is opened
                 # Close any current connection and update any widget
-                self.micro.close()
-                self.buttonConnectDisconnect.setText("Start connection")
-                self.updateStatusBar("Serial device: disconnected")
-                self.updateBorderColor(self.buttonConnectDisconnect, "#555555")
+                session.close()
+                self.stopPlotTimer(session)
+                session.status = ("Serial device: disconnected", 'white', "#555555")
             else: # Serial device not opened
-                # Open the serial port with the user
-                self.micro.open(portName, baud, dataLen, parity, stopBits)
-                self.buttonConnectDisconnect.setText("Stop connection")
-
-                # Check if the microcontroller can response to a ping command
-                # after a successful connection
-                response = self.micro.ping()
-                if response == "connected":
-                    self.updateStatusBar("Serial device: connected", "#77DD77")
-                    self.writeToLog("Microcontroller connected\n", "#77DD77")
-                    self.updateBorderColor(self.buttonConnectDisconnect, "#77DD77")
-                else:
-                    self.updateStatusBar("Serial device: not responding", "red")
-                    self.writeToLog("Microcontroller not responding\n", "red")
-                    self.updateBorderColor(self.buttonConnectDisconnect, "#FF0000")
+                if session is None:
+                    session = self.newSession(portName, portDescription)
+                self.tabsLog.setCurrentWidget(session.logView)
+                # The port is opened and the microcontroller pinged by the
+                # I/O thread, the progress is shown in the status bar (see
+                # BoardSession.callbackMicroConnectState)
+                session.micro.connect(portName, baud, dataLen, parity, stopBits)
         except Exception as e:
             self.showErrorMessage(f'Error{e}')
+        self.updateSessionWidgets()
 
     def closeEvent(self, event):
         """ Function called when the main window is closed
@@ -977,23 +1067,73 @@ class GuiCli(AppMainWindow):
            """
         # Make sure any microcontroller instance or serial port is closed
         # properly
-        if self.micro.isOpen():
-            self.micro.close()
+        self.portWatcher.stop()
+        if self.linkQual is not None:
+            self.linkQual.wait()
+        for session in self.sessions:
+            session.release()
+        self.sessionLog.stop()
+        startupTrace.write()
         event.accept()
 
-    def writeToLog(self, text, color = 'white'):
-        """ Write a text to the log dock/text widget """
-        cursor = self.textBoxLog.textCursor()
-        cursor.movePosition(cursor.End)
-        format_ = QTextCharFormat()
+    def writeToLog(self, text, color = 'white', kind = None):
+        """ Write a text to the log of the current board session """
+        self.session.writeToLog(text, color, kind)
 
-        if self.guiSettings['currentTheme'] == 'light' and color == 'white':
-            format_.setForeground(QColor('black'))
+    def actionSearchLog(self):
+        """ Show the log search dialog for the current board session """
+        if self.logSearch is None:
+            self.logSearch = ALogSearch(self.session.logIndex, self.session.logView.jumpToLine)
         else:
-            format_.setForeground(QColor(color))
-        cursor.insertText(text, format_)
-        self.textBoxLog.setTextCursor(cursor)
-        self.textBoxLog.ensureCursorVisible()
+            self.logSearch.setLogIndex(self.session.logIndex, self.session.logView.jumpToLine)
+        self.logSearch.setWindowTitle(f'Search log - {self.session.title()}')
+        self.logSearch.show()
+        self.logSearch.raise_()
+
+    def actionQualifyLink(self):
+        """ Find the baud rate the board of the selected port answers on and
+            measure the link at the higher rates, the fastest stable rate is
+            selected afterwards. The port must not be connected.
+        """
+        portName = self.selectedPortName()
+        if portName is None:
+            self.showErrorMessage("No port detected")
+            return
+        if self.linkQual is not None and self.linkQual.isRunning():
+            self.showErrorMessage("A link qualification is already running")
+            return
+        session = self.findSession(portName)
+        if session is not None and session.micro.isOpen():
+            self.showErrorMessage("Stop the connection before qualifying the link")
+            return
+        if session is None:
+            session = self.newSession(portName, self.comboBoxComPorts.currentText())
+        self.tabsLog.setCurrentWidget(session.logView)
+
+        self.linkQualSession = session
+        self.linkQual = ThreadLinkQual(portName,
+                                       self.settings.getSerialDataLen(),
+                                       self.settings.getSerialParity(),
+                                       self.settings.getSerialStopBits(),
+                                       int(self.comboBoxBaudrates.currentText()))
+        self.linkQual.signalProgress.connect(self.slotLinkQualProgress)
+        self.linkQual.signalDone.connect(self.slotLinkQualDone)
+        session.writeToLog(f'Qualifying the link of {portName}...\n')
+        self.linkQual.start()
+
+    def slotLinkQualProgress(self, text):
+        """ Slot to show the progress of the link qualification """
+        self.linkQualSession.writeToLog(text + '\n')
+
+    def slotLinkQualDone(self, report):
+        """ Slot to show the link report and select the recommended rate """
+        self.linkQual.wait()
+        if isinstance(report, Exception):
+            self.linkQualSession.writeToLog(f'Link qualification failed: {report}\n', 'red')
+            return
+        self.linkQualSession.writeToLog(report.table() + '\n')
+        if report.recommended is not None:
+            self.comboBoxBaudrates.setCurrentText(str(report.recommended))
 
     def showErrorMessage(self, text):
         """ Pops up an error window  """
@@ -1001,7 +1141,7 @@ class GuiCli(AppMainWindow):
         icon = QMessageBox.Icon(QMessageBox.Icon.Critical)
         messageBox = QMessageBox()
         messageBox.setIcon(icon)
-        messageBox.setWindowIcon(QIcon(self.appRootPath + self.iconPaths["mainIcon"]))
+        messageBox.setWindowIcon(AIcons.icon('mainIcon'))
         messageBox.setWindowTitle("Error")
         messageBox.setText(text)
         messageBox.setStyleSheet("""
@@ -1020,6 +1160,8 @@ class GuiCli(AppMainWindow):
 
 
 if __name__ == '__main__':
-    app = QApplication([])
-    codeLink = GuiCli("MicroCLI", APP_WIDTH, APP_HIGHT)
+    with startupTrace.phase('QApplication'):
+        app = QApplication([])
+    with startupTrace.phase('GuiCli'):
+        codeLink = GuiCli("MicroCLI", APP_WIDTH, APP_HIGHT)
     app.exec_()
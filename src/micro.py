@@ -6,56 +6,108 @@
                  access to it's features.
 """
 
+import microProtocol
 from serialDev import ThreadSerialDev
 
 class Micro():
-    baudRates = ['1200','2400','4800','9600','38400', '115200', '230400']
-    channels = ['1', '2', '3', '4']
-    gpios  = ['a','b','c','d','e','h']
-    pins = (0, 15)
-    cmds = {
-            'heap':"heap\n",
-            'clk':"clk\n",
-            'ticks':"ticks\n",
-            'version':"version\n",
-            'stats': "stats\n",
-            'help': "help\n",
-            'stats': "stats\n",
-            'gpioWrite': "gpio-w",
-            'gpioRead': "gpio-r",
-            'rtcSet': "rtc-s",
-            'rtcGet': "rtc-g\n",
-            'pwmSetFreq': "pwm-f",
-            'pwmSetDuty': "pwm-d",
-            'pwmMonitor': "pwmMonitor",
-            'ping': "ping\n",
-            }
-    maxFreq =  10000 # In Hz
-    maxDutyCycle = 100 # (0 - 100)%
+    baudRates = microProtocol.baudRates
+    channels = microProtocol.channels
+    gpios  = microProtocol.gpios
+    pins = microProtocol.pins
+    cmds = microProtocol.cmds
+    maxFreq =  microProtocol.maxFreq
+    maxDutyCycle = microProtocol.maxDutyCycle
     isMonitoring = False
 
-    def __init__(self, callbackDataRead):
+    def __init__(self, callbackDataRead, callbackLinesRead = None,
+                 callbackDataWritten = None, callbackConnectionLost = None,
+                 callbackReconnected = None, callbackConnectState = None):
         self.serialDev = None
         # User callback for data received from the microcontroller
         self.callbackDataRead = callbackDataRead
+        # User callback for batches of lines received (raw bytes lines,
+        # stamps and command keywords), lines are decoded and passed to
+        # callbackDataRead one by one when not set
+        self.callbackLinesRead = callbackLinesRead
+        # User callback for commands written to the microcontroller
+        self.callbackDataWritten = callbackDataWritten
+        # User callbacks for a device lost (error text) and reconnected
+        # (number of reconnections and downtime in seconds)
+        self.callbackConnectionLost = callbackConnectionLost
+        self.callbackReconnected = callbackReconnected
+        # User callback for the progress of connect() (state, seconds since
+        # it started and a detail text)
+        self.callbackConnectState = callbackConnectState
 
         # Thread for sending command and receiving responses via a serial device
         self.serialThread = ThreadSerialDev()
         self.serialThread.signalDataRead.connect(self.slotDataRead)
+        self.serialThread.signalLinesRead.connect(self.slotLinesRead)
+        self.serialThread.signalDataWritten.connect(self.slotDataWritten)
+        self.serialThread.signalConnectionLost.connect(self.slotConnectionLost)
+        self.serialThread.signalReconnected.connect(self.slotReconnected)
+        self.serialThread.signalConnectState.connect(self.slotConnectState)
 
     def slotDataRead(self, data):
         """ Slot to receive data read from the microcontroller """
         if self.callbackDataRead is not None:
-            dataDecoded = data.decode('utf-8')
+            dataDecoded = data.decode('utf-8', 'replace')
             self.callbackDataRead(dataDecoded)
 
+    def slotLinesRead(self, lines, stamps, kinds):
+        """ Slot to receive a batch of lines read from the microcontroller,
+            kinds are the keywords of the commands the lines answer. Lines
+            are passed as read, the callback decodes only the text it shows.
+        """
+        if self.callbackLinesRead is not None:
+            self.callbackLinesRead(lines, stamps, kinds)
+        elif self.callbackDataRead is not None:
+            for line in lines:
+                self.callbackDataRead(line.decode('utf-8', 'replace'))
+
+    def slotDataWritten(self, data, stamp):
+        """ Slot to receive commands written to the microcontroller """
+        if self.callbackDataWritten is not None:
+            self.callbackDataWritten(data.decode('utf-8', 'replace'), stamp)
+
+    def slotConnectionLost(self, error):
+        """ Slot to receive a device lost, it is being reconnected """
+        if self.callbackConnectionLost is not None:
+            self.callbackConnectionLost(error)
+
+    def slotReconnected(self, reconnects, downtime):
+        """ Slot to receive a device reconnected, its state is restored """
+        if self.callbackReconnected is not None:
+            self.callbackReconnected(reconnects, downtime)
+
+    def slotConnectState(self, state, elapsed, detail):
+        """ Slot to receive the progress of a connection """
+        if self.callbackConnectState is not None:
+            self.callbackConnectState(state, elapsed, detail)
+
+    def setAutoReconnect(self, enabled):
+        """ Reopen the device when it is lost and restore the PWM settings
+            and monitor that were active.
+        """
+        self.serialThread.setAutoReconnect(enabled)
+
+    def getReconnectStats(self):
+        """ Return the number of reconnections and the total downtime """
+        return (self.serialThread.reconnects, self.serialThread.downtime)
+
+    def setRxBatching(self, interval, maxLines):
+        """ Set the rate at which batches of received lines are delivered,
+            every interval seconds or maxLines lines, whichever comes first.
+        """
+        self.serialThread.setBatching(interval, maxLines)
+
     def getVersion(self):
         """ Get SW version """
         self.serialThread.write(self.cmds['version'])
 
     def writePin(self, gpio, pin, state):
         """ Write a logical value to a GPIO pin """
-        cmd = self.cmds['gpioWrite'] + f' {gpio.lower()} {pin} {state}\n'
+        cmd = self.cmds['gpioWrite'] + f' {gpio.lower()} {pin} {int(state)}\n'
         self.serialThread.write(cmd)
 
     def readPin(self, gpio, pin):
@@ -92,11 +144,21 @@ class Micro():
         """ Open a serial port to exchange data with the microcontroller """
         self.serialThread.open(serialDev, baud, int(dataLen), parity, int(stopBits))
 
+    def connect(self, serialDev, baud = 9600, dataLen = 8, parity = 'N',
+                stopBits = 1):
+        """ Open a serial port and check the microcontroller without
+            blocking: the port is opened, pinged and its version and clock
+            read by the I/O thread. Returns a Future resolved with the
+            information read and the time to ready (see callbackConnectState).
+        """
+        return self.serialThread.connectDevice(serialDev, baud, int(dataLen), parity, int(stopBits))
+
     def close(self):
         """ Kill any thread or monitor activity """
-        if self.isMonitoring:
+        # A device being reconnected can not be written
+        if self.isMonitoring and not self.serialThread.reconnecting:
             self.stopPwmMonitor()
-            self.isMonitoring = False
+        self.isMonitoring = False
         self.serialThread.close()
 
     def isOpen(self):
@@ -135,25 +197,52 @@ class Micro():
 
     def stopPwmMonitor(self):
         """ Stop PWM monitoring feature """
-        cmd = f'stopMonitor\n'
+        cmd = self.cmds['stopMonitor']
         self.writeToMicro(cmd)
         self.isMonitoring = False
 
     def ping(self):
         """ Test if there is a connection with the microcontroller """
         cmd = self.cmds['ping']
-        # Writes to the serial waiting for a read
-        self.writeToMicro(cmd, False)
-        data = self.serialThread.readResponseSync(timeout = 1).decode()
-        if data.strip() == "OK":
+        try:
+            response = self.request(cmd, timeout = 1).result(timeout = 2)
+        except Exception:
+            return "disconnected"
+        if response and response[0].strip() == "OK":
             return "connected"
         else:
             return "disconnected"
 
+    def request(self, cmd, timeout = 1):
+        """ Send a command and return a Future resolved with the lines of its
+            response. Responses are matched to commands in order, so several
+            requests can be in flight at once (see setPipelineWindow).
+        """
+        return self.serialThread.request(cmd, timeout)
+
+    def setPipelineWindow(self, window):
+        """ Set how many commands can wait for their response at once """
+        self.serialThread.setPipelineWindow(window)
+
+    def readAllPins(self, timeout = 1):
+        """ Read every pin of every GPIO, the reads are pipelined. Returns a
+            dictionary of responses keyed by (gpio, pin). Each read fails with
+            TimeoutError after timeout seconds without its response.
+        """
+        minPin, maxPin = self.pins
+        futures = {}
+        for gpio in self.gpios:
+            for pin in range(minPin, maxPin + 1):
+                cmd = self.cmds['gpioRead'] + f' {gpio} {pin}\n'
+                futures[(gpio, pin)] = self.request(cmd, timeout)
+        # Responses come in order, each one within timeout of the previous,
+        # the margin covers a pipeline that is no longer served
+        return {key: future.result(timeout = timeout + 1)[0]
+                for key, future in futures.items()}
+
     def writeToMicro(self, data, enableRead = True):
         """ Writes to the serial port where the microcontroller is connected.
-            By default, each writes waits for a response in a separate thread.
-            Reading after a write can be disabled by setting enable read to
-            False.
+            Responses are read by the I/O thread started when the port is
+            opened, enableRead is kept for compatibility.
         """
         self.serialThread.write(data, enableRead)
@@ -0,0 +1,301 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: microProtocol.py
+    Description: Commands and limits of the microcontroller CLI, the length of
+                 the length and format of their responses and in order
+                 matching of responses to the commands that were sent, so
+                 several commands can be in flight at once.
+"""
+
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+baudRates = ['1200','2400','4800','9600','38400', '115200', '230400']
+channels = ['1', '2', '3', '4']
+gpios  = ['a','b','c','d','e','h']
+pins = (0, 15)
+maxFreq =  10000 # In Hz
+maxDutyCycle = 100 # (0 - 100)%
+
+cmds = {
+        'heap':"heap\n",
+        'clk':"clk\n",
+        'ticks':"ticks\n",
+        'version':"version\n",
+        'stats': "stats\n",
+        'help': "help\n",
+        'gpioWrite': "gpio-w",
+        'gpioRead': "gpio-r",
+        'rtcSet': "rtc-s",
+        'rtcGet': "rtc-g\n",
+        'pwmSetFreq': "pwm-f",
+        'pwmSetDuty': "pwm-d",
+        'pwmMonitor': "pwmMonitor",
+        'stopMonitor': "stopMonitor\n",
+        'ping': "ping\n",
+        }
+
+# Number of lines each command answers with, as listed by the help command
+# of the firmware CLI and modelled by microSim. None means the length is not
+# known, the response ends when no line arrives for a quiet time.
+replyLines = {
+              'heap': 1,
+              'clk': 1,
+              'ticks': 1,
+              'version': 1,
+              'stats': None,
+              'help': None,
+              'gpio-w': 1,
+              'gpio-r': 1,
+              'rtc-s': 1,
+              'rtc-g': 1,
+              'pwm-f': 1,
+              'pwm-d': 1,
+              'pwmMonitor': 0,
+              'stopMonitor': 0,
+              'ping': 1,
+             }
+
+# Format of the lines each command answers with (a regular expression, {0},
+# {1}... are the arguments of the command), None for any line. A line that
+# doesn't fit the oldest command waiting is matched to the command it
+# answers further on, the commands before it lost their response.
+okReply = r'OK\s*$'
+replyFormats = {
+                'heap': r'Heap: ',
+                'clk': r'SYSCLK: ',
+                'ticks': r'Ticks: ',
+                'version': None,
+                'stats': None,
+                'help': None,
+                'gpio-w': okReply,
+                'gpio-r': r'(?i){0}{1}: [01]\s*$',
+                'rtc-s': okReply,
+                'rtc-g': r'\d+:\d+:\d+\s*$',
+                'pwm-f': okReply,
+                'pwm-d': okReply,
+                'ping': okReply,
+               }
+# A command that fails answers with a single error line
+errorReply = re.compile(rb'(Error|Unknown command)\b')
+
+# Lines sent by the microcontroller on its own, they never answer a command
+samplePrefix = b'pwm:'
+unsolicitedPrefixes = (samplePrefix,)
+
+# Lines read are classified from their bytes, only text lines are decoded.
+# The lines the firmware sends most are compiled in knownLines with their
+# type and value: every PWM monitor sample ("pwm:0", "pwm:1") and the OK
+# ending a response, with both line terminators. Other lines are classified
+# by their prefix (see classifyLine).
+lineEnds = (b'\n', b'\r\n')
+knownLines = {samplePrefix + str(value).encode() + end: ('pwm', value)
+              for value in (0, 1) for end in lineEnds}
+knownLines.update({b'OK' + end: ('ok', None) for end in lineEnds})
+textLine = ('text', None)
+# Every OK line of a block of lines, to cut them out of text at once
+okLines = re.compile(rb'^[^\S\n]*OK[^\S\n]*(?:\n|\Z)', re.MULTILINE)
+
+# Commands that set a state of the microcontroller, the last one of each is
+# sent again after a reconnection, in this order. A command of
+# resumeCancels forgets the state set by another one.
+resumeKeywords = ('pwm-f', 'pwm-d', 'pwmMonitor')
+resumeCancels = {'stopMonitor': 'pwmMonitor'}
+
+def cmdKeyword(data):
+    """ Return the command word of a command (str or bytes) """
+    if isinstance(data, bytes):
+        data = data.decode('utf-8', 'replace')
+    words = data.split()
+    return words[0] if words else ''
+
+def replyPattern(data):
+    """ Return the compiled format of the response to a command (bytes),
+        None when any line can answer it
+    """
+    words = data.decode('utf-8', 'replace').split()
+    replyFormat = replyFormats.get(words[0]) if words else None
+    if replyFormat is None:
+        return None
+    try:
+        replyFormat = replyFormat.format(*[re.escape(word) for word in words[1:]])
+    except IndexError:
+        # Missing arguments, the firmware answers with an error
+        return None
+    return re.compile(replyFormat.encode())
+
+def classifyLine(line):
+    """ Return the type of a line read (bytes) and its value: ('pwm', sample),
+        ('ok', None) or ('text', None) for lines to decode and log. Callers
+        on a hot path look the line up in knownLines first.
+    """
+    if line in knownLines:
+        return knownLines[line]
+    if line.startswith(samplePrefix):
+        try:
+            return ('pwm', int(line[len(samplePrefix):]))
+        except ValueError:
+            return textLine
+    if line.strip() == b'OK':
+        return knownLines[b'OK\n']
+    return textLine
+
+class PendingCommand():
+    """ A command written or about to be written to the microcontroller """
+
+    def __init__(self, data, timeout, future = None):
+        self.data = data
+        self.keyword = cmdKeyword(data)
+        self.expectedLines = replyLines.get(self.keyword)
+        self.replyFormat = replyPattern(data)
+        self.timeout = timeout
+        # Future resolved with the response lines, None for commands whose
+        # response is only followed to keep the rest in order
+        self.future = future
+        self.lines = []
+        self.sentTime = None
+        self.lastLineTime = None
+
+    def complete(self):
+        """ Resolve the future with the response lines """
+        if self.future is not None and not self.future.done():
+            self.future.set_result([line.decode('utf-8', 'replace').rstrip('\r\n')
+                                    for line in self.lines])
+
+    def accepts(self, line):
+        """ Check if a line fits the response of the command """
+        return self.replyFormat is None or self.replyFormat.match(line) is not None
+
+    def fail(self, exception):
+        """ Resolve the future with an exception """
+        if self.future is not None and not self.future.done():
+            self.future.set_exception(exception)
+
+class CommandPipeline():
+    """ Keeps the commands in flight in the order they were sent and matches
+        each line read to the oldest command still waiting for lines.
+
+        Up to window commands are in flight at once. A command whose response
+        length is not known is only sent when nothing else is in flight and
+        nothing is sent after it until its response ends.
+    """
+
+    def __init__(self, window = 4, quietTime = 0.05):
+        if window < 1:
+            raise Exception("Invalid window, it should be at least 1")
+        self.window = window
+        self.quietTime = quietTime
+        self.lock = threading.Lock()
+        self.backlog = deque()
+        self.inFlight = deque()
+
+    def setWindow(self, window):
+        """ Set how many commands can be in flight at once """
+        if window < 1:
+            raise Exception("Invalid window, it should be at least 1")
+        self.window = window
+
+    def submit(self, data, timeout = 1, withFuture = True):
+        """ Queue a command, returns a Future with its response lines (or
+            None when withFuture is False)
+        """
+        future = Future() if withFuture else None
+        with self.lock:
+            self.backlog.append(PendingCommand(data, timeout, future))
+        return future
+
+    def takeReady(self, now = None):
+        """ Return the commands that can be written now, in order """
+        if now is None:
+            now = time.monotonic()
+        ready = []
+        with self.lock:
+            while self.backlog and len(self.inFlight) < self.window:
+                cmd = self.backlog[0]
+                barrier = self.inFlight and self.inFlight[-1].expectedLines is None
+                if barrier or (cmd.expectedLines is None and self.inFlight):
+                    break
+                self.backlog.popleft()
+                cmd.sentTime = now
+                if cmd.expectedLines != 0:
+                    self.inFlight.append(cmd)
+                ready.append(cmd)
+        # Futures are resolved out of the lock, their callbacks may submit
+        for cmd in ready:
+            if cmd.expectedLines == 0:
+                cmd.complete()
+        return ready
+
+    def feedLine(self, line, now = None):
+        """ Match a line read to the oldest command waiting for lines. A line
+            that doesn't fit its response resyncs the pipeline: the commands
+            before the one it answers fail, a line that answers none of them
+            is not matched. Returns the command or None for unmatched lines.
+        """
+        if line.startswith(unsolicitedPrefixes):
+            return None
+        done = False
+        lost = []
+        with self.lock:
+            if not self.inFlight:
+                return None
+            isError = errorReply.match(line) is not None
+            cmd = self.inFlight[0]
+            if not isError and not cmd.accepts(line):
+                # Only a command with a known format can be told apart
+                match = next((i for i, later in enumerate(self.inFlight)
+                              if i and later.replyFormat is not None and later.accepts(line)), None)
+                if match is None:
+                    return None
+                lost = [self.inFlight.popleft() for i in range(match)]
+                cmd = self.inFlight[0]
+            cmd.lines.append(line)
+            cmd.lastLineTime = now if now is not None else time.monotonic()
+            if isError or (cmd.expectedLines is not None and len(cmd.lines) >= cmd.expectedLines):
+                self.inFlight.popleft()
+                done = True
+        for lostCmd in lost:
+            lostCmd.fail(Exception(f'Response to {lostCmd.keyword} lost'))
+        if done:
+            cmd.complete()
+        return cmd
+
+    def expire(self, now = None):
+        """ Fail commands that timed out and end responses of unknown length
+            after the quiet time.
+        """
+        if now is None:
+            now = time.monotonic()
+        completed = []
+        expired = []
+        with self.lock:
+            while self.inFlight:
+                cmd = self.inFlight[0]
+                if (cmd.expectedLines is None and cmd.lines and
+                    now - cmd.lastLineTime >= self.quietTime):
+                    completed.append(self.inFlight.popleft())
+                elif now - cmd.sentTime >= cmd.timeout:
+                    expired.append(self.inFlight.popleft())
+                else:
+                    break
+        for cmd in completed:
+            cmd.complete()
+        for cmd in expired:
+            cmd.fail(TimeoutError(f'No response to {cmd.keyword}'))
+
+    def cancelAll(self, exception):
+        """ Fail every command in flight or not sent yet """
+        with self.lock:
+            pending = list(self.inFlight) + list(self.backlog)
+            self.inFlight.clear()
+            self.backlog.clear()
+        for cmd in pending:
+            cmd.fail(exception)
+
+    def isIdle(self):
+        """ Check if there is nothing in flight nor waiting to be sent """
+        return not self.inFlight and not self.backlog
@@ -0,0 +1,494 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: microSim.py
+    Description: In-process simulator of the microcontroller firmware to test
+                 and benchmark the host side without a board. It answers the
+                 commands of microProtocol.cmds and streams "pwm:N" samples
+                 while monitoring. The simulator is reached through a pseudo
+                 terminal (any pyserial port name) or a TCP server
+                 (socket://host:port URL).
+
+                 Latency, jitter, line noise and a throughput cap can be
+                 injected to load test the host at rates boards can't produce.
+
+                 Usage: python src/microSim.py [--tcp PORT | --pty] [--rate HZ]
+                        [--latency S] [--jitter S] [--noise P] [--cap BYTES/S]
+                        python src/microSim.py --check
+"""
+
+import argparse
+import heapq
+import os
+import random
+import select
+import socket
+import threading
+import time
+import microProtocol
+
+class MicroSimulator():
+    """ Firmware model, receive() takes bytes written by the host and the
+        responses are written with the function given to attach().
+    """
+    version = "v1.0.0-sim"
+    sysClk = 84000000
+    heapSize = 32768
+    # Longest time covered by a block of monitor samples
+    maxBlockTime = 0.05
+    helpLines = ["Commands:",
+                 "  ping, version, heap, ticks, clk, stats, help",
+                 "  gpio-w <gpio> <pin> <0|1>, gpio-r <gpio> <pin>",
+                 "  rtc-s <hr> <min> <s>, rtc-g",
+                 "  pwm-f <freq>, pwm-d <duty>",
+                 "  pwmMonitor <channel>, stopMonitor"]
+
+    def __init__(self, monitorRate = 1000, latency = 0, jitter = 0, noise = 0,
+                 maxBytesPerSecond = None, baudrate = 115200, seed = None,
+                 wireSpeed = False, maxCleanBaud = None):
+        # Samples per second streamed while monitoring
+        self.monitorRate = monitorRate
+        # Seconds added before each response, plus a random jitter
+        self.latency = latency
+        self.jitter = jitter
+        # Probability of each byte written to be corrupted
+        self.noise = noise
+        # Bytes per second written at most, None for no limit
+        self.maxBytesPerSecond = maxBytesPerSecond
+        # Baud rate the firmware listens on, only checked by transports
+        # that know the host baud rate (see SimPty). None follows the host
+        # baud rate like a USB CDC device does.
+        self.baudrate = baudrate
+        # Write at the speed of the host baud rate (10 bits per byte)
+        self.wireSpeed = wireSpeed
+        # Above this host baud rate the link is marginal and highBaudNoise
+        # is added to the noise
+        self.maxCleanBaud = maxCleanBaud
+        self.highBaudNoise = 0.002
+        self.random = random.Random(seed)
+
+        self.write = None
+        self.hostBaudrate = None
+        self.rxBuffer = bytearray()
+        self.startTime = time.monotonic()
+        self.gpioStates = {}
+        self.rtcOffset = 0
+        self.pwmFreq = 1000
+        self.pwmDuty = 50
+        self.monitorChannel = None
+        self.nextSampleTime = 0
+        self.stats = {'commands': 0, 'bytesIn': 0, 'bytesOut': 0, 'samples': 0}
+
+        # Responses waiting for their time to be written (due time, order, data)
+        self.outQueue = []
+        self.outOrder = 0
+        self.lastDue = 0
+        self.condition = threading.Condition()
+        self.stopped = True
+        self.thread = None
+
+    def attach(self, write, hostBaudrate = None):
+        """ Set the function to write to the host and start the simulator.
+            hostBaudrate is a function returning the baud rate the host port
+            is set to, or None when the transport can't tell.
+        """
+        self.write = write
+        self.hostBaudrate = hostBaudrate
+        if self.stopped:
+            self.stopped = False
+            self.thread = threading.Thread(target = self.run, daemon = True)
+            self.thread.start()
+
+    def stop(self):
+        """ Stop writing to the host """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def receive(self, data):
+        """ Bytes written by the host """
+        self.stats['bytesIn'] += len(data)
+        if self.baudMismatch():
+            # Wrong baud rate: commands are garbled and the host reads noise
+            self.send(bytes(self.random.randrange(256) for i in range(len(data))))
+            return
+        self.rxBuffer += data
+        while True:
+            end = self.rxBuffer.find(b'\n')
+            if end < 0:
+                return
+            line = bytes(self.rxBuffer[:end]).decode('utf-8', 'replace')
+            del self.rxBuffer[:end + 1]
+            response = self.handleCommand(line)
+            if response:
+                self.send(''.join(r + '\r\n' for r in response).encode())
+
+    def currentHostBaudrate(self):
+        if self.hostBaudrate is None:
+            return None
+        return self.hostBaudrate()
+
+    def baudMismatch(self):
+        if self.baudrate is None:
+            return False
+        hostBaudrate = self.currentHostBaudrate()
+        return hostBaudrate is not None and hostBaudrate != self.baudrate
+
+    def handleCommand(self, line):
+        """ Execute a command line, returns the lines of the response """
+        words = line.split()
+        if not words:
+            return []
+        self.stats['commands'] += 1
+        keyword, args = words[0], words[1:]
+        try:
+            if keyword == 'ping':
+                return ["OK"]
+            if keyword == 'version':
+                return [self.version]
+            if keyword == 'heap':
+                used = 1024 + 16 * len(self.gpioStates)
+                return [f'Heap: {self.heapSize - used} free of {self.heapSize} bytes']
+            if keyword == 'ticks':
+                return [f'Ticks: {int((time.monotonic() - self.startTime) * 1000)}']
+            if keyword == 'clk':
+                return [f'SYSCLK: {self.sysClk} Hz']
+            if keyword == 'stats':
+                return [f'Commands: {self.stats["commands"]}',
+                        f'Bytes in: {self.stats["bytesIn"]}',
+                        f'Bytes out: {self.stats["bytesOut"]}',
+                        f'Samples: {self.stats["samples"]}']
+            if keyword == 'help':
+                return list(self.helpLines)
+            if keyword == 'gpio-w':
+                gpio, pin, state = args[0].lower(), int(args[1]), int(args[2])
+                self.checkPin(gpio, pin)
+                self.gpioStates[(gpio, pin)] = 1 if state else 0
+                return ["OK"]
+            if keyword == 'gpio-r':
+                gpio, pin = args[0].lower(), int(args[1])
+                self.checkPin(gpio, pin)
+                return [f'{gpio.upper()}{pin}: {self.gpioStates.get((gpio, pin), 0)}']
+            if keyword == 'rtc-s':
+                hr, min = int(args[0]), int(args[1])
+                s = int(args[2]) if len(args) > 2 else 0
+                self.rtcOffset = hr * 3600 + min * 60 + s - time.monotonic()
+                return ["OK"]
+            if keyword == 'rtc-g':
+                now = int(time.monotonic() + self.rtcOffset) % 86400
+                return [f'{now // 3600:02}:{now // 60 % 60:02}:{now % 60:02}']
+            if keyword == 'pwm-f':
+                freq = int(args[0])
+                if freq < 0 or freq > microProtocol.maxFreq:
+                    return ["Error: invalid frequency"]
+                self.pwmFreq = freq
+                return ["OK"]
+            if keyword == 'pwm-d':
+                duty = int(args[0])
+                if duty < 0 or duty > microProtocol.maxDutyCycle:
+                    return ["Error: invalid duty"]
+                self.pwmDuty = duty
+                return ["OK"]
+            if keyword == 'pwmMonitor':
+                if args[0] not in microProtocol.channels:
+                    return []
+                with self.condition:
+                    self.monitorChannel = int(args[0])
+                    self.nextSampleTime = time.monotonic()
+                    self.condition.notify()
+                return []
+            if keyword == 'stopMonitor':
+                self.monitorChannel = None
+                return []
+        except (IndexError, ValueError):
+            return [f'Error: invalid arguments for {keyword}']
+        return [f'Unknown command: {keyword}']
+
+    def checkPin(self, gpio, pin):
+        minPin, maxPin = microProtocol.pins
+        if gpio not in microProtocol.gpios or pin < minPin or pin > maxPin:
+            raise ValueError("Invalid pin")
+
+    def pwmLevel(self, t):
+        """ Logic level of the PWM output at time t """
+        if self.pwmFreq == 0:
+            return 1 if self.pwmDuty >= 100 else 0
+        phase = (t * self.pwmFreq) % 1
+        return 1 if phase * 100 < self.pwmDuty else 0
+
+    def send(self, data):
+        """ Queue data to be written after the injected latency """
+        due = time.monotonic() + self.latency
+        if self.jitter:
+            due += self.random.uniform(0, self.jitter)
+        with self.condition:
+            # A serial line never reorders bytes, jitter only delays them
+            due = max(due, self.lastDue)
+            self.lastDue = due
+            heapq.heappush(self.outQueue, (due, self.outOrder, data))
+            self.outOrder += 1
+            self.condition.notify()
+
+    def takeSamples(self, now):
+        """ Return the monitor samples due at time now as one block """
+        rate = self.monitorRate
+        if self.maxBytesPerSecond:
+            # A sample line is 7 bytes long ("pwm:N\r\n")
+            rate = min(rate, self.maxBytesPerSecond / 7)
+        # A firmware that can't keep up drops samples instead of queueing
+        # them, blocks are at most maxBlockTime long
+        if now - self.nextSampleTime > self.maxBlockTime:
+            self.nextSampleTime = now - self.maxBlockTime
+        numSamples = int((now - self.nextSampleTime) * rate)
+        if numSamples <= 0:
+            return b''
+        sampleTimes = [self.nextSampleTime + i / rate for i in range(numSamples)]
+        self.nextSampleTime += numSamples / rate
+        self.stats['samples'] += numSamples
+        return b''.join(b'pwm:1\r\n' if self.pwmLevel(t) else b'pwm:0\r\n' for t in sampleTimes)
+
+    def run(self):
+        """ Write responses and monitor samples when they are due """
+        while True:
+            with self.condition:
+                if self.stopped:
+                    return
+                now = time.monotonic()
+                wakeUp = None
+                if self.outQueue:
+                    wakeUp = self.outQueue[0][0]
+                if self.monitorChannel is not None:
+                    # Samples are written in blocks of at least 1 ms
+                    sampleTime = self.nextSampleTime + 0.001
+                    wakeUp = sampleTime if wakeUp is None else min(wakeUp, sampleTime)
+                if wakeUp is None or wakeUp > now:
+                    self.condition.wait(None if wakeUp is None else wakeUp - now)
+                    continue
+                data = []
+                while self.outQueue and self.outQueue[0][0] <= now:
+                    data.append(heapq.heappop(self.outQueue)[2])
+            if self.monitorChannel is not None:
+                data.append(self.takeSamples(now))
+            self.output(b''.join(data))
+
+    def output(self, data):
+        """ Write data to the host with noise and throughput cap applied """
+        if not data:
+            return
+        hostBaudrate = self.currentHostBaudrate()
+        noise = self.noise
+        if self.maxCleanBaud and hostBaudrate and hostBaudrate > self.maxCleanBaud:
+            noise += self.highBaudNoise
+        if noise:
+            data = bytearray(data)
+            for i in range(len(data)):
+                if self.random.random() < noise:
+                    data[i] = self.random.randrange(256)
+            data = bytes(data)
+        if self.wireSpeed and hostBaudrate:
+            # Bytes reach the host once they are all on the wire
+            time.sleep(len(data) * 10 / hostBaudrate)
+        try:
+            self.write(data)
+        except OSError:
+            self.stopped = True
+            return
+        self.stats['bytesOut'] += len(data)
+        if self.maxBytesPerSecond:
+            time.sleep(len(data) / self.maxBytesPerSecond)
+
+class SimPty():
+    """ Serve a simulator through a pseudo terminal (POSIX only). port is the
+        name to open with pyserial. The host baud rate is read from the
+        terminal settings, so the simulator can emulate baud mismatches.
+    """
+    # Seconds between checks of the stop flag while waiting for the host
+    pollInterval = 0.1
+
+    def __init__(self, simulator):
+        import termios
+        self.termios = termios
+        self.simulator = simulator
+        self.masterFd, self.slaveFd = os.openpty()
+        self.port = os.ttyname(self.slaveFd)
+        # Writes must not block once the host stops reading
+        os.set_blocking(self.masterFd, False)
+        self.speeds = {getattr(termios, f'B{baud}'): int(baud)
+                       for baud in microProtocol.baudRates if hasattr(termios, f'B{baud}')}
+        self.stopped = False
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+        simulator.attach(self.write, self.hostBaudrate)
+
+    def write(self, data):
+        """ Write all data, waits while the host is not reading """
+        data = memoryview(data)
+        while data and not self.stopped:
+            if select.select([], [self.masterFd], [], self.pollInterval)[1]:
+                try:
+                    data = data[os.write(self.masterFd, data):]
+                except BlockingIOError:
+                    pass
+
+    def hostBaudrate(self):
+        """ Baud rate the host side of the terminal is set to """
+        try:
+            speed = self.termios.tcgetattr(self.masterFd)[5]
+        except self.termios.error:
+            return None
+        return self.speeds.get(speed)
+
+    def run(self):
+        while not self.stopped:
+            if not select.select([self.masterFd], [], [], self.pollInterval)[0]:
+                continue
+            try:
+                data = os.read(self.masterFd, 4096)
+            except BlockingIOError:
+                continue
+            except OSError:
+                return
+            if data:
+                self.simulator.receive(data)
+
+    def close(self):
+        self.stopped = True
+        self.simulator.stop()
+        self.thread.join()
+        os.close(self.slaveFd)
+        os.close(self.masterFd)
+
+class SimTcpServer():
+    """ Serve a simulator through TCP, one host connection at a time. url is
+        the pyserial URL to open (socket://host:port).
+    """
+
+    def __init__(self, simulator, host = '127.0.0.1', port = 0):
+        self.simulator = simulator
+        self.server = socket.create_server((host, port))
+        self.url = f'socket://{host}:{self.server.getsockname()[1]}'
+        self.connection = None
+        self.stopped = False
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+
+    def write(self, data):
+        """ Write all data, waits while the host is not reading """
+        data = memoryview(data)
+        while data and not self.stopped:
+            if select.select([], [self.connection], [], SimPty.pollInterval)[1]:
+                data = data[self.connection.send(data):]
+
+    def run(self):
+        while not self.stopped:
+            try:
+                self.connection, address = self.server.accept()
+            except OSError:
+                return
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.simulator.attach(self.write)
+            while True:
+                try:
+                    data = self.connection.recv(4096)
+                except OSError:
+                    break
+                if not data:
+                    break
+                self.simulator.receive(data)
+            self.simulator.stop()
+            self.simulator.monitorChannel = None
+            self.connection.close()
+
+    def close(self):
+        self.stopped = True
+        self.simulator.stop()
+        if self.connection is not None:
+            try:
+                self.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.server.close()
+
+def checkPinRoundTrip():
+    """ Write both states to every pin with Micro and AsyncMicro, then read
+        them back. Raises an exception on the first pin that doesn't match.
+    """
+    import asyncio
+    from asyncMicro import AsyncMicro
+    from micro import Micro
+
+    minPin, maxPin = microProtocol.pins
+    pins = [(gpio, pin) for gpio in microProtocol.gpios
+            for pin in range(minPin, maxPin + 1)]
+
+    def check(client, gpio, pin, state, response):
+        expected = f'{gpio.upper()}{pin}: {int(state)}'
+        if response[0].strip() != expected:
+            raise Exception(f'{client}: wrote {state} to {gpio}{pin}, read {response}')
+
+    transport = SimPty(MicroSimulator())
+    micro = Micro(None)
+    micro.open(transport.port, 115200)
+    try:
+        for state in (True, False):
+            for gpio, pin in pins:
+                micro.writePin(gpio, pin, state)
+                cmd = microProtocol.cmds['gpioRead'] + f' {gpio} {pin}\n'
+                check('Micro', gpio, pin, state, micro.request(cmd).result(timeout = 2))
+    finally:
+        micro.close()
+        transport.close()
+
+    async def checkAsync():
+        transport = SimPty(MicroSimulator())
+        try:
+            async with await AsyncMicro.connect(transport.port) as micro:
+                for state in (True, False):
+                    for gpio, pin in pins:
+                        response = await micro.writePin(gpio, pin, state)
+                        if response != ['OK']:
+                            raise Exception(f'AsyncMicro: write to {gpio}{pin} answered {response}')
+                        check('AsyncMicro', gpio, pin, state, await micro.readPin(gpio, pin))
+        finally:
+            transport.close()
+    asyncio.run(checkAsync())
+    print(f'Pin round trip ok, {len(pins)} pins')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Microcontroller firmware simulator")
+    parser.add_argument('--tcp', type = int, default = None, help = "TCP port to listen on")
+    parser.add_argument('--pty', action = 'store_true', help = "Serve through a pseudo terminal")
+    parser.add_argument('--rate', type = float, default = 1000, help = "Monitor samples per second")
+    parser.add_argument('--latency', type = float, default = 0, help = "Response latency in seconds")
+    parser.add_argument('--jitter', type = float, default = 0, help = "Random latency added in seconds")
+    parser.add_argument('--noise', type = float, default = 0, help = "Probability of a corrupted byte")
+    parser.add_argument('--cap', type = float, default = None, help = "Max bytes per second")
+    parser.add_argument('--baud', type = int, default = 115200, help = "Baud rate of the firmware")
+    parser.add_argument('--auto-baud', action = 'store_true', help = "Follow the host baud rate (USB CDC)")
+    parser.add_argument('--wire-speed', action = 'store_true', help = "Write at the host baud rate speed")
+    parser.add_argument('--max-clean-baud', type = int, default = None,
+                        help = "Host baud rate above which bytes get corrupted")
+    parser.add_argument('--check', action = 'store_true',
+                        help = "Check the pin round trip of the host clients and exit")
+    args = parser.parse_args()
+
+    if args.check:
+        checkPinRoundTrip()
+        raise SystemExit(0)
+
+    simulator = MicroSimulator(args.rate, args.latency, args.jitter, args.noise,
+                               args.cap, None if args.auto_baud else args.baud,
+                               wireSpeed = args.wire_speed, maxCleanBaud = args.max_clean_baud)
+    if args.pty:
+        transport = SimPty(simulator)
+        print(f'Simulator on {transport.port}')
+    else:
+        transport = SimTcpServer(simulator, port = args.tcp or 0)
+        print(f'Simulator on {transport.url}')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        transport.close()
@@ -0,0 +1,117 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: portWatcher.py
+    Description: Background watcher of the serial ports plugged in. Ports are
+                 kept in an inventory keyed by their identity (VID:PID and
+                 serial number) and only the differences are emitted as
+                 added/removed signals. On Linux the ports are enumerated
+                 again only when the entries of /sys/class/tty change.
+"""
+
+import os
+import threading
+import serial.tools.list_ports
+from PyQt5.QtCore import QThread, pyqtSignal
+
+def portKey(port):
+    """ Return the identity of a port: VID:PID and serial number for USB
+        devices (the USB location when there is no serial number), the device
+        name for anything else. A board keeps its key when it is plugged in
+        again under another device name.
+    """
+    if port.vid is None:
+        return port.device
+    key = f'{port.vid:04X}:{port.pid:04X}'
+    if port.serial_number:
+        return f'{key} {port.serial_number}'
+    return f'{key} @{port.location or port.device}'
+
+class ThreadPortWatcher(QThread):
+    """ Enumerates the serial ports in its own thread and emits the ports
+        added and removed since the previous enumeration.
+    """
+    # Port key and port info (serial.tools.list_ports_common.ListPortInfo)
+    signalPortAdded = pyqtSignal(str, object)
+    signalPortRemoved = pyqtSignal(str, object)
+    # Number of ports after a scan requested with rescan()
+    signalScanDone = pyqtSignal(int)
+    # Seconds between checks, a check on Linux is a single directory read
+    pollInterval = 0.5 if os.path.isdir('/sys/class/tty') else 2.0
+    sysTtyPath = '/sys/class/tty'
+
+    def __init__(self, usbOnly = True):
+        super().__init__()
+        # Only USB ports are listed, like the original port list
+        self.usbOnly = usbOnly
+        self.inventory = {}
+        self.lock = threading.Lock()
+        self.wakeUp = threading.Event()
+        self.stopped = False
+        self.scanRequested = False
+        self.signature = None
+
+    def ports(self):
+        """ Return a copy of the inventory, port info by key """
+        with self.lock:
+            return dict(self.inventory)
+
+    def rescan(self):
+        """ Enumerate the ports now, signalScanDone is emitted afterwards """
+        self.scanRequested = True
+        self.wakeUp.set()
+
+    def changeSignature(self):
+        """ Return something that changes when a port is plugged in or out,
+            None when there is no cheap way to know it.
+        """
+        try:
+            return frozenset(os.listdir(self.sysTtyPath))
+        except OSError:
+            return None
+
+    def enumerate(self):
+        """ Return the ports plugged in by key """
+        ports = {}
+        for port in serial.tools.list_ports.comports():
+            if self.usbOnly and "USB" not in port.hwid:
+                continue
+            ports[portKey(port)] = port
+        return ports
+
+    def scan(self):
+        """ Enumerate the ports and emit the differences with the inventory """
+        ports = self.enumerate()
+        with self.lock:
+            old = self.inventory
+            self.inventory = ports
+        for key, port in old.items():
+            if key not in ports or ports[key].device != port.device:
+                self.signalPortRemoved.emit(key, port)
+        for key, port in ports.items():
+            if key not in old or old[key].device != port.device:
+                self.signalPortAdded.emit(key, port)
+
+    def run(self):
+        """ Check for changes every pollInterval until the thread is stopped """
+        while not self.stopped:
+            signature = self.changeSignature()
+            requested = self.scanRequested
+            self.scanRequested = False
+            if requested or signature is None or signature != self.signature:
+                self.signature = signature
+                try:
+                    self.scan()
+                except Exception as e:
+                    print(f'Error: {e}')
+                if requested:
+                    self.signalScanDone.emit(len(self.inventory))
+            self.wakeUp.wait(self.pollInterval)
+            self.wakeUp.clear()
+
+    def stop(self):
+        """ Stop the thread """
+        if self.isRunning():
+            self.stopped = True
+            self.wakeUp.set()
+            self.wait()
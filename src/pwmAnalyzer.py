@@ -0,0 +1,149 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: pwmAnalyzer.py
+    Description: Block based edge, frequency and duty cycle detection of a
+                 PWM signal sampled by the microcontroller.
+"""
+
+import queue
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+
+class PwmAnalyzer():
+    """ Find rising and falling edges of blocks of (time, level) samples and
+        measure the period, frequency and duty cycle of the signal. Edges
+        that are not paired yet are kept between blocks, so a signal can be
+        analyzed in blocks of any size.
+
+        By default periods are measured like the original GUI state machine
+        did: from a rising edge to the next one, then the following rising
+        edge starts a new measure (every other cycle). With everyCycle set,
+        every cycle is measured.
+    """
+
+    def __init__(self, everyCycle = False):
+        self.everyCycle = everyCycle
+        self.reset()
+
+    def reset(self):
+        """ Forget any sample analyzed so far """
+        self.lastLevel = False
+        # Number of samples analyzed, used as global sample index
+        self.sampleCount = 0
+        # Rising edge waiting for the next one (index, time) and falling
+        # edges seen after it
+        self.pendingRise = None
+        self.pendingFallIndexes = np.empty(0, dtype = np.int64)
+        self.pendingFallTimes = np.empty(0)
+
+    def analyze(self, times, levels):
+        """ Analyze a block of samples. Returns a (times, periods, freqs,
+            duties) tuple of arrays, one element per measured cycle, times
+            are the end of each cycle.
+        """
+        times = np.asarray(times, dtype = np.float64)
+        levels = np.asarray(levels) != 0
+        if len(levels) == 0:
+            return self.emptyResult()
+
+        # Level of each sample before it, the last level of the previous
+        # block is the one before the first sample
+        prevLevels = np.empty(len(levels), dtype = bool)
+        prevLevels[0] = self.lastLevel
+        prevLevels[1:] = levels[:-1]
+        rising = np.flatnonzero(levels & ~prevLevels)
+        falling = np.flatnonzero(~levels & prevLevels)
+
+        riseIndexes = rising + self.sampleCount
+        riseTimes = times[rising]
+        fallIndexes = np.concatenate((self.pendingFallIndexes, falling + self.sampleCount))
+        fallTimes = np.concatenate((self.pendingFallTimes, times[falling]))
+        if self.pendingRise is not None:
+            riseIndexes = np.concatenate(([self.pendingRise[0]], riseIndexes))
+            riseTimes = np.concatenate(([self.pendingRise[1]], riseTimes))
+        self.lastLevel = levels[-1]
+        self.sampleCount += len(levels)
+
+        # Pair rising edges into cycles
+        if self.everyCycle:
+            numCycles = max(len(riseIndexes) - 1, 0)
+            starts = np.arange(numCycles)
+            ends = starts + 1
+            pending = len(riseIndexes) - 1 if len(riseIndexes) else None
+        else:
+            numCycles = len(riseIndexes) // 2
+            starts = np.arange(numCycles) * 2
+            ends = starts + 1
+            pending = len(riseIndexes) - 1 if len(riseIndexes) % 2 else None
+
+        # Keep the unpaired rising edge and the falling edges after it
+        if pending is None:
+            self.pendingRise = None
+            keep = np.empty(0, dtype = np.int64)
+        else:
+            self.pendingRise = (riseIndexes[pending], riseTimes[pending])
+            keep = np.flatnonzero(fallIndexes > riseIndexes[pending])
+        self.pendingFallIndexes = fallIndexes[keep]
+        self.pendingFallTimes = fallTimes[keep]
+
+        if numCycles == 0:
+            return self.emptyResult()
+
+        startTimes = riseTimes[starts]
+        endTimes = riseTimes[ends]
+        periods = endTimes - startTimes
+        # First falling edge after each cycle start, there is always one
+        # before the next rising edge
+        firstFalls = np.searchsorted(fallIndexes, riseIndexes[starts], side = 'right')
+        highTimes = fallTimes[firstFalls] - startTimes
+
+        # Cycles measured with no time between edges are discarded
+        valid = periods > 0
+        periods = periods[valid]
+        return (endTimes[valid], periods, 1 / periods, highTimes[valid] / periods * 100)
+
+    def emptyResult(self):
+        empty = np.empty(0)
+        return (empty, empty, empty, empty)
+
+class ThreadPwmAnalyzer(QThread):
+    """ Runs a PwmAnalyzer in its own thread, blocks of samples are queued
+        with put() and the results are emitted with signalResult.
+    """
+    # Arrays of end times, periods, frequencies and duty cycles
+    signalResult = pyqtSignal(object, object, object, object)
+
+    def __init__(self, everyCycle = False):
+        super().__init__()
+        self.analyzer = PwmAnalyzer(everyCycle)
+        self.blocks = queue.Queue()
+
+    def put(self, times, levels):
+        """ Queue a block of samples to be analyzed """
+        self.blocks.put((times, levels))
+        if not self.isRunning():
+            self.start()
+
+    def reset(self):
+        """ Forget the samples analyzed so far """
+        self.blocks.put(None)
+
+    def run(self):
+        """ Analyze blocks until the thread is stopped """
+        while True:
+            block = self.blocks.get()
+            if block is None:
+                self.analyzer.reset()
+                continue
+            if block is False:
+                break
+            result = self.analyzer.analyze(block[0], block[1])
+            if len(result[0]):
+                self.signalResult.emit(*result)
+
+    def stop(self):
+        """ Stop the thread """
+        if self.isRunning():
+            self.blocks.put(False)
+            self.wait()
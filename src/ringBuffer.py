@@ -0,0 +1,88 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: ringBuffer.py
+    Description: Fixed capacity ring buffer of numeric samples with a zero copy
+                 view of the newest samples.
+"""
+
+import numpy as np
+
+class RingBuffer():
+    """ Preallocated ring buffer. Every sample is stored twice, capacity
+        positions apart, so the newest samples are always contiguous in
+        memory and can be returned as a view without copying them.
+    """
+
+    def __init__(self, capacity, dtype = np.float64):
+        if capacity < 1:
+            raise Exception("Invalid capacity, it should be at least 1")
+        self.capacity = capacity
+        self.data = np.zeros(2 * capacity, dtype = dtype)
+        # Index where the next sample is written, always in [0, capacity)
+        self.head = 0
+        self.count = 0
+        # Output of latestRelative, allocated on its first call
+        self.relative = None
+
+    def __len__(self):
+        return self.count
+
+    def append(self, value):
+        """ Append a single sample, the oldest one is dropped when full """
+        self.data[self.head] = value
+        self.data[self.head + self.capacity] = value
+        self.head += 1
+        if self.head == self.capacity:
+            self.head = 0
+        if self.count < self.capacity:
+            self.count += 1
+
+    def extend(self, values):
+        """ Append a block of samples """
+        values = np.asarray(values, dtype = self.data.dtype)
+        # Only the newest samples that fit matter
+        if len(values) > self.capacity:
+            values = values[-self.capacity:]
+        n = len(values)
+        if n == 0:
+            return
+
+        first = min(n, self.capacity - self.head)
+        rest = n - first
+        self.data[self.head:self.head + first] = values[:first]
+        self.data[self.head + self.capacity:self.head + self.capacity + first] = values[:first]
+        if rest:
+            self.data[:rest] = values[first:]
+            self.data[self.capacity:self.capacity + rest] = values[first:]
+        self.head = (self.head + n) % self.capacity
+        self.count = min(self.count + n, self.capacity)
+
+    def latest(self, n = None):
+        """ Return a read only view of the newest n samples (all if None),
+            oldest first.
+        """
+        if n is None or n > self.count:
+            n = self.count
+        end = self.head + self.capacity
+        view = self.data[end - n:end]
+        view.flags.writeable = False
+        return view
+
+    def latestRelative(self, n = None):
+        """ Return the newest n samples (all if None) minus the newest one.
+            They are written to a buffer allocated once, it is overwritten by
+            the next call.
+        """
+        view = self.latest(n)
+        if self.relative is None:
+            self.relative = np.empty(self.capacity, dtype = self.data.dtype)
+        out = self.relative[:len(view)]
+        if len(view):
+            np.subtract(view, view[-1], out = out)
+        return out
+
+    def clear(self):
+        """ Drop all samples, memory is kept for reuse """
+        self.head = 0
+        self.count = 0
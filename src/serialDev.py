@@ -5,18 +5,102 @@
     Description: Classes to open a serial device in a separate thread.
 """
 
+import threading
+import time
+from concurrent.futures import Future
 import serial
 import serial.tools.list_ports
 from PyQt5.QtCore import QThread, pyqtSignal
+import microProtocol
+from microProtocol import CommandPipeline
+from portWatcher import portKey
 
 class ThreadSerialDev(QThread):
     signalDataRead = pyqtSignal(bytes)
+    # Batch of lines, their estimated arrival times (time.monotonic()) and
+    # the keyword of the command each line answers (None for unsolicited)
+    signalLinesRead = pyqtSignal(list, list, list)
+    # Data written and the time it was written (time.monotonic())
+    signalDataWritten = pyqtSignal(bytes, float)
+    # Device lost (error text) and back after a reconnection (number of
+    # reconnections and seconds the device was not available)
+    signalConnectionLost = pyqtSignal(str)
+    signalReconnected = pyqtSignal(int, float)
+    # State of a connection started with connectDevice(): 'opening',
+    # 'handshake', 'info' (reading version and clk), 'ready', 'noResponse'
+    # or 'failed', the seconds since it started and a detail text
+    signalConnectState = pyqtSignal(str, float, str)
+    # Supported read modes:
+    # 'line': one readline() per loop, one byte at a time inside pyserial.
+    # 'chunk': read everything available at once and split lines locally.
+    readModes = ('line', 'chunk')
 
-    def __init__(self):
+    def __init__(self, readMode = 'chunk'):
         super().__init__()
+        if readMode not in self.readModes:
+            raise Exception(f'Invalid read mode, valid modes {self.readModes}')
         self.stopped = None
         self.serialDev = None
         self.readStandardOut = False
+        self.startReading = False
+        self.readMode = readMode
+        # Bytes received that do not form a complete line yet, they are kept
+        # across reads until its line terminator arrives.
+        self.rxBuffer = bytearray()
+        # Lines read in chunk mode are delivered in batches, a batch is
+        # flushed when it has batchMaxLines or batchInterval seconds passed
+        # since the previous flush. A line arriving after an idle period is
+        # flushed right away so single replies are not delayed.
+        self.batchInterval = 0.016
+        self.batchMaxLines = 256
+        self.batchLines = []
+        self.batchTimes = []
+        self.batchKinds = []
+        self.nextFlushTime = 0
+        # Time the previous read returned, the lines of a chunk arrived
+        # after it
+        self.lastReadTime = None
+        # Commands to write and commands waiting for their response, only the
+        # I/O thread touches the serial device while it is running. The lock
+        # guards it against direct accesses.
+        self.pipeline = CommandPipeline()
+        self.cmdTimeout = 1
+        self.lock = threading.Lock()
+        # With autoReconnect a lost device is opened again by its identity
+        # (see portWatcher.portKey), waiting between attempts from
+        # reconnectMinBackoff up to reconnectMaxBackoff seconds, and the
+        # state commands written before (microProtocol.resumeKeywords) are
+        # sent again once it answers ping.
+        self.autoReconnect = False
+        self.reconnectMinBackoff = 0.05
+        self.reconnectMaxBackoff = 0.5
+        self.reconnecting = False
+        self.reconnects = 0
+        self.downtime = 0
+        self.portParams = None
+        self.portIdentity = None
+        self.resumeCmds = {}
+        self.wakeUp = threading.Event()
+        # Set when a command is queued, it ends the wait for a batch
+        self.cmdQueued = threading.Event()
+        # Ping is retried handshakeAttempts times, the timeout of each try
+        # comes from the round trip times measured so far (smoothed like
+        # TCP does) and doubles after every try without answer
+        self.handshakeAttempts = 5
+        self.handshakeFirstTimeout = 0.2
+        self.handshakeMinTimeout = 0.05
+        self.handshakeMaxTimeout = 1.0
+        self.rtt = None
+        self.rttVar = 0
+        self.connectFuture = None
+        self.connecting = False
+
+    def setBatching(self, interval, maxLines):
+        """ Set how often batches of lines read are delivered """
+        if interval <= 0 or maxLines < 1:
+            raise Exception("Invalid batching, interval and lines must be positive")
+        self.batchInterval = interval
+        self.batchMaxLines = maxLines
 
     def listPorts(self):
         """ List all available serial ports """
@@ -24,6 +108,31 @@ class ThreadSerialDev(QThread):
 
     def open(self, port, baudrate, dataLen, parity, stopBits):
         """ Open a serial port """
+        self.setPortParams(port, baudrate, dataLen, parity, stopBits)
+        self.openDevice(port)
+        self.portIdentity = self.identityOf(port)
+
+        # One I/O thread per opened port, it lives until the port is closed
+        self.startReading = True
+        self.start()
+
+    def connectDevice(self, port, baudrate, dataLen, parity, stopBits):
+        """ Open a serial port, ping the device and read its version and
+            clock, everything from the I/O thread. Progress is emitted with
+            signalConnectState. Returns a Future resolved with a dictionary
+            of the device information, round trip time and time to ready.
+        """
+        self.setPortParams(port, baudrate, dataLen, parity, stopBits)
+        self.connectFuture = Future()
+        self.connecting = True
+        self.startReading = True
+        self.start()
+        return self.connectFuture
+
+    def setPortParams(self, port, baudrate, dataLen, parity, stopBits):
+        """ Keep the parameters of a port to open and reset the state of
+            the previous one.
+        """
         if parity.lower() == "odd":
             parity = 'O'
         elif parity.lower() == "even":
@@ -31,61 +140,432 @@ class ThreadSerialDev(QThread):
         else:
             parity = 'N'
 
-        self.serialDev = serial.Serial(port,
-                                       baudrate = baudrate,
-                                       bytesize = dataLen,
-                                       parity = parity,
-                                       stopbits = stopBits,
-                                       timeout = 1
-                                       )
+        self.portParams = (port, baudrate, dataLen, parity, stopBits)
+        self.rxBuffer.clear()
+        self.lastReadTime = None
+        self.pipeline = CommandPipeline(self.pipeline.window, self.pipeline.quietTime)
+        self.portIdentity = None
+        self.resumeCmds = {}
+        self.reconnecting = False
+        self.reconnects = 0
+        self.downtime = 0
+        self.wakeUp.clear()
+
+    def identityOf(self, port):
+        """ Return the identity of a listed port, None if not listed """
+        for info in serial.tools.list_ports.comports():
+            if info.device == port:
+                return portKey(info)
+        return None
+
+    def openDevice(self, port):
+        """ Open the serial device with the parameters of open() """
+        _, baudrate, dataLen, parity, stopBits = self.portParams
+        # serial_for_url accepts plain port names as well as pyserial URLs
+        # (loop://, socket://, ...)
+        self.serialDev = serial.serial_for_url(port,
+                                               baudrate = baudrate,
+                                               bytesize = dataLen,
+                                               parity = parity,
+                                               stopbits = stopBits,
+                                               timeout = 1
+                                               )
+
+    def setAutoReconnect(self, enabled):
+        """ Enable or disable reopening the device when it is lost """
+        self.autoReconnect = enabled
 
     def write(self, str, enableRead = True):
-        """ Write to the serial port. Enable reading is to read the response
-            after the write.
+        """ Queue data to be written to the serial port by the I/O thread.
+            Responses are always read, enableRead is kept for compatibility.
         """
-        if self.serialDev is not None and self.serialDev.is_open:
-            try:
-                data = str.encode()
-                print(f'SERIAL: {data}')
-                self.serialDev.write(data)
-            except Exception as e:
-                print(f'Error: {e}')
-                self.close()
-        else:
+        self.queueCommand(str, self.cmdTimeout, False)
+
+    def request(self, str, timeout = 1):
+        """ Queue a command and return a Future resolved with the lines of
+            its response, or with TimeoutError.
+        """
+        return self.queueCommand(str, timeout, True)
+
+    def queueCommand(self, str, timeout, withFuture):
+        """ Queue a command in the pipeline and wake up the I/O thread """
+        if self.reconnecting:
+            raise serial.SerialException("Serial device lost, reconnecting")
+        if self.connecting:
+            raise serial.SerialException("Serial device connecting")
+        if self.serialDev is None or not self.serialDev.is_open:
             raise serial.SerialException("Serial device not opened")
+        # Nothing writes or expires the commands once the I/O thread ended
+        if not self.startReading or not self.isRunning():
+            raise serial.SerialException("Serial device I/O thread stopped")
+
+        future = self.pipeline.submit(str.encode(), timeout, withFuture)
+        if not self.startReading:
+            # The thread ended while the command was queued
+            self.pipeline.cancelAll(serial.SerialException("Serial device I/O thread stopped"))
+        # Wake up the I/O thread if it is waiting for data to read or for
+        # the next batch
+        self.cmdQueued.set()
+        cancelRead = getattr(self.serialDev, 'cancel_read', None)
+        if cancelRead is not None:
+            cancelRead()
+        return future
+
+    def setPipelineWindow(self, window):
+        """ Set how many commands can wait for their response at once """
+        self.pipeline.setWindow(window)
 
-        # Read response is read continuously in the thread run function
-        # until is disabled
-        if enableRead:
-            self.startReading = True
-            self.start()
+    def writePending(self):
+        """ Write the commands that can be sent and expire old ones """
+        now = time.monotonic()
+        self.pipeline.expire(now)
+        for cmd in self.pipeline.takeReady(now):
+            self.serialDev.write(cmd.data)
+            self.signalDataWritten.emit(cmd.data, now)
+            # State to set again after a reconnection
+            if cmd.keyword in microProtocol.resumeKeywords:
+                self.resumeCmds[cmd.keyword] = cmd.data
+            elif cmd.keyword in microProtocol.resumeCancels:
+                self.resumeCmds.pop(microProtocol.resumeCancels[cmd.keyword], None)
 
     def run(self):
-        """ Run thread responsable to read any response from the
-            microcontroller
+        """ Run thread responsable to write commands and read any response
+            from the microcontroller
         """
-        while(self.startReading):
-            self.readResponseSync()
+        error = serial.SerialException("Serial device closed")
+        try:
+            if self.connecting and not self.connectSteps():
+                return
+            while(self.startReading):
+                try:
+                    self.serve()
+                except (serial.SerialException, OSError) as e:
+                    if not self.startReading or not self.autoReconnect:
+                        raise
+                    self.reconnect(e)
+            # Data queued right before closing (e.g. stop monitoring)
+            if not self.reconnecting:
+                with self.lock:
+                    self.writePending()
+        except Exception as e:
+            print(f'Error: {e}')
+            error = e
+        finally:
+            # Commands left would never be answered nor expire
+            self.startReading = False
+            self.pipeline.cancelAll(error)
+
+    def connectSteps(self):
+        """ Open the device, ping it and read its version and clock.
+            Returns False if the device could not be opened.
+        """
+        start = time.monotonic()
+        future = self.connectFuture
+        port = self.portParams[0]
+        self.signalConnectState.emit('opening', 0, port)
+        try:
+            self.openDevice(port)
+            self.portIdentity = self.identityOf(port)
+            self.connecting = False
+            self.signalConnectState.emit('handshake', time.monotonic() - start, '')
+            answered = self.handshake(self.handshakeAttempts)
+        except Exception as e:
+            self.closeDevice()
+            self.startReading = False
+            self.connecting = False
+            self.signalConnectState.emit('failed', time.monotonic() - start, str(e))
+            future.set_exception(e)
+            return False
+        if not self.startReading:
+            # Closed while connecting
+            return False
+        if not answered:
+            # The port stays open, like a port opened with open()
+            self.signalConnectState.emit('noResponse', time.monotonic() - start, '')
+            future.set_exception(TimeoutError("No response to ping"))
+            return True
+
+        self.signalConnectState.emit('info', time.monotonic() - start, f'{self.rtt * 1000:.1f} ms')
+        timeout = self.pingTimeout() * 2
+        version = self.pipeline.submit(microProtocol.cmds['version'].encode(), timeout)
+        clk = self.pipeline.submit(microProtocol.cmds['clk'].encode(), timeout)
+
+        def firstLine(reply):
+            if reply.exception() is not None or not reply.result():
+                return None
+            return reply.result()[0]
+
+        def ready(reply):
+            # Responses are in order, version is done when clk is
+            elapsed = time.monotonic() - start
+            info = {'version': firstLine(version), 'clk': firstLine(clk),
+                    'rtt': self.rtt, 'timeToReady': elapsed}
+            self.signalConnectState.emit('ready', elapsed, f'{self.rtt * 1000:.1f} ms')
+            if not future.done():
+                future.set_result(info)
+        clk.add_done_callback(ready)
+        return True
+
+    def serve(self):
+        """ Write commands and read responses until the port is closed """
+        if self.readMode == 'chunk':
+            while(self.startReading):
+                # Cleared before writing so a command queued from now on
+                # ends the wait below
+                self.cmdQueued.clear()
+                with self.lock:
+                    self.writePending()
+                    wait = self.readResponseBatch()
+                if wait:
+                    self.cmdQueued.wait(wait)
+            self.flushBatch()
+        else:
+            while(self.startReading):
+                with self.lock:
+                    self.writePending()
+                    line = self.readLine(self.batchInterval)
+                if line:
+                    self.signalDataRead.emit(line)
+
+    def reconnect(self, error):
+        """ Open the device again after it was lost, until it answers ping
+            or the port is closed. The state set before is restored.
+        """
+        lostTime = time.monotonic()
+        print(f'Error: {error}, reconnecting')
+        self.reconnecting = True
+        self.flushBatch()
+        self.pipeline.cancelAll(serial.SerialException(f'Serial device lost: {error}'))
+        self.closeDevice()
+        self.signalConnectionLost.emit(str(error))
+
+        backoff = self.reconnectMinBackoff
+        while self.startReading:
+            # close() wakes the thread up
+            if self.wakeUp.wait(backoff):
+                break
+            backoff = min(backoff * 2, self.reconnectMaxBackoff)
+            port = self.findDevice()
+            if port is None:
+                continue
+            try:
+                self.openDevice(port)
+                if self.handshake(1):
+                    break
+            except (serial.SerialException, OSError):
+                pass
+            self.closeDevice()
+        if not self.startReading:
+            return
+
+        self.rxBuffer.clear()
+        self.lastReadTime = None
+        self.reconnecting = False
+        downtime = time.monotonic() - lostTime
+        self.reconnects += 1
+        self.downtime += downtime
+        for keyword in microProtocol.resumeKeywords:
+            if keyword in self.resumeCmds:
+                self.pipeline.submit(self.resumeCmds[keyword], self.cmdTimeout, False)
+        self.signalReconnected.emit(self.reconnects, downtime)
+
+    def findDevice(self):
+        """ Return the device name of the port opened first, it may change
+            when the device is plugged in again. None if it is not plugged.
+        """
+        if self.portIdentity is None:
+            # Not a listed port (URL, pseudo terminal), opened by its name
+            return self.portParams[0]
+        for info in serial.tools.list_ports.comports():
+            if portKey(info) == self.portIdentity:
+                return info.device
+        return None
+
+    def pingTimeout(self):
+        """ Return the time to wait for a ping answer """
+        if self.rtt is None:
+            return self.handshakeFirstTimeout
+        timeout = self.rtt + 4 * self.rttVar
+        return min(max(timeout, self.handshakeMinTimeout), self.handshakeMaxTimeout)
+
+    def updateRtt(self, sample):
+        """ Add a round trip time measured to the smoothed estimation """
+        if self.rtt is None:
+            self.rtt = sample
+            self.rttVar = sample / 2
+        else:
+            self.rttVar = 0.75 * self.rttVar + 0.25 * abs(self.rtt - sample)
+            self.rtt = 0.875 * self.rtt + 0.125 * sample
+
+    def handshake(self, attempts):
+        """ Check that the device answers ping, up to attempts tries """
+        timeout = self.pingTimeout()
+        for attempt in range(attempts):
+            if not self.startReading:
+                return False
+            self.serialDev.reset_input_buffer()
+            sentTime = time.monotonic()
+            self.serialDev.write(microProtocol.cmds['ping'].encode())
+            deadline = sentTime + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.setTimeout(remaining)
+                if self.serialDev.readline().strip() == b'OK':
+                    self.updateRtt(time.monotonic() - sentTime)
+                    return True
+            timeout = min(timeout * 2, self.handshakeMaxTimeout)
+        return False
+
+    def closeDevice(self):
+        """ Close the serial device ignoring errors of a lost device """
+        try:
+            if self.serialDev is not None:
+                self.serialDev.close()
+        except (serial.SerialException, OSError):
+            pass
+
+    def setTimeout(self, timeout):
+        """ Set the read timeout, the port is only reconfigured when the
+            timeout actually changes.
+        """
+        if self.serialDev.timeout != timeout:
+            self.serialDev.timeout = timeout
 
     def readResponseSync(self, timeout = 1):
-        """ Blocking call to read from serial device """
+        """ Blocking call to read the next line from serial device """
         if self.serialDev is None or not self.serialDev.is_open:
             raise serial.SerialException("Serial device not opened")
 
-        self.serialDev.timeout = timeout
-        data = self.serialDev.readline()
+        # The I/O thread is the only reader while it runs, its lines are
+        # delivered by signalLinesRead and responses by request()
+        if self.isRunning():
+            raise serial.SerialException("Serial device read by its I/O thread, use request()")
+
+        with self.lock:
+            data = self.readLine(timeout)
         if data:
             self.signalDataRead.emit(data)
             return data
         return b''
 
+    def readLine(self, timeout):
+        """ Read a line from the serial device """
+        self.setTimeout(timeout)
+        data = self.serialDev.readline()
+        if data:
+            self.pipeline.feedLine(data)
+        return data
+
+    def readResponseChunk(self, timeout = 1):
+        """ Read all bytes available in the serial device and return every
+            complete line with its estimated arrival time and the keyword of
+            the command it answers. Blocks up to timeout only when nothing is
+            pending.
+        """
+        if self.serialDev is None or not self.serialDev.is_open:
+            raise serial.SerialException("Serial device not opened")
+
+        self.setTimeout(timeout)
+        chunk = self.serialDev.read(self.serialDev.in_waiting or 1)
+        readTime = time.monotonic()
+        lastReadTime = self.lastReadTime
+        self.lastReadTime = readTime
+        lines = self.splitLines(chunk)
+        if not lines:
+            return (lines, [], [])
+        kinds = [None] * len(lines)
+        for i, line in enumerate(lines):
+            cmd = self.pipeline.feedLine(line, readTime)
+            if cmd is not None:
+                kinds[i] = cmd.keyword
+
+        # All lines of a chunk are read at once, their arrival times are
+        # estimated backwards from the read time at wire speed (10 bits per
+        # byte) so samples of a burst are not stamped with the same time.
+        # USB CDC, pseudo terminals and sockets are not paced by the baud
+        # rate, the chunk arrived after the previous read returned so it is
+        # never spread over more than the time since.
+        byteTime = 10 / self.serialDev.baudrate
+        if lastReadTime is not None:
+            byteTime = min(byteTime, (readTime - lastReadTime) / len(chunk))
+        stamp = readTime - len(self.rxBuffer) * byteTime
+        stamps = [0] * len(lines)
+        for i in range(len(lines) - 1, -1, -1):
+            stamps[i] = stamp
+            stamp -= len(lines[i]) * byteTime
+        return (lines, stamps, kinds)
+
+    def readResponseBatch(self):
+        """ Read available lines and deliver them in rate limited batches.
+            Returns the seconds to wait before reading again, 0 to read
+            right away.
+        """
+        lines, stamps, kinds = self.readResponseChunk(timeout = self.batchInterval)
+        if lines:
+            self.batchLines += lines
+            self.batchTimes += stamps
+            self.batchKinds += kinds
+        if self.batchLines:
+            now = time.monotonic()
+            if (now >= self.nextFlushTime or
+                len(self.batchLines) >= self.batchMaxLines):
+                self.flushBatch(now)
+            elif self.pipeline.isIdle():
+                # While lines keep arriving the bytes wait in the driver
+                # buffer until the batch is due, so the thread wakes once per
+                # batch instead of once per line. Many boards streaming at
+                # once would otherwise starve the GUI thread of the GIL.
+                # The wait is out of the lock and ends when a command is
+                # queued, responses are read as soon as they arrive.
+                return self.nextFlushTime - now
+        return 0
+
+    def flushBatch(self, now = None):
+        """ Emit the lines batched so far """
+        if not self.batchLines:
+            return
+        self.signalLinesRead.emit(self.batchLines, self.batchTimes, self.batchKinds)
+        self.batchLines = []
+        self.batchTimes = []
+        self.batchKinds = []
+        if now is None:
+            now = time.monotonic()
+        self.nextFlushTime = now + self.batchInterval
+
+    def splitLines(self, chunk):
+        """ Append a chunk of bytes to the receive buffer and return the
+            complete lines found, line terminators included.
+        """
+        if not chunk:
+            return []
+        self.rxBuffer += chunk
+        end = self.rxBuffer.rfind(b'\n')
+        if end < 0:
+            return []
+        block = bytes(self.rxBuffer[:end + 1])
+        del self.rxBuffer[:end + 1]
+        # Same line boundaries as readline(), only '\n' ends a line
+        return [line + b'\n' for line in block.split(b'\n')[:-1]]
+
     def close(self):
         """ Close the serial port """
         # Close any on going read
         self.startReading = False
+        self.wakeUp.set()
+        self.cmdQueued.set()
         if self.isRunning():
             print("Waiting for thread to finish\n")
+            cancelRead = getattr(self.serialDev, 'cancel_read', None)
+            if cancelRead is not None:
+                cancelRead()
             self.wait()
+        self.reconnecting = False
+        self.connecting = False
+        if self.connectFuture is not None and not self.connectFuture.done():
+            self.connectFuture.set_exception(serial.SerialException("Serial device closed"))
+        self.pipeline.cancelAll(serial.SerialException("Serial device closed"))
 
         # Close serial port
         if self.serialDev is not None and self.serialDev.is_open:
@@ -96,11 +576,19 @@ class ThreadSerialDev(QThread):
     def stop(self):
         """ Stop the serial thread """
         self.startReading = False
+        self.cmdQueued.set()
+        cancelRead = getattr(self.serialDev, 'cancel_read', None)
+        if cancelRead is not None:
+            cancelRead()
         self.wait()
         print("debug: process stopped\n")
 
     def isOpen(self):
-        """ Check if the serial device is opened """
+        """ Check if the serial device is opened, a device being
+            reconnected is still open.
+        """
+        if self.reconnecting or self.connecting:
+            return True
         if self.serialDev is not None:
             return self.serialDev.is_open
         return False
@@ -0,0 +1,254 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: sessionLog.py
+    Description: Session recorder, every line sent to or received from the
+                 microcontroller is written with a timestamp to log files in
+                 a background thread. Files are rotated by size or age and
+                 can be compressed with gzip or zstd (zstandard module).
+"""
+
+import gzip
+import os
+import shutil
+import threading
+import time
+from collections import deque
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class SessionRecorder():
+    """ Buffers recorded lines in memory and writes them in bulk from a
+        background thread. A session is a sequence of segment files named
+        session-<date>-<time>-<segment>.log[.gz|.zst] in logDir.
+    """
+    compressions = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+    # Most lines formatted before they are written
+    maxBlockLines = 10000
+    # Most seconds flush() waits for the writer thread
+    flushTimeout = 10
+
+    def __init__(self, logDir, maxBytes = 16 * 1024 * 1024, maxSeconds = 3600,
+                 compression = 'none', flushInterval = 0.5):
+        if compression not in self.compressions:
+            raise Exception(f'Invalid compression, valid values {list(self.compressions)}')
+        if compression == 'zstd' and zstandard is None:
+            raise Exception("zstd compression needs the zstandard module")
+        self.logDir = logDir
+        # A new segment is started after maxBytes of text or maxSeconds
+        self.maxBytes = maxBytes
+        self.maxSeconds = maxSeconds
+        self.compression = compression
+        # Seconds between writes of the buffered lines
+        self.flushInterval = flushInterval
+
+        self.entries = deque()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopped = True
+        self.sessionName = None
+        self.segments = []
+        self.file = None
+        self.rawFile = None
+        self.segmentBytes = 0
+        self.segmentStartTime = 0
+        self.recordedLines = 0
+        # Exception that stopped the writer thread, nothing is recorded after
+        self.error = None
+        # Events of the flush() calls waiting
+        self.flushWaiters = []
+        self.prefixSecond = None
+        self.prefix = ''
+        # Offset to convert time.monotonic() stamps to wall clock time
+        self.clockOffset = time.time() - time.monotonic()
+
+    def start(self):
+        """ Start a new session """
+        if not self.stopped:
+            return
+        os.makedirs(self.logDir, exist_ok = True)
+        self.sessionName = time.strftime('session-%Y%m%d-%H%M%S')
+        self.segments = []
+        self.recordedLines = 0
+        self.error = None
+        self.stopped = False
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+
+    def stop(self):
+        """ Write everything recorded and close the session """
+        if self.stopped:
+            return
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join()
+
+    def record(self, direction, text, stamp = None):
+        """ Record a text, direction is a short tag like 'rx' or 'tx' and
+            stamp a time.monotonic() time (now if None).
+        """
+        if stamp is None:
+            stamp = time.monotonic()
+        self.recordLines(direction, [text], [stamp])
+
+    def recordLines(self, direction, lines, stamps):
+        """ Record a batch of lines (str or bytes) with their time.monotonic()
+            stamps
+        """
+        if self.stopped or self.error is not None or not lines:
+            return
+        # Only a reference to the batch is kept, lines are formatted in
+        # the writer thread
+        self.entries.append((direction, lines, stamps))
+        self.recordedLines += len(lines)
+
+    def flush(self, rotate = False):
+        """ Wait until everything recorded so far is in the files. With
+            rotate, the current segment is also closed.
+        """
+        if self.stopped:
+            return
+        self.checkWriter()
+        done = threading.Event()
+        self.flushWaiters.append(done)
+        self.entries.append(('rotate' if rotate else 'flush', done))
+        with self.condition:
+            self.condition.notify()
+        try:
+            # An error right before the request was queued leaves it unseen
+            answered = done.wait(self.flushTimeout)
+        finally:
+            self.flushWaiters.remove(done)
+        self.checkWriter()
+        if not answered:
+            raise Exception("Session log writer not responding")
+
+    def checkWriter(self):
+        """ Raise the error that stopped the writer thread, if any """
+        if self.error is not None:
+            raise Exception(f'Session log writer stopped: {self.error}')
+        if not self.thread.is_alive():
+            raise Exception("Session log writer stopped")
+
+    def segmentPaths(self):
+        """ Return the files of the session, oldest first """
+        return list(self.segments)
+
+    def saveTo(self, fileName):
+        """ Copy the session to fileName. Compressed segments are closed
+            first so the copy is a valid compressed file, the content of
+            several segments is concatenated.
+        """
+        if self.recordedLines == 0:
+            raise Exception("No log to save")
+        self.flush(rotate = self.compression != 'none')
+        segments = self.segmentPaths()
+        if len(segments) == 1:
+            shutil.copyfile(segments[0], fileName)
+            return
+        # Concatenated gzip members and zstd frames are valid files too
+        with open(fileName, 'wb') as output:
+            for segment in segments:
+                with open(segment, 'rb') as input:
+                    shutil.copyfileobj(input, output, 1024 * 1024)
+
+    def run(self):
+        """ Write the recorded lines every flushInterval """
+        try:
+            while True:
+                with self.condition:
+                    if not self.stopped and not self.entries:
+                        self.condition.wait(self.flushInterval)
+                    stopped = self.stopped
+                self.writeEntries()
+                if stopped:
+                    break
+            self.closeSegment()
+        except Exception as e:
+            # e.g. disk full, flush() reports it to its callers
+            print(f'Error: {e}')
+            self.error = e
+            try:
+                self.closeSegment()
+            except Exception:
+                pass
+            # Wake up the callers of flush() waiting
+            self.entries.clear()
+            for done in list(self.flushWaiters):
+                done.set()
+
+    def writeEntries(self):
+        """ Format and write all entries recorded in one block """
+        block = []
+        while self.entries:
+            entry = self.entries.popleft()
+            if len(entry) == 2:
+                # Flush or rotate request, lines recorded before are written
+                self.writeBlock(block)
+                block = []
+                if self.file is not None:
+                    self.file.flush()
+                if entry[0] == 'rotate':
+                    self.closeSegment()
+                entry[1].set()
+                continue
+            direction, lines, stamps = entry
+            for line, stamp in zip(lines, stamps):
+                if isinstance(line, bytes):
+                    line = line.decode('utf-8', 'replace')
+                wallTime = stamp + self.clockOffset
+                # Date and time are formatted once per second
+                second = int(wallTime)
+                if second != self.prefixSecond:
+                    self.prefixSecond = second
+                    self.prefix = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+                block.append(f'{self.prefix}.{int((wallTime - second) * 1000):03} '
+                             f'{direction} {line.rstrip()}\n')
+            # Big backlogs are written in several blocks so segments are
+            # rotated close to maxBytes
+            if len(block) >= self.maxBlockLines:
+                self.writeBlock(block)
+                block = []
+        self.writeBlock(block)
+
+    def writeBlock(self, block):
+        if not block:
+            return
+        data = ''.join(block).encode('utf-8', 'replace')
+        if (self.file is not None and
+            (self.segmentBytes >= self.maxBytes or
+             time.monotonic() - self.segmentStartTime >= self.maxSeconds)):
+            self.closeSegment()
+        if self.file is None:
+            self.openSegment()
+        self.file.write(data)
+        self.segmentBytes += len(data)
+
+    def openSegment(self):
+        """ Start a new segment file """
+        path = os.path.join(self.logDir, f'{self.sessionName}-{len(self.segments) + 1:03}.log'
+                                         f'{self.compressions[self.compression]}')
+        self.rawFile = open(path, 'wb', buffering = 256 * 1024)
+        if self.compression == 'gzip':
+            self.file = gzip.GzipFile(fileobj = self.rawFile, mode = 'wb', compresslevel = 6)
+        elif self.compression == 'zstd':
+            self.file = zstandard.ZstdCompressor().stream_writer(self.rawFile)
+        else:
+            self.file = self.rawFile
+        self.segments.append(path)
+        self.segmentBytes = 0
+        self.segmentStartTime = time.monotonic()
+
+    def closeSegment(self):
+        """ Close the current segment file """
+        if self.file is None:
+            return
+        if self.file is not self.rawFile:
+            self.file.close()
+        self.rawFile.close()
+        self.file = None
+        self.rawFile = None
@@ -0,0 +1,253 @@
+"""
+    Author: Aaron Escoboza
+    Github: https://github.com/aaron-ev
+    File name: startupTrace.py
+    Description: Opt-in trace of the start up of the GUI. The wall time of
+                 each init phase, icon load and module import is recorded
+                 together with the time to the window shown and to the first
+                 board connected. The result is written as a timeline in the
+                 Chrome trace format (chrome://tracing, ui.perfetto.dev) and
+                 as a JSON summary.
+
+                 Enabled with the environment variable GUICLI_STARTUP_TRACE
+                 (the prefix of the files written, 1 for 'startup') or the
+                 --startup-trace flag. GUICLI_STARTUP_BUDGET_MS sets the
+                 time to the window shown the summary is checked against.
+"""
+
+import contextlib
+import functools
+import importlib.abc
+import json
+import os
+import sys
+import threading
+import time
+
+envVar = 'GUICLI_STARTUP_TRACE'
+budgetEnvVar = 'GUICLI_STARTUP_BUDGET_MS'
+flag = '--startup-trace'
+defaultPrefix = 'startup'
+
+class TimedLoader():
+    """ Loader of a module that records the time its code takes to run,
+        everything else is done by the original loader.
+    """
+
+    def __init__(self, loader, name, trace):
+        self.loader = loader
+        self.name = name
+        self.trace = trace
+
+    def __getattr__(self, attr):
+        return getattr(self.loader, attr)
+
+    def create_module(self, spec):
+        # Extension modules do most of their work here
+        with self.trace.phase(self.name, 'import'):
+            return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        with self.trace.phase(self.name, 'import'):
+            self.loader.exec_module(module)
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    """ First finder of sys.meta_path, it asks the other finders for the
+        module and wraps its loader with a TimedLoader.
+    """
+
+    def __init__(self, trace):
+        self.trace = trace
+
+    def find_spec(self, name, path, target = None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = TimedLoader(spec.loader, name, self.trace)
+        return spec
+
+class StartupTrace():
+    """ Events of the start up, times are seconds since the trace started """
+
+    def __init__(self, prefix, budget = None):
+        self.prefix = prefix
+        # Most seconds to the window shown, None for no budget
+        self.budget = budget
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        # (name, category, start, duration, self time, thread)
+        self.events = []
+        # Time of the first occurrence of each mark
+        self.marks = {}
+        # Stack of the phases open in each thread, with their children time
+        self.local = threading.local()
+        self.importTimer = ImportTimer(self)
+
+    def now(self):
+        return time.perf_counter() - self.start
+
+    def installImportHook(self):
+        sys.meta_path.insert(0, self.importTimer)
+
+    def removeImportHook(self):
+        if self.importTimer in sys.meta_path:
+            sys.meta_path.remove(self.importTimer)
+
+    @contextlib.contextmanager
+    def phase(self, name, category = 'init'):
+        """ Record the time of the code run inside the with block """
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        frame = [0.0]
+        stack.append(frame)
+        start = self.now()
+        try:
+            yield
+        finally:
+            duration = self.now() - start
+            stack.pop()
+            if stack:
+                stack[-1][0] += duration
+            with self.lock:
+                self.events.append((name, category, start, duration,
+                                    duration - frame[0], threading.get_ident()))
+
+    def mark(self, name):
+        """ Record a point of the start up, only its first time is kept.
+            Returns True the first time.
+        """
+        with self.lock:
+            if name in self.marks:
+                return False
+            self.marks[name] = self.now()
+            return True
+
+    def summary(self):
+        """ Return the summary of the trace as a dictionary """
+        with self.lock:
+            events = list(self.events)
+            marks = dict(self.marks)
+        phases = {}
+        for name, category, start, duration, selfTime, thread in events:
+            if category == 'init':
+                phases[name] = phases.get(name, 0) + duration
+        icons = [event for event in events if event[1] == 'icon']
+        # Self and total time of each module, created and executed
+        imports = {}
+        for name, category, start, duration, selfTime, thread in events:
+            if category == 'import':
+                times = imports.setdefault(name, [0, 0])
+                times[0] += selfTime
+                times[1] += duration
+        slowest = sorted(imports.items(), key = lambda item: item[1][0], reverse = True)
+        summary = {
+                   'timeToWindowShown': marks.get('windowShown'),
+                   'timeToConnected': marks.get('connected'),
+                   'marks': marks,
+                   'phases': phases,
+                   'icons': {'count': len(icons),
+                             'total': sum(event[3] for event in icons)},
+                   'imports': {'count': len(imports),
+                               'total': sum(times[0] for times in imports.values()),
+                               'slowest': [{'module': name, 'self': times[0], 'total': times[1]}
+                                           for name, times in slowest[:20]]},
+                  }
+        if self.budget is not None:
+            shown = marks.get('windowShown')
+            summary['budget'] = {'windowShown': self.budget,
+                                 'ok': shown is not None and shown <= self.budget}
+        return summary
+
+    def timeline(self):
+        """ Return the events in the Chrome trace format """
+        pid = os.getpid()
+        with self.lock:
+            traceEvents = [{'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': thread,
+                            'ts': start * 1e6, 'dur': duration * 1e6}
+                           for name, category, start, duration, selfTime, thread in self.events]
+            traceEvents += [{'name': name, 'cat': 'mark', 'ph': 'i', 's': 'g', 'pid': pid,
+                             'tid': threading.main_thread().ident, 'ts': t * 1e6}
+                            for name, t in self.marks.items()]
+        return {'traceEvents': traceEvents, 'displayTimeUnit': 'ms'}
+
+    def write(self):
+        """ Write the timeline and the summary, returns the summary """
+        summary = self.summary()
+        try:
+            with open(f'{self.prefix}-trace.json', 'w') as file:
+                json.dump(self.timeline(), file)
+            with open(f'{self.prefix}-summary.json', 'w') as file:
+                json.dump(summary, file, indent = 2)
+        except OSError as e:
+            print(f'Error: {e}')
+        return summary
+
+# Trace of this process, None when not enabled
+trace = None
+
+def enable(prefix = defaultPrefix, budget = None):
+    """ Start tracing, imports are timed from now on """
+    global trace
+    if trace is None:
+        trace = StartupTrace(prefix, budget)
+        trace.installImportHook()
+    return trace
+
+def enableFromEnvironment(argv = None):
+    """ Start tracing if the environment variable or the flag is set """
+    argv = sys.argv if argv is None else argv
+    prefix = os.environ.get(envVar)
+    if flag in argv:
+        argv.remove(flag)
+        prefix = prefix or defaultPrefix
+    if not prefix:
+        return None
+    if prefix == '1':
+        prefix = defaultPrefix
+    budget = os.environ.get(budgetEnvVar)
+    return enable(prefix, float(budget) / 1000 if budget else None)
+
+def phase(name, category = 'init'):
+    """ Context manager recording a phase, it does nothing when not tracing """
+    if trace is None:
+        return contextlib.nullcontext()
+    return trace.phase(name, category)
+
+def traced(function):
+    """ Decorator recording each call of a function as an init phase """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if trace is None:
+            return function(*args, **kwargs)
+        with trace.phase(function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
+
+def mark(name):
+    """ Record a point of the start up, e.g. 'windowShown'. Returns True
+        the first time it is recorded.
+    """
+    if trace is None:
+        return False
+    return trace.mark(name)
+
+def write():
+    """ Write the trace files and print the main times """
+    if trace is None:
+        return
+    summary = trace.write()
+    shown = summary['timeToWindowShown']
+    connected = summary['timeToConnected']
+    text = f'Startup trace {trace.prefix}-trace.json: window shown in '
+    text += '-' if shown is None else f'{shown * 1000:.0f} ms'
+    text += ', connected in ' + ('-' if connected is None else f'{connected * 1000:.0f} ms')
+    if 'budget' in summary and not summary['budget']['ok']:
+        text += f' (over the budget of {trace.budget * 1000:.0f} ms)'
+    print(text)